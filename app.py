@@ -6,11 +6,32 @@ REST API to connect React calculator with PostgreSQL database.
 Provides endpoints for saving calculations, retrieving history, and managing sessions.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
+import csv
+import hmac
+import io
+import os
+import threading
+import time
 import uuid
-from datetime import datetime
-from database_helper import CalculatorDB, save_calculation, get_history, clear_history
+from functools import wraps
+from datetime import datetime, timedelta
+from database_helper import (
+    CalculatorDB, save_calculation, get_history, iter_history, get_stats,
+    save_calculation_once, purge_idempotency_keys, session_counters, purge_history
+)
+from safe_eval import PRECISION_MODES, DEFAULT_PRECISION_MODE, EvaluationError, MAX_RESULT_LENGTH
+from sweep import Sweep, SweepSummary, to_json_list, DEFAULT_CHUNK_SIZE
+from result_cache import SharedResultCache, cached_evaluate
+from purge_jobs import PurgeJob, get_purge_job, fail_orphaned_jobs
+from query_log import ORDERS, TOP_QUERIES
+import db_accounting
+import profiling
+from readiness import ReadinessCheck
+from idempotency import (
+    IdempotencyCache, request_fingerprint, DUPLICATE, MISMATCH, MAX_KEY_LENGTH, IDEMPOTENCY_TTL
+)
 import json
 
 app = Flask(__name__)
@@ -18,40 +39,210 @@ CORS(app)  # Enable CORS for React frontend
 
 # Global database instance
 db = CalculatorDB()
+db.maintain_partitions()
+
+# Purges killed by a previous restart would otherwise stay queued or running
+if db.supports_purge_jobs:
+    fail_orphaned_jobs()
+
+# Start the session counter flush on the main thread, so SIGTERM flushes it
+session_counters.start()
+
+# Result cache shared by all worker processes on this machine
+result_cache = SharedResultCache()
+
+# Readiness probes use their own connection
+readiness = ReadinessCheck(CalculatorDB())
+
+# Recent Idempotency-Key responses, so retries skip the database
+idempotency_cache = IdempotencyCache()
+
+# Database round trips each route is expected to need, by endpoint name.
+# Liveness pings are not counted; see db_accounting.
+DB_BUDGETS = {
+    'health_check': 0,
+    'liveness_check': 0,
+    'readiness_check': 0,             # The probe itself is connection upkeep
+    'save_calculation_endpoint': 3,   # Intern expression, INSERT, COMMIT
+    'evaluate_sweep': 0,
+    'get_calculation_history': 2,
+    'create_session': 2,
+    'get_session_stats': 2,
+    'get_overall_stats': 2,
+    'get_cache_stats': 0,
+    'get_db_stats': 0,
+    'get_query_stats': 0,
+}
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('CALCULATOR_ADMIN_TOKEN')
+
+# Seconds a stopping worker waits for requests in flight (under the
+# supervisor's STOP_TIMEOUT, after which it is killed)
+DRAIN_TIMEOUT = float(os.environ.get('CALCULATOR_DRAIN_TIMEOUT', '8'))
+
+@app.before_request
+def start_db_accounting():
+    """Count the database work done for this request"""
+    db_accounting.start(request.endpoint or request.path)
+
+@app.before_request
+def count_request_in_flight():
+    """Track concurrent requests for the readiness check"""
+    readiness.request_started()
+    g.in_flight = True
+
+@app.teardown_request
+def uncount_request_in_flight(error=None):
+    """Count the request as finished"""
+    if g.get('in_flight'):
+        readiness.request_finished()
+
+@app.before_request
+def start_request_profile():
+    """Sample-profile a fraction of requests"""
+    g.profiled = profiling.start_request(request.endpoint or request.path)
+
+@app.teardown_request
+def end_request_profile(error=None):
+    """Stop sampling the request's thread"""
+    if g.get('profiled'):
+        profiling.end_request()
+
+@app.after_request
+def report_db_accounting(response):
+    """Return database totals as Server-Timing and check the route's budget"""
+    accounting = db_accounting.finish()
+    if accounting is None:
+        return response
+    response.headers.add('Server-Timing', accounting.server_timing())
+    # A streamed body does its database work after this point
+    if not response.is_streamed:
+        db_accounting.check_budget(accounting, DB_BUDGETS.get(request.endpoint))
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness: the process is up and serving)"""
     return jsonify({
         'status': 'healthy',
         'message': 'Calculator API is running',
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/live', methods=['GET'])
+def liveness_check():
+    """
+    Liveness check: the worker can answer requests
+    
+    Does not touch the database, so a database outage does not get
+    healthy workers restarted.
+    """
+    return jsonify({
+        'status': 'alive',
+        'pid': os.getpid(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness check: the worker should receive traffic
+    
+    Returns 503 when the database does not answer or the worker is
+    saturated, with the measurements and reasons in the body.
+    """
+    ready, report = readiness.check()
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'ready': ready,
+        'timestamp': datetime.now().isoformat(),
+        **report
+    }), 200 if ready else 503
+
 @app.route('/api/calculate', methods=['POST'])
 def save_calculation_endpoint():
-    """Save a calculation to the database"""
+    """
+    Save a calculation to the database
+    
+    If no result is sent, the expression is evaluated on the server
+    through the shared result cache.
+    
+    With an Idempotency-Key header the calculation is saved at most once
+    per key; a retry gets the first response back with the
+    Idempotent-Replayed header set.
+    """
     try:
         data = request.get_json()
         
-        if not data or 'expression' not in data or 'result' not in data:
+        if not data or 'expression' not in data:
             return jsonify({
                 'success': False,
-                'error': 'Missing expression or result'
+                'error': 'Missing expression'
             }), 400
         
+        if not isinstance(data['expression'], str):
+            return jsonify({
+                'success': False,
+                'error': 'Expression must be a string'
+            }), 400
+        
+        key = request.headers.get('Idempotency-Key')
+        fingerprint = None
+        if key is not None:
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return jsonify({
+                    'success': False,
+                    'error': f'Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters'
+                }), 400
+            fingerprint = request_fingerprint(data)
+            cached = idempotency_cache.get(key)
+            if cached:
+                return idempotent_response(*cached, fingerprint)
+        
         expression = data['expression']
-        result = data['result']
         session_id = data.get('session_id', str(uuid.uuid4()))
+        precision_mode = data.get('precision_mode', DEFAULT_PRECISION_MODE)
+        
+        if precision_mode not in PRECISION_MODES:
+            return jsonify({
+                'success': False,
+                'error': f'Invalid precision_mode: {precision_mode}'
+            }), 400
+        
+        if 'result' in data:
+            result = data['result']
+            if len(str(result)) > MAX_RESULT_LENGTH:
+                return jsonify({
+                    'success': False,
+                    'error': f'result must be at most {MAX_RESULT_LENGTH} characters'
+                }), 400
+        else:
+            try:
+                result = cached_evaluate(result_cache, expression, precision_mode)
+            except ZeroDivisionError:
+                return jsonify({
+                    'success': False,
+                    'error': 'Cannot divide by zero'
+                }), 400
+            except EvaluationError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+        
+        if key is not None:
+            return save_idempotent(key, fingerprint, expression, result, session_id, precision_mode)
         
         # Save to database
-        success = save_calculation(expression, result, session_id)
+        success = save_calculation(expression, result, session_id, precision_mode)
         
         if success:
             return jsonify({
                 'success': True,
                 'message': 'Calculation saved successfully',
-                'session_id': session_id
+                'session_id': session_id,
+                'result': result
             })
         else:
             return jsonify({
@@ -65,6 +256,112 @@ def save_calculation_endpoint():
             'error': str(e)
         }), 500
 
+def idempotent_response(stored_fingerprint, response, fingerprint, replayed=True):
+    """Response for a key that has been used, or 422 if the body differs"""
+    if stored_fingerprint != fingerprint:
+        return jsonify({
+            'success': False,
+            'error': 'Idempotency-Key was already used with a different request'
+        }), 422
+    reply = jsonify(response)
+    if replayed:
+        reply.headers['Idempotent-Replayed'] = 'true'
+    return reply
+
+def save_idempotent(key, fingerprint, expression, result, session_id, precision_mode):
+    """Save a calculation at most once per Idempotency-Key"""
+    outcome = save_calculation_once(key, fingerprint, expression, result, session_id,
+                                    precision_mode)
+    if outcome is None:
+        return jsonify({
+            'success': False,
+            'error': 'Failed to save calculation'
+        }), 500
+    
+    if outcome['status'] == MISMATCH:
+        return idempotent_response(None, None, fingerprint)
+    
+    response = {
+        'success': True,
+        'message': 'Calculation saved successfully',
+        'session_id': outcome['session_id'] or session_id,
+        'result': outcome['result'] if outcome['result'] is not None else result
+    }
+    idempotency_cache.put(key, fingerprint, response)
+    
+    if idempotency_cache.purge_due():
+        before = datetime.now() - timedelta(seconds=IDEMPOTENCY_TTL)
+        threading.Thread(target=purge_idempotency_keys, args=(before,), daemon=True).start()
+    
+    return idempotent_response(fingerprint, response, fingerprint,
+                               replayed=outcome['status'] == DUPLICATE)
+
+@app.route('/api/evaluate/sweep', methods=['POST'])
+def evaluate_sweep():
+    """
+    Evaluate an expression over a grid of variable values
+    
+    Request body:
+        expression: Expression using named variables, e.g. "x*1.07 - y"
+        variables: Name -> list of values or {start, stop, step|num}
+        chunk_size: Grid points per streamed chunk, at most
+                    sweep.MAX_CHUNK_SIZE (optional)
+        persist: Save a summary row to the history (optional)
+        session_id: Session for the summary row (optional)
+    
+    The response is NDJSON: one line per chunk with the variable values
+    and results, then a final line with the summary.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or 'expression' not in data or 'variables' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Missing expression or variables'
+            }), 400
+        
+        chunk_size = int(data.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        if chunk_size < 1:
+            return jsonify({
+                'success': False,
+                'error': 'chunk_size must be positive'
+            }), 400
+        
+        sweep = Sweep(data['expression'], data['variables'])
+        
+    except (EvaluationError, TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    persist = bool(data.get('persist', False))
+    session_id = data.get('session_id')
+    
+    def generate():
+        summary = SweepSummary()
+        for offset, values, result in sweep.chunks(chunk_size):
+            summary.add(result)
+            yield json.dumps({
+                'offset': offset,
+                'variables': {name: array.tolist() for name, array in values.items()},
+                'results': to_json_list(result)
+            }) + '\n'
+        
+        saved = False
+        if persist:
+            saved = save_calculation(sweep.expression, summary.as_result_text(), session_id)
+        
+        yield json.dumps({
+            'success': True,
+            'summary': summary.as_dict(),
+            'points': sweep.size,
+            'saved': saved
+        }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/history', methods=['GET'])
 def get_calculation_history():
     """Get calculation history"""
@@ -94,21 +391,138 @@ def get_calculation_history():
             'error': str(e)
         }), 500
 
+EXPORT_COLUMNS = ['id', 'expression', 'result', 'created_at', 'session_id', 'precision_mode']
+EXPORT_FLUSH_ROWS = 1000
+
+def parse_time_arg(name):
+    """Parse an optional ISO 8601 query parameter"""
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+@app.route('/api/history/export', methods=['GET'])
+def export_history():
+    """
+    Stream the full calculation history as NDJSON or CSV
+    
+    Query parameters:
+        format: ndjson (default) or csv
+        since, until: ISO 8601 time range
+        session_id: Only this session's calculations
+    
+    Rows come straight from a server-side cursor and are sent in small
+    blocks, so memory use is constant and the first bytes go out at once.
+    If the database fails part way, NDJSON exports end with an error
+    record, and both formats end without the closing chunk, so clients
+    see the transfer as incomplete rather than as a short history.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({
+            'success': False,
+            'error': 'format must be ndjson or csv'
+        }), 400
+    
+    try:
+        since = parse_time_arg('since')
+        until = parse_time_arg('until')
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'since and until must be ISO 8601 timestamps'
+        }), 400
+    session_id = request.args.get('session_id')
+    
+    def generate_ndjson():
+        lines = []
+        try:
+            for row in iter_history(since=since, until=until, session_id=session_id):
+                record = dict(zip(EXPORT_COLUMNS, row))
+                record['created_at'] = record['created_at'].isoformat()
+                lines.append(json.dumps(record))
+                if len(lines) >= EXPORT_FLUSH_ROWS:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+        except Exception:
+            lines.append(json.dumps({'error': 'Export failed before the end of the history'}))
+            yield '\n'.join(lines) + '\n'
+            raise
+        if lines:
+            yield '\n'.join(lines) + '\n'
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        pending = 1
+        for row in iter_history(since=since, until=until, session_id=session_id):
+            writer.writerow(row[:3] + (row[3].isoformat(),) + row[4:])
+            pending += 1
+            if pending >= EXPORT_FLUSH_ROWS:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            yield buffer.getvalue()
+    
+    if export_format == 'csv':
+        body, mimetype, extension = generate_csv(), 'text/csv', 'csv'
+    else:
+        body, mimetype, extension = generate_ndjson(), 'application/x-ndjson', 'ndjson'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=calculator_history.{extension}'}
+    )
+
 @app.route('/api/history/clear', methods=['POST'])
 def clear_calculation_history():
-    """Clear all calculation history"""
+    """
+    Start a background purge of calculation history
+    
+    Optional JSON body: session_id, since, until (ISO 8601) to limit the
+    purge. Returns a job id at once; progress is available from
+    /api/history/purge/<job_id>. Backends without purge jobs (SQLite)
+    delete right away and return the number of rows deleted.
+    """
     try:
-        success = clear_history()
+        data = request.get_json(silent=True) or {}
+        since = datetime.fromisoformat(data['since']) if data.get('since') else None
+        until = datetime.fromisoformat(data['until']) if data.get('until') else None
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'since and until must be ISO 8601 timestamps'
+        }), 400
+    
+    if not db.supports_purge_jobs:
+        deleted = purge_history(data.get('session_id'), since, until)
+        if deleted is None:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to clear history'
+            }), 500
+        return jsonify({
+            'success': True,
+            'message': 'History cleared',
+            'deleted_rows': deleted
+        })
+    
+    try:
+        job = PurgeJob(session_id=data.get('session_id'), since=since, until=until)
         
-        if success:
+        if job.start():
             return jsonify({
                 'success': True,
-                'message': 'History cleared successfully'
-            })
+                'message': 'History purge started',
+                'job_id': job.job_id,
+                'status_url': f'/api/history/purge/{job.job_id}'
+            }), 202
         else:
             return jsonify({
                 'success': False,
-                'error': 'Failed to clear history'
+                'error': 'Failed to start history purge'
             }), 500
             
     except Exception as e:
@@ -117,6 +531,26 @@ def clear_calculation_history():
             'error': str(e)
         }), 500
 
+@app.route('/api/history/purge/<job_id>', methods=['GET'])
+def get_purge_status(job_id):
+    """Get the progress of a history purge job"""
+    job = get_purge_job(job_id) if db.supports_purge_jobs else None
+    
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Purge job not found'
+        }), 404
+    
+    for field in ('since', 'until', 'created_at', 'updated_at'):
+        if job[field]:
+            job[field] = job[field].isoformat()
+    
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
 @app.route('/api/session', methods=['POST'])
 def create_session():
     """Create a new calculator session"""
@@ -173,38 +607,29 @@ def get_session_stats(session_id):
 def get_overall_stats():
     """Get overall calculation statistics"""
     try:
-        history = get_history(limit=1000)
+        # Aggregated in SQL over all history
+        stats = get_stats()
         
-        if not history:
+        if stats is None:
             return jsonify({
-                'success': True,
-                'stats': {
-                    'total_calculations': 0,
-                    'operations': {'+': 0, '-': 0, '*': 0, '/': 0},
-                    'date_range': None
-                }
-            })
-        
-        # Count operations
-        operations = {'+': 0, '-': 0, '*': 0, '/': 0}
-        for record in history:
-            expression = record[1]
-            for op in operations:
-                operations[op] += expression.count(op)
+                'success': False,
+                'error': 'Failed to get statistics'
+            }), 500
         
-        # Get date range
-        timestamps = [record[3] for record in history]
-        date_range = {
-            'oldest': min(timestamps).isoformat(),
-            'newest': max(timestamps).isoformat()
-        }
+        date_range = stats['date_range']
+        if date_range:
+            date_range = {
+                'oldest': date_range['oldest'].isoformat(),
+                'newest': date_range['newest'].isoformat()
+            }
         
         return jsonify({
             'success': True,
             'stats': {
-                'total_calculations': len(history),
-                'operations': operations,
-                'date_range': date_range
+                'total_calculations': stats['total_calculations'],
+                'operations': stats['operations'],
+                'date_range': date_range,
+                'results': stats['results']
             }
         })
         
@@ -214,6 +639,186 @@ def get_overall_stats():
             'error': str(e)
         }), 500
 
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get hit-rate metrics for the shared result cache and the idempotency LRU"""
+    return jsonify({
+        'success': True,
+        'stats': result_cache.stats(),
+        'idempotency': idempotency_cache.stats()
+    })
+
+@app.route('/api/db/stats', methods=['GET'])
+def get_db_stats():
+    """Get connection health metrics, including circuit breaker transitions"""
+    return jsonify({
+        'success': True,
+        'stats': db.connection_stats()
+    })
+
+def admin_required(view):
+    """Require the X-Admin-Token header to match CALCULATOR_ADMIN_TOKEN"""
+    @wraps(view)
+    def guarded(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({
+                'success': False,
+                'error': 'Admin endpoints are disabled; set CALCULATOR_ADMIN_TOKEN'
+            }), 403
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid admin token'
+            }), 401
+        return view(*args, **kwargs)
+    return guarded
+
+@app.route('/api/db/queries', methods=['GET'])
+@admin_required
+def get_query_stats():
+    """
+    Get the most expensive query shapes and recent slow queries
+    
+    Admin only: slow query entries hold SQL, parameters and plans.
+    
+    Query parameters:
+        limit: Number of query shapes (default 20)
+        order: total_ms, max_ms, mean_ms or calls (default total_ms)
+    """
+    limit = request.args.get('limit', TOP_QUERIES, type=int)
+    order = request.args.get('order', 'total_ms')
+    if order not in ORDERS:
+        return jsonify({
+            'success': False,
+            'error': f"order must be one of: {', '.join(ORDERS)}"
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'stats': db.query_stats(limit, order)
+    })
+
+@app.route('/api/admin/profile', methods=['GET'])
+@admin_required
+def get_cpu_profile():
+    """
+    Sample all threads for a while and return collapsed stacks
+    
+    Query parameters:
+        seconds: How long to sample (default 10, at most 60)
+        interval_ms: Milliseconds between samples (default 5)
+    
+    The response is a collapsed-stack file for flamegraph.pl or speedscope.
+    """
+    seconds = request.args.get('seconds', 10.0, type=float)
+    interval_ms = request.args.get('interval_ms', profiling.SAMPLE_INTERVAL * 1000, type=float)
+    if not 0 < seconds <= profiling.MAX_PROFILE_SECONDS or not 1 <= interval_ms <= 1000:
+        return jsonify({
+            'success': False,
+            'error': f'seconds must be 0-{profiling.MAX_PROFILE_SECONDS} and interval_ms 1-1000'
+        }), 400
+    
+    try:
+        profiler = profiling.profile(seconds, interval_ms / 1000)
+    except profiling.ProfilerBusy as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 409
+    
+    return Response(profiler.folded(), mimetype='text/plain', headers={
+        'Content-Disposition': 'attachment; filename=profile.folded',
+        'X-Profile-Samples': str(profiler.samples),
+    })
+
+@app.route('/api/admin/profile/requests', methods=['GET'])
+@admin_required
+def get_request_profile():
+    """
+    Collapsed stacks of continuously sampled requests, grouped by route
+    
+    Query parameters:
+        reset: Clear the samples after returning them (default false)
+    """
+    profiler = profiling.request_profiler
+    folded = profiler.folded()
+    samples = profiler.samples
+    if request.args.get('reset', '').lower() in ('1', 'true', 'yes'):
+        profiler.reset()
+    return Response(folded, mimetype='text/plain', headers={
+        'Content-Disposition': 'attachment; filename=requests.folded',
+        'X-Profile-Samples': str(samples),
+        'X-Profile-Sample-Rate': str(profiling.PROFILE_SAMPLE_RATE),
+    })
+
+def memory_args():
+    """Read the group and limit query parameters of the memory endpoints"""
+    group = request.args.get('group', 'lineno')
+    limit = request.args.get('limit', profiling.TOP_ALLOCATIONS, type=int)
+    if group not in profiling.GROUPINGS:
+        raise ValueError(f"group must be one of: {', '.join(profiling.GROUPINGS)}")
+    return group, limit
+
+@app.route('/api/admin/memory/snapshot', methods=['POST'])
+@admin_required
+def take_memory_snapshot():
+    """Start tracemalloc if needed and take a new baseline snapshot"""
+    try:
+        group, limit = memory_args()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'snapshot': profiling.memory_tracker.snapshot(group, limit)
+    })
+
+@app.route('/api/admin/memory/diff', methods=['GET'])
+@admin_required
+def get_memory_diff():
+    """
+    Compare current allocations with the baseline snapshot
+    
+    Query parameters:
+        group: lineno, filename or traceback (default lineno)
+        limit: Number of allocation sites (default 25)
+        reset: Make this snapshot the new baseline (default false)
+    """
+    try:
+        group, limit = memory_args()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    reset = request.args.get('reset', '').lower() in ('1', 'true', 'yes')
+    diff = profiling.memory_tracker.diff(group, limit, reset)
+    if diff is None:
+        return jsonify({
+            'success': False,
+            'error': 'No baseline; POST /api/admin/memory/snapshot first'
+        }), 409
+    
+    return jsonify({
+        'success': True,
+        'diff': diff
+    })
+
+@app.route('/api/admin/memory', methods=['DELETE'])
+@admin_required
+def stop_memory_tracing():
+    """Stop tracemalloc and drop the baseline"""
+    profiling.memory_tracker.stop()
+    return jsonify({
+        'success': True,
+        'message': 'Memory tracing stopped'
+    })
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -230,16 +835,75 @@ def internal_error(error):
         'error': 'Internal server error'
     }), 500
 
+def serve_worker(fd, control_port=None):
+    """
+    Serve as one worker process of the start_fullstack.py supervisor
+    
+    On SIGTERM the worker stops accepting connections, lets requests in
+    flight finish for up to DRAIN_TIMEOUT seconds, then exits normally so
+    buffered session counters are flushed.
+    
+    Args:
+        fd (int): Listening socket shared by all workers
+        control_port (int): Loopback port the supervisor probes for health
+    """
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import signal
+    import sys
+    import threading
+    
+    server = make_server('0.0.0.0', 5000, app, threaded=True, fd=fd)
+    
+    # serve_forever runs in this thread, so it is stopped from another one
+    def drain(signum, frame):
+        threading.Thread(target=server.shutdown, name="drain", daemon=True).start()
+    signal.signal(signal.SIGTERM, drain)
+    
+    if control_port:
+        # Health probes every few seconds would flood the access log
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+        
+        control = make_server('127.0.0.1', control_port, app, threaded=True,
+                              request_handler=QuietHandler)
+        threading.Thread(target=control.serve_forever, name="control-server", daemon=True).start()
+    print(f"Worker {os.getpid()} serving on {server.server_address[0]}:{server.server_address[1]}")
+    server.serve_forever()
+    
+    # No new connections are accepted; wait for the requests in flight
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while readiness.in_flight and time.monotonic() < deadline:
+        time.sleep(0.05)
+    sys.exit(0)
+
 if __name__ == '__main__':
-    print("Starting Calculator API Server...")
-    print("API Endpoints:")
-    print("  GET  /api/health - Health check")
-    print("  POST /api/calculate - Save calculation")
-    print("  GET  /api/history - Get calculation history")
-    print("  POST /api/history/clear - Clear history")
-    print("  POST /api/session - Create session")
-    print("  GET  /api/session/<id>/stats - Get session stats")
-    print("  GET  /api/stats - Get overall statistics")
-    print("\nServer starting on http://localhost:5000")
-    
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    if os.environ.get('CALCULATOR_SERVER_FD'):
+        serve_worker(int(os.environ['CALCULATOR_SERVER_FD']),
+                     int(os.environ.get('CALCULATOR_CONTROL_PORT', 0)))
+    else:
+        print("Starting Calculator API Server...")
+        print("API Endpoints:")
+        print("  GET  /api/health - Health check")
+        print("  GET  /api/live - Liveness check")
+        print("  GET  /api/ready - Readiness check (503 when not ready)")
+        print("  POST /api/calculate - Save calculation")
+        print("  POST /api/evaluate/sweep - Evaluate expression over variable ranges")
+        print("  GET  /api/history - Get calculation history")
+        print("  GET  /api/history/export - Stream full history as NDJSON or CSV")
+        print("  POST /api/history/clear - Start a background history purge")
+        print("  GET  /api/history/purge/<job_id> - Get purge progress")
+        print("  POST /api/session - Create session")
+        print("  GET  /api/session/<id>/stats - Get session stats")
+        print("  GET  /api/stats - Get overall statistics")
+        print("  GET  /api/cache/stats - Get result cache statistics")
+        print("  GET  /api/db/stats - Get database connection health metrics")
+        print("  GET  /api/db/queries - Get slow queries and most expensive query shapes (admin token)")
+        print("  GET  /api/admin/profile - Sample-profile the server (admin token)")
+        print("  GET  /api/admin/profile/requests - Get profiles of sampled requests (admin token)")
+        print("  POST /api/admin/memory/snapshot - Take a tracemalloc baseline (admin token)")
+        print("  GET  /api/admin/memory/diff - Diff allocations against the baseline (admin token)")
+        print("  DELETE /api/admin/memory - Stop tracemalloc (admin token)")
+        print("\nServer starting on http://localhost:5000")
+    
+        app.run(debug=True, host='0.0.0.0', port=5000)
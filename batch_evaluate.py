@@ -0,0 +1,212 @@
+"""
+Batch Expression Evaluator
+==========================
+
+Evaluate or re-verify large files of calculator expressions from the
+command line.
+
+Input is streamed from a JSONL file (one object with an "expression" key
+per line) or a CSV file with an "expression" column, such as an export
+of calculator_history. Records are sent in chunks to a process pool and
+results are written back in input order as soon as they are ready, so
+memory stays bounded no matter how large the file is. If a record has a
+"result" field it is compared against the recomputed value. Lines that
+are not valid JSON objects are reported as errors like expressions that
+fail to evaluate, so one bad line does not stop the run.
+
+Usage:
+    python batch_evaluate.py history.csv -o checked.jsonl --workers 8
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque, namedtuple
+from itertools import islice
+from multiprocessing import Pool
+
+from safe_eval import evaluate, format_result, EvaluationError
+
+DEFAULT_CHUNK_SIZE = 2000
+OUTPUT_FIELDS = ('value', 'error', 'matches')
+
+# An input line that could not be parsed, evaluated as an error
+InvalidRecord = namedtuple('InvalidRecord', 'line error')
+
+
+def detect_format(path, default='jsonl'):
+    """Guess the file format from its extension"""
+    if path and path != '-':
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            return 'csv'
+        if extension in ('.jsonl', '.ndjson', '.json'):
+            return 'jsonl'
+    return default
+
+
+def read_records(stream, fmt):
+    """
+    Yield input records one at a time
+
+    Args:
+        stream: Open text stream
+        fmt (str): 'jsonl' or 'csv'
+
+    Yields:
+        One parsed record (normally a dict with an 'expression' key), or an
+        InvalidRecord for a line that is not valid JSON
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    else:
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield InvalidRecord(line_number, f"Invalid JSON: {e}")
+
+
+def evaluate_record(record):
+    """Evaluate one record and attach the computed value"""
+    if isinstance(record, InvalidRecord):
+        return {'line': record.line, 'value': None, 'error': record.error}
+    if not isinstance(record, dict):
+        return {'record': record, 'value': None, 'error': "Record is not a JSON object"}
+    output = dict(record)
+    if not isinstance(record.get('expression'), str):
+        output['value'] = None
+        output['error'] = "Record has no expression string"
+        return output
+    try:
+        value = format_result(evaluate(record['expression'], isolate=False))
+        output['value'] = str(value)
+        output['error'] = None
+        if record.get('result') not in (None, ''):
+            output['matches'] = str(record['result']) == output['value']
+    except ZeroDivisionError:
+        output['value'] = None
+        output['error'] = "Cannot divide by zero"
+    except (EvaluationError, KeyError, TypeError, AttributeError) as e:
+        output['value'] = None
+        output['error'] = str(e) or "Invalid expression"
+    return output
+
+
+def evaluate_chunk(records):
+    """Evaluate a chunk of records inside a pool worker"""
+    return [evaluate_record(record) for record in records]
+
+
+def chunked(records, size):
+    """Split an iterator of records into lists of at most size records"""
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def evaluate_stream(records, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Evaluate records across a process pool, yielding results in order
+
+    At most two chunks per worker are in flight at once, which keeps
+    memory bounded while every worker stays busy.
+
+    Args:
+        records (iterable): Input records
+        workers (int): Number of worker processes (default: CPU count)
+        chunk_size (int): Records sent to a worker at a time
+
+    Yields:
+        dict: Evaluated records in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+
+    with Pool(workers) as pool:
+        pending = deque()
+        for chunk in chunked(records, chunk_size):
+            pending.append(pool.apply_async(evaluate_chunk, (chunk,)))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+class RecordWriter:
+    """Write evaluated records as JSONL or CSV"""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        self.csv_writer = None
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            if self.csv_writer is None:
+                # Columns of the first record plus every output column;
+                # input keys that only later JSONL records have are dropped
+                fieldnames = list(record) + [field for field in OUTPUT_FIELDS if field not in record]
+                self.csv_writer = csv.DictWriter(self.stream, fieldnames=fieldnames,
+                                                 extrasaction='ignore')
+                self.csv_writer.writeheader()
+            self.csv_writer.writerow(record)
+        else:
+            self.stream.write(json.dumps(record, default=str) + '\n')
+
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Evaluate a file of calculator expressions")
+    parser.add_argument('input', help="Input JSONL or CSV file, or - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="Output file (default: stdout)")
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'])
+    parser.add_argument('--output-format', choices=['jsonl', 'csv'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    input_format = args.input_format or detect_format(args.input)
+    output_format = args.output_format or detect_format(args.output, default=input_format)
+
+    source = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+
+    total = errors = mismatches = 0
+    start = time.perf_counter()
+    try:
+        writer = RecordWriter(target, output_format)
+        records = read_records(source, input_format)
+        for record in evaluate_stream(records, args.workers, args.chunk_size):
+            writer.write(record)
+            total += 1
+            if record['error']:
+                errors += 1
+            elif record.get('matches') is False:
+                mismatches += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed else 0
+    print(f"Evaluated {total} expressions in {elapsed:.2f}s ({rate:,.0f}/s) "
+          f"with {args.workers} workers", file=sys.stderr)
+    print(f"Errors: {errors}  Mismatched results: {mismatches}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""
+Precision Mode Benchmark
+========================
+
+Measures the per-expression cost of each evaluator precision mode.
+
+Usage:
+    python benchmarks/bench_precision.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from safe_eval import evaluate, PRECISION_MODES
+
+EXPRESSIONS = {
+    'integer': "1234 + 5678 * 9 - 42",
+    'decimal': "19.99 * 3 + 0.1 + 0.2",
+    'division': "(1 / 3 + 2 / 7) * 21",
+}
+
+NUMBER = 20000
+
+
+def main():
+    """Time every expression in every precision mode"""
+    print(f"{'expression':<12}" + "".join(f"{mode:>12}" for mode in PRECISION_MODES))
+    print("-" * (12 + 12 * len(PRECISION_MODES)))
+    for name, expression in EXPRESSIONS.items():
+        row = f"{name:<12}"
+        for mode in PRECISION_MODES:
+            seconds = timeit.timeit(lambda: evaluate(expression, mode=mode), number=NUMBER)
+            row += f"{seconds / NUMBER * 1e6:>10.1f}us"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
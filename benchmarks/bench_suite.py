@@ -0,0 +1,325 @@
+"""
+Benchmark Suite with Regression Gating
+======================================
+
+Times the evaluator, CalculatorDB operations and every read/write API
+route (through the Flask test client), stores the results as named
+baselines and compares runs.
+
+Each benchmark is run in several batches after a warm-up; the time per
+call of every batch is one sample. Two runs are compared per benchmark
+with a Mann-Whitney U test on those samples, and a benchmark counts as
+a regression only if the slowdown is both statistically significant
+and larger than the threshold, so ordinary noise does not fail a run.
+
+Database and API benchmarks use a throwaway SQLite database by default,
+so no server is needed; --backend postgres uses db_config.py instead.
+
+Usage:
+    python benchmarks/bench_suite.py run --save main
+    python benchmarks/bench_suite.py run --group eval db --compare main
+    python benchmarks/bench_suite.py compare main feature
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BASELINE_DIR = os.path.join(ROOT, 'benchmarks', 'baselines')
+BASELINE_VERSION = 1
+GROUPS = ('eval', 'db', 'api')
+
+REPEATS = 10
+MIN_BATCH_TIME = 0.02     # Seconds each batch should take at least
+MAX_ITERATIONS = 10000
+SEED_ROWS = 2000          # History rows created before the db and api groups
+
+SIGNIFICANCE = 0.01       # p-value below which a difference is significant
+REGRESSION_THRESHOLD = 0.05  # Median slowdown that counts as a regression
+
+
+def eval_benchmarks():
+    """Benchmarks of the expression evaluator"""
+    from safe_eval import evaluate, parse_expression
+    from result_cache import canonicalize
+
+    return {
+        'eval.simple': lambda: evaluate("2 + 3 * 4"),
+        'eval.float_chain': lambda: evaluate("19.99 * 3 + 0.1 + 0.2 - 7 / 3"),
+        'eval.decimal': lambda: evaluate("19.99 * 3 + 0.1 + 0.2", mode='decimal'),
+        'eval.fraction': lambda: evaluate("(1 / 3 + 2 / 7) * 21", mode='fraction'),
+        'eval.big_power': lambda: evaluate("2 ** 2000 % 97"),
+        'eval.parse': lambda: parse_expression("(1 + 2) * (3 - 4) / 5 ** 2"),
+        'eval.canonicalize': lambda: canonicalize("3 + 2 * (4 + 1)"),
+    }
+
+
+def seed_history(db):
+    """Fill the history so reads have realistic work to do"""
+    db.create_session('bench-session')
+    records = [(f"{i % 200} + {i % 7} * 3", str(i % 200 + (i % 7) * 3), 'bench-session', 'float',
+                datetime.now()) for i in range(SEED_ROWS)]
+    db.save_calculations(records)
+
+
+def db_benchmarks():
+    """Benchmarks of CalculatorDB operations"""
+    from database_helper import CalculatorDB
+
+    db = CalculatorDB()
+    seed_history(db)
+    counter = iter(range(10 ** 9))
+
+    # Reads run before writes so the rows they see do not depend on how
+    # many calls the write benchmarks were calibrated to
+    return {
+        'db.history_50': lambda: db.get_calculation_history(50),
+        'db.iter_history': lambda: sum(1 for _ in db.iter_history(session_id='bench-session')),
+        'db.overall_stats': lambda: db.get_overall_stats(),
+        'db.session_stats': lambda: db.get_session_stats('bench-session'),
+        'db.save_calculation': lambda: db.save_calculation("12 * 7", "84", 'bench-session'),
+        'db.create_session': lambda: db.create_session(f"bench-{next(counter)}"),
+    }
+
+
+def api_benchmarks():
+    """Benchmarks of the API routes through the Flask test client"""
+    import app as api
+
+    client = api.app.test_client()
+    seed_history(api.db)
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}")
+        response.get_data()
+
+    sweep = {'expression': "x * 1.07 - y", 'variables': {'x': [1, 2, 3, 4], 'y': [0, 1]}}
+    return {
+        'api.health': lambda: check(client.get('/api/health')),
+        'api.history': lambda: check(client.get('/api/history?limit=50')),
+        'api.export_session': lambda: check(client.get('/api/history/export?session_id=bench-session')),
+        'api.session_stats': lambda: check(client.get('/api/session/bench-session/stats')),
+        'api.stats': lambda: check(client.get('/api/stats')),
+        'api.cache_stats': lambda: check(client.get('/api/cache/stats')),
+        'api.db_stats': lambda: check(client.get('/api/db/stats')),
+        'api.sweep': lambda: check(client.post('/api/evaluate/sweep', json=sweep)),
+        'api.calculate_saved': lambda: check(client.post('/api/calculate', json={
+            'expression': "2 + 2", 'result': "4", 'session_id': 'bench-session'})),
+        'api.calculate_evaluated': lambda: check(client.post('/api/calculate', json={
+            'expression': "(1 + 2) * 3", 'session_id': 'bench-session'})),
+        'api.session_create': lambda: check(client.post('/api/session')),
+    }
+
+
+BENCHMARK_GROUPS = {'eval': eval_benchmarks, 'db': db_benchmarks, 'api': api_benchmarks}
+
+
+def measure(function, repeats=REPEATS):
+    """
+    Time a function in calibrated batches
+
+    Returns:
+        list: Seconds per call for each batch
+    """
+    iterations = 1
+    while iterations < MAX_ITERATIONS:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        if time.perf_counter() - start >= MIN_BATCH_TIME:
+            break
+        iterations *= 2
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        samples.append((time.perf_counter() - start) / iterations)
+    return samples
+
+
+def mann_whitney_p(a, b):
+    """
+    Two-sided p-value of a Mann-Whitney U test (normal approximation)
+
+    Rank-based, so one slow outlier batch cannot make a difference look
+    significant the way it can with a t-test.
+    """
+    combined = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    ranks = [0.0] * len(combined)
+    tie_term = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        tied = j - i + 1
+        tie_term += tied ** 3 - tied
+        i = j + 1
+
+    n1, n2 = len(a), len(b)
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return math.erfc(max(z, 0.0) / math.sqrt(2))
+
+
+def git_revision():
+    """Current commit, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def baseline_path(name):
+    """Path of a named baseline, or the name itself if it is a file path"""
+    if name.endswith('.json') or os.sep in name:
+        return name
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def run_benchmarks(groups, backend, name_filter=None, repeats=REPEATS):
+    """
+    Run the selected benchmark groups
+
+    Returns:
+        dict: Baseline document with metadata and samples per benchmark
+    """
+    if backend == 'sqlite':
+        # Must be set before database_helper reads db_config
+        os.environ['CALCULATOR_STORAGE'] = 'sqlite'
+        os.environ['CALCULATOR_SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    results = {}
+    for group in groups:
+        benchmarks = BENCHMARK_GROUPS[group]()
+        for name, function in benchmarks.items():
+            if name_filter and name_filter not in name:
+                continue
+            samples = measure(function, repeats)
+            results[name] = samples
+            print(f"  {name:<28}{statistics.median(samples) * 1e6:>12.1f}us")
+
+    return {
+        'version': BASELINE_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': backend,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD, significance=SIGNIFICANCE):
+    """
+    Print a comparison of two runs
+
+    Returns:
+        list: Names of benchmarks that regressed
+    """
+    print(f"Baseline {baseline.get('git_revision')} ({baseline['created_at']}) "
+          f"vs current {current.get('git_revision')} ({current['created_at']})")
+    print(f"{'benchmark':<28}{'baseline':>12}{'current':>12}{'change':>10}{'p':>10}")
+    print("-" * 72)
+
+    regressions = []
+    for name, samples in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old:
+            print(f"{name:<28}{'-':>12}{statistics.median(samples) * 1e6:>10.1f}us   (new)")
+            continue
+        old_median = statistics.median(old)
+        new_median = statistics.median(samples)
+        change = (new_median - old_median) / old_median
+        p_value = mann_whitney_p(old, samples)
+        flag = ""
+        if p_value < significance and abs(change) > threshold:
+            flag = "  REGRESSION" if change > 0 else "  improved"
+            if change > 0:
+                regressions.append(name)
+        print(f"{name:<28}{old_median * 1e6:>10.1f}us{new_median * 1e6:>10.1f}us"
+              f"{change:>+10.1%}{p_value:>10.4f}{flag}")
+
+    if baseline.get('backend') != current.get('backend'):
+        print("\nWarning: runs used different storage backends")
+    print(f"\n{len(regressions)} significant regression(s) above {threshold:.0%}")
+    return regressions
+
+
+def load_baseline(name):
+    """Load a saved baseline by name or path"""
+    with open(baseline_path(name)) as f:
+        document = json.load(f)
+    if document.get('version') != BASELINE_VERSION:
+        raise ValueError(f"Baseline {name} has unsupported version {document.get('version')}")
+    return document
+
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Calculator benchmark suite")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run benchmarks")
+    run_parser.add_argument('--group', nargs='+', choices=GROUPS, default=list(GROUPS))
+    run_parser.add_argument('--backend', choices=['sqlite', 'postgres'], default='sqlite')
+    run_parser.add_argument('--filter', help="Only run benchmarks whose name contains this")
+    run_parser.add_argument('--repeats', type=int, default=REPEATS)
+    run_parser.add_argument('--save', help="Save the results as this baseline name or path")
+    run_parser.add_argument('--compare', help="Baseline name or path to compare against")
+    run_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+
+    compare_parser = subparsers.add_parser('compare', help="Compare two saved runs")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        regressions = compare(load_baseline(args.baseline), load_baseline(args.current),
+                              args.threshold)
+        return 1 if regressions else 0
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    print(f"Running {', '.join(args.group)} benchmarks on {args.backend}...")
+    current = run_benchmarks(args.group, args.backend, args.filter, args.repeats)
+
+    if args.save:
+        path = baseline_path(args.save)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved baseline {path}")
+
+    if baseline:
+        print()
+        return 1 if compare(baseline, current, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
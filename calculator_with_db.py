@@ -23,7 +23,9 @@ import math
 import re
 import uuid
 from datetime import datetime
-from database_helper import CalculatorDB, save_calculation, get_history, clear_history
+from database_helper import get_history, clear_history
+from offline_journal import OfflineJournal
+from safe_eval import evaluate, format_result, EvaluationError, PRECISION_MODES, DEFAULT_PRECISION_MODE
 
 class EnhancedCalculatorApp:
     """
@@ -43,11 +45,14 @@ class EnhancedCalculatorApp:
         self.result = ""
         self.memory = 0
         self.is_dark_theme = False
+        self.precision_mode = DEFAULT_PRECISION_MODE
         self.session_id = str(uuid.uuid4())
         
-        # Database connection
-        self.db = CalculatorDB()
-        self.db.create_session(self.session_id)
+        # Calculations are journaled locally and saved to the database in
+        # the background, so they never wait on or are lost to the database
+        self.journal = OfflineJournal()
+        self.journal.start()
+        self.journal_state = None
         
         # Initialize GUI components
         self.setup_styles()
@@ -55,6 +60,7 @@ class EnhancedCalculatorApp:
         self.bind_keyboard_events()
         self.apply_theme()
         self.center_window()
+        self.poll_journal()
     
     def setup_styles(self):
         """Configure visual styles for buttons and display"""
@@ -181,6 +187,21 @@ class EnhancedCalculatorApp:
             pady=4
         )
         self.history_button.pack(side=tk.RIGHT, padx=(5, 0))
+        
+        # Precision mode button (cycles float -> decimal -> fraction)
+        self.precision_button = tk.Button(
+            header_frame,
+            text=self.precision_mode.capitalize(),
+            command=self.toggle_precision_mode,
+            font=('Arial', 10),
+            bg=self.current_colors['button_bg'],
+            fg=self.current_colors['button_fg'],
+            relief='raised',
+            bd=1,
+            padx=8,
+            pady=4
+        )
+        self.precision_button.pack(side=tk.RIGHT, padx=(5, 0))
     
     def create_display(self, parent):
         """Create the display area for showing expressions and results"""
@@ -374,6 +395,12 @@ class EnhancedCalculatorApp:
         self.update_all_button_styles()
         self.load_recent_history()
     
+    def toggle_precision_mode(self):
+        """Switch to the next precision mode"""
+        index = PRECISION_MODES.index(self.precision_mode)
+        self.precision_mode = PRECISION_MODES[(index + 1) % len(PRECISION_MODES)]
+        self.precision_button.configure(text=self.precision_mode.capitalize())
+    
     def update_all_button_styles(self):
         """Update styling for all buttons when theme changes"""
         for widget in self.root.winfo_children():
@@ -488,14 +515,10 @@ class EnhancedCalculatorApp:
             expression = self.current_expression.replace('×', '*').replace('÷', '/')
             
             # Evaluate the expression safely
-            result = eval(expression)
+            result = evaluate(expression, mode=self.precision_mode)
             
             # Format result
-            if isinstance(result, float):
-                if result.is_integer():
-                    result = int(result)
-                else:
-                    result = round(result, 10)  # Limit decimal places
+            result = format_result(result)
             
             self.result = result
             self.current_expression = ""
@@ -506,30 +529,44 @@ class EnhancedCalculatorApp:
             
         except ZeroDivisionError:
             self.show_error("Cannot divide by zero")
+        except EvaluationError as e:
+            self.show_error(str(e))
         except Exception as e:
             self.show_error("Invalid expression")
     
     def save_calculation_to_db(self, expression, result):
-        """Save calculation to database and update history display"""
+        """Journal calculation for the database and update history display"""
         try:
-            # Save to database
-            success = save_calculation(expression, result, self.session_id)
-            if success:
-                # Update history display
+            self.journal.append(expression, result, self.session_id, self.precision_mode)
+            if not self.journal.online:
+                # Show the new offline count; otherwise the replay refreshes it
                 self.load_recent_history()
-        except Exception as e:
-            print(f"Error saving to database: {e}")
+        except OSError as e:
+            print(f"Error journaling calculation: {e}")
+    
+    def poll_journal(self):
+        """Refresh the history display after the journal is replayed"""
+        state = (self.journal.online, self.journal.replay_passes)
+        if state != self.journal_state:
+            self.journal_state = state
+            self.load_recent_history()
+        self.root.after(500, self.poll_journal)
     
     def load_recent_history(self):
         """Load and display recent calculation history"""
         try:
-            history = get_history(limit=5)
+            # Only query the database once the journal has reached it
+            history = get_history(limit=5) if self.journal.online else None
             
             # Clear current history display
             self.history_display.configure(state='normal')
             self.history_display.delete(1.0, tk.END)
             
-            if history:
+            if history is None:
+                pending = self.journal.pending()
+                self.history_display.insert(
+                    tk.END, f"Database offline: {pending} calculation(s) saved locally")
+            elif history:
                 for record in history:
                     expression, result, timestamp = record[1], record[2], record[3]
                     time_str = timestamp.strftime("%H:%M")
@@ -646,7 +683,7 @@ class EnhancedCalculatorApp:
             if self.result:
                 self.memory += float(self.result)
             elif self.current_expression:
-                self.memory += float(eval(self.current_expression))
+                self.memory += float(evaluate(self.current_expression))
         except:
             pass
     
@@ -656,7 +693,7 @@ class EnhancedCalculatorApp:
             if self.result:
                 self.memory -= float(self.result)
             elif self.current_expression:
-                self.memory -= float(eval(self.current_expression))
+                self.memory -= float(evaluate(self.current_expression))
         except:
             pass
     
@@ -671,8 +708,8 @@ class EnhancedCalculatorApp:
     
     def __del__(self):
         """Cleanup when application closes"""
-        if hasattr(self, 'db'):
-            self.db.disconnect()
+        if hasattr(self, 'journal'):
+            self.journal.stop()
 
 
 def main():
@@ -0,0 +1,118 @@
+"""
+Circuit Breaker for Database Connections
+========================================
+
+While the database is down, every connection attempt would otherwise
+wait for a TCP or connect timeout. The breaker counts consecutive
+connection failures and, after FAILURE_THRESHOLD of them, opens: calls
+are rejected at once without contacting the server.
+
+After a backoff delay one trial connection is let through (half-open).
+If it succeeds the breaker closes again; if it fails the breaker reopens
+with the delay doubled. Delays are jittered so that many processes do
+not all retry at the same moment after an outage.
+
+States and transition counts are kept for the metrics endpoint.
+"""
+
+import random
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+FAILURE_THRESHOLD = 3
+BACKOFF_BASE = 0.5   # Seconds the breaker first stays open
+BACKOFF_MAX = 30.0   # Longest time the breaker stays open
+
+
+class CircuitBreaker:
+    """Tracks connection health and decides whether to attempt a connection"""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        """
+        Args:
+            name (str): Name shown in log messages
+            failure_threshold (int): Consecutive failures that open the breaker
+            backoff_base (float): First open delay in seconds
+            backoff_max (float): Largest open delay in seconds
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+
+        self.state = CLOSED
+        self.failures = 0
+        self.open_count = 0  # Consecutive opens, for the backoff exponent
+        self.retry_at = 0.0
+        self.changed_at = time.time()
+        self.rejected = 0
+        self.transitions = {}
+
+    def _transition(self, state):
+        """Move to a new state; the caller holds the lock"""
+        key = f"{self.state}_to_{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        print(f"{self.name} circuit breaker: {self.state} -> {state}")
+        self.state = state
+        self.changed_at = time.time()
+
+    def allow(self):
+        """
+        Decide whether a connection attempt may go ahead
+
+        Returns:
+            bool: False while the breaker is open or a trial is running
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.retry_at:
+                self._transition(HALF_OPEN)
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """Report a successful connection"""
+        with self.lock:
+            self.failures = 0
+            self.open_count = 0
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        """Report a failed connection, opening the breaker if needed"""
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** self.open_count)
+                # Equal jitter: at least half the delay, at most all of it
+                self.retry_at = time.monotonic() + random.uniform(delay / 2, delay)
+                self.open_count += 1
+                if self.state != OPEN:
+                    self._transition(OPEN)
+
+    def stats(self):
+        """
+        Current state and counters
+
+        Returns:
+            dict: state, consecutive_failures, retry_in, rejected_calls,
+                  state_changed_at and transitions
+        """
+        with self.lock:
+            retry_in = max(0.0, self.retry_at - time.monotonic()) if self.state == OPEN else 0.0
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'retry_in': round(retry_in, 3),
+                'rejected_calls': self.rejected,
+                'state_changed_at': self.changed_at,
+                'transitions': dict(self.transitions),
+            }
@@ -7,6 +7,15 @@ This script creates the necessary tables for the calculator application.
 
 import psycopg2
 from db_config import DB_CONFIG
+from purge_jobs import create_purge_jobs_table
+from idempotency import create_idempotency_table
+from history_backfill import backfill_needed
+from expression_interning import (
+    create_expressions_table, has_expression_column, migrate_history_to_interned
+)
+from history_partitions import (
+    is_partitioned, create_partitioned_table, migrate_to_partitioned, ensure_partitions
+)
 
 def create_tables():
     """Create tables for the calculator application"""
@@ -17,16 +26,48 @@ def create_tables():
         
         print("Creating tables...")
         
-        # Create calculator_history table
+        # Create expressions table holding each distinct expression once
+        create_expressions_table(cur)
+        
+        # Create calculator_history, partitioned by month on created_at
+        state = is_partitioned(cur)
+        if state is None:
+            create_partitioned_table(cur)
+        elif state is False:
+            # Add columns to tables created before they existed, then migrate
+            cur.execute("""
+                ALTER TABLE calculator_history
+                ADD COLUMN IF NOT EXISTS precision_mode VARCHAR(10) NOT NULL DEFAULT 'float',
+                ADD COLUMN IF NOT EXISTS session_id VARCHAR(100);
+            """)
+            migrated = migrate_to_partitioned(cur)
+            print(f"Migrated {migrated} rows to the partitioned calculator_history table")
+        
+        # Numeric copy of the result for SQL aggregates
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS calculator_history (
-                id SERIAL PRIMARY KEY,
-                expression VARCHAR(255) NOT NULL,
-                result VARCHAR(100) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
+            ALTER TABLE calculator_history
+            ADD COLUMN IF NOT EXISTS result_value DOUBLE PRECISION;
         """)
         
+        # Results may have up to MAX_RESULT_LENGTH characters, more than the
+        # old VARCHAR(100); changing VARCHAR to TEXT does not rewrite rows
+        cur.execute("""
+            ALTER TABLE calculator_history
+            ALTER COLUMN result TYPE TEXT;
+        """)
+        
+        if has_expression_column(cur):
+            distinct = migrate_history_to_interned(cur)
+            print(f"Moved history expressions into {distinct} interned expressions")
+        
+        created = ensure_partitions(cur)
+        if created:
+            print(f"Created partitions: {created}")
+        
+        if backfill_needed(cur):
+            print("Existing rows lack result values or operator counts; "
+                  "run: python history_backfill.py")
+        
         # Create users table
         cur.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -48,6 +89,12 @@ def create_tables():
             );
         """)
         
+        # Create purge_jobs table for background history deletion
+        create_purge_jobs_table(cur)
+        
+        # Create idempotency_keys table so client retries never save twice
+        create_idempotency_table(cur)
+        
         conn.commit()
         print("Tables created successfully!")
         
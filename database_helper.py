@@ -2,38 +2,42 @@
 Database Helper Module for Calculator Applications
 =================================================
 
-This module provides functions to interact with the PostgreSQL database
-for storing and retrieving calculator history.
+This module provides functions to interact with the database for
+storing and retrieving calculator history. Storage is delegated to the
+backend selected in db_config.py (see storage_backend.py).
 """
 
-import psycopg2
-from psycopg2 import sql
-from db_config import DB_CONFIG
-import json
+from storage_backend import create_backend
+from idempotency import SAVED
+import atexit
+import signal
+import sys
+import threading
 from datetime import datetime
 
+# Seconds between flushes of buffered session counter updates
+SESSION_FLUSH_INTERVAL = 1.0
+
 class CalculatorDB:
-    """Database operations for calculator applications"""
+    """
+    Database operations for calculator applications
     
-    def __init__(self):
-        self.conn = None
-        self.connect()
+    Operations are carried out by a storage backend; this class adds
+    the buffered session counters, which work the same on every backend.
+    """
     
-    def connect(self):
-        """Establish database connection"""
-        try:
-            self.conn = psycopg2.connect(**DB_CONFIG)
-            return True
-        except psycopg2.Error as e:
-            print(f"Database connection error: {e}")
-            return False
+    def __init__(self, backend=None):
+        """
+        Args:
+            backend (str): Storage backend name (default: STORAGE_BACKEND)
+        """
+        self.backend = create_backend(backend)
     
-    def disconnect(self):
-        """Close database connection"""
-        if self.conn:
-            self.conn.close()
+    def __getattr__(self, name):
+        # Everything not defined here is the backend's
+        return getattr(self.backend, name)
     
-    def save_calculation(self, expression, result, session_id=None):
+    def save_calculation(self, expression, result, session_id=None, precision_mode='float'):
         """
         Save a calculation to the database
         
@@ -41,137 +45,76 @@ class CalculatorDB:
             expression (str): The mathematical expression
             result (str): The calculated result
             session_id (str): Optional session identifier
+            precision_mode (str): Evaluator mode used ('float', 'decimal' or 'fraction')
         
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            if not self.conn:
-                self.connect()
-            
-            cur = self.conn.cursor()
-            
-            # Insert calculation into history
-            cur.execute("""
-                INSERT INTO calculator_history (expression, result)
-                VALUES (%s, %s)
-                RETURNING id;
-            """, (expression, result))
-            
-            calculation_id = cur.fetchone()[0]
-            
-            # Update session if provided
-            if session_id:
-                self.update_session(session_id, calculation_id)
-            
-            self.conn.commit()
-            cur.close()
-            return True
-            
-        except psycopg2.Error as e:
-            print(f"Error saving calculation: {e}")
-            if self.conn:
-                self.conn.rollback()
-            return False
+        success = self.backend.save_calculation(expression, result, session_id, precision_mode)
+        
+        # Session counters are buffered and flushed in one UPDATE per session
+        if success and session_id:
+            session_counters.record(session_id)
+        return success
     
-    def get_calculation_history(self, limit=50):
+    def save_calculations(self, records):
         """
-        Retrieve calculation history from database
+        Save many calculations in one transaction
         
         Args:
-            limit (int): Maximum number of records to return
+            records (list): (expression, result, session_id, precision_mode,
+                            created_at) tuples
         
         Returns:
-            list: List of calculation records
+            bool: True if successful, False otherwise
         """
-        try:
-            if not self.conn:
-                self.connect()
-            
-            cur = self.conn.cursor()
-            
-            cur.execute("""
-                SELECT id, expression, result, created_at
-                FROM calculator_history
-                ORDER BY created_at DESC
-                LIMIT %s;
-            """, (limit,))
-            
-            history = cur.fetchall()
-            cur.close()
-            
-            return history
-            
-        except psycopg2.Error as e:
-            print(f"Error retrieving history: {e}")
-            return []
+        success = self.backend.save_calculations(records)
+        if success:
+            for _, _, session_id, _, created_at in records:
+                if session_id:
+                    session_counters.record(session_id, created_at)
+        return success
     
-    def create_session(self, session_id):
+    def save_calculation_once(self, key, fingerprint, expression, result, session_id=None,
+                              precision_mode='float'):
         """
-        Create a new calculator session
+        Save a calculation unless its idempotency key has been used
         
         Args:
-            session_id (str): Unique session identifier
+            key (str): Idempotency key sent by the client
+            fingerprint (str): Hash of the request body
+            expression, result, session_id, precision_mode: As for save_calculation
         
         Returns:
-            bool: True if successful, False otherwise
+            dict: status ('saved', 'duplicate' or 'mismatch'), result and
+                  session_id of the stored calculation; None on error
         """
-        try:
-            if not self.conn:
-                self.connect()
-            
-            cur = self.conn.cursor()
-            
-            cur.execute("""
-                INSERT INTO calculator_sessions (session_id)
-                VALUES (%s)
-                ON CONFLICT (session_id) DO NOTHING;
-            """, (session_id,))
-            
-            self.conn.commit()
-            cur.close()
-            return True
-            
-        except psycopg2.Error as e:
-            print(f"Error creating session: {e}")
-            if self.conn:
-                self.conn.rollback()
-            return False
+        outcome = self.backend.save_calculation_once(key, fingerprint, expression, result,
+                                                     session_id, precision_mode)
+        # A duplicate was counted when it was first saved
+        if outcome and outcome['status'] == SAVED and session_id:
+            session_counters.record(session_id)
+        return outcome
     
-    def update_session(self, session_id, calculation_id=None):
+    def save_calculations_once(self, records, keys):
         """
-        Update session statistics
+        Save many calculations in one transaction, skipping used keys
         
         Args:
-            session_id (str): Session identifier
-            calculation_id (int): Optional calculation ID
+            records (list): (expression, result, session_id, precision_mode,
+                            created_at) tuples
+            keys (list): Idempotency key of each record, or None
         
         Returns:
-            bool: True if successful, False otherwise
+            list: True for each record saved, False for each duplicate;
+                  None on error
         """
-        try:
-            if not self.conn:
-                self.connect()
-            
-            cur = self.conn.cursor()
-            
-            # Update total calculations and last used timestamp
-            cur.execute("""
-                UPDATE calculator_sessions
-                SET total_calculations = total_calculations + 1,
-                    last_used = CURRENT_TIMESTAMP
-                WHERE session_id = %s;
-            """, (session_id,))
-            
-            self.conn.commit()
-            cur.close()
-            return True
-            
-        except psycopg2.Error as e:
-            print(f"Error updating session: {e}")
-            if self.conn:
-                self.conn.rollback()
-            return False
+        saved = self.backend.save_calculations_once(records, keys)
+        if saved:
+            for (_, _, session_id, _, created_at), new in zip(records, saved):
+                if new and session_id:
+                    session_counters.record(session_id, created_at)
+        return saved
     
     def get_session_stats(self, session_id):
         """
@@ -183,66 +126,166 @@ class CalculatorDB:
         Returns:
             dict: Session statistics
         """
-        try:
-            if not self.conn:
-                self.connect()
-            
-            cur = self.conn.cursor()
-            
-            cur.execute("""
-                SELECT total_calculations, created_at, last_used
-                FROM calculator_sessions
-                WHERE session_id = %s;
-            """, (session_id,))
-            
-            result = cur.fetchone()
-            cur.close()
-            
-            if result:
-                return {
-                    'total_calculations': result[0],
-                    'created_at': result[1],
-                    'last_used': result[2]
-                }
-            return None
-            
-        except psycopg2.Error as e:
-            print(f"Error getting session stats: {e}")
-            return None
+        stats = self.backend.get_session_stats(session_id)
+        if stats:
+            # Include updates that have not been flushed yet
+            pending_count, pending_last_used = session_counters.pending(session_id)
+            if pending_last_used and (stats['last_used'] is None
+                                      or pending_last_used > stats['last_used']):
+                stats['last_used'] = pending_last_used
+            stats['total_calculations'] += pending_count
+        return stats
+
+class SessionCounterBuffer:
+    """
+    Per-process buffer of session counter updates
+    
+    Every save used to run its own UPDATE on the session row, so busy
+    sessions serialized all writers on one row lock. Saves now only add
+    to this buffer, and a background thread applies the totals with one
+    aggregated UPDATE per session every SESSION_FLUSH_INTERVAL seconds.
+    Updates being written stay visible to pending() until their commit
+    succeeds, so session counts never go backwards during a flush.
+    Pending updates are flushed at exit, including on SIGTERM when the
+    buffer was started from the main thread.
+    """
     
-    def clear_history(self):
+    def __init__(self, interval=SESSION_FLUSH_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.deltas = {}
+        self.inflight = {}   # Updates taken by a flush that has not committed yet
+        self.flush_lock = threading.Lock()
+        self.db = None
+        self.thread = None
+        self.stopped = threading.Event()
+    
+    def record(self, session_id, when=None):
+        """Count one calculation for a session"""
+        when = when or datetime.now()
+        with self.lock:
+            count, last_used = self.deltas.get(session_id, (0, when))
+            self.deltas[session_id] = (count + 1, max(last_used, when))
+            if self.thread is None:
+                self.start()
+    
+    def pending(self, session_id):
         """
-        Clear all calculation history
+        Get the updates not yet written for a session
         
         Returns:
-            bool: True if successful, False otherwise
+            tuple: (calculation count, last used time or None)
         """
-        try:
-            if not self.conn:
-                self.connect()
-            
-            cur = self.conn.cursor()
-            
-            cur.execute("DELETE FROM calculator_history;")
+        with self.lock:
+            count, last_used = self.deltas.get(session_id, (0, None))
+            inflight_count, inflight_last_used = self.inflight.get(session_id, (0, None))
+        if inflight_last_used and (last_used is None or inflight_last_used > last_used):
+            last_used = inflight_last_used
+        return count + inflight_count, last_used
+    
+    def depth(self):
+        """
+        Size of the write-behind buffer
+        
+        Returns:
+            tuple: (sessions with pending updates, calculations not yet counted)
+        """
+        with self.lock:
+            sessions = self.deltas.keys() | self.inflight.keys()
+            counts = sum(count for count, _ in self.deltas.values())
+            counts += sum(count for count, _ in self.inflight.values())
+            return len(sessions), counts
+    
+    def start(self):
+        """
+        Start the flush thread and register the exit flush
+        
+        Call this from the main thread at startup: the SIGTERM handler
+        can only be installed there, and a buffer started lazily from a
+        request thread would lose its updates on SIGTERM.
+        """
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.run, name="session-counter-flush", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        
+        # Turn SIGTERM into a normal exit so the atexit flush runs
+        if (threading.current_thread() is threading.main_thread()
+                and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL):
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+    
+    def flush(self):
+        """
+        Write all buffered updates to the database
+        
+        Returns:
+            bool: True if everything was written
+        """
+        # One flush at a time: the flush thread and the exit flush share the db
+        with self.flush_lock:
+            with self.lock:
+                deltas, self.deltas = self.deltas, {}
+                self.inflight = deltas
+            if not deltas:
+                return True
             
-            self.conn.commit()
-            cur.close()
-            return True
+            if self.db is None:
+                self.db = CalculatorDB()
+            if self.db.apply_session_deltas(deltas):
+                with self.lock:
+                    self.inflight = {}
+                return True
             
-        except psycopg2.Error as e:
-            print(f"Error clearing history: {e}")
-            if self.conn:
-                self.conn.rollback()
+            # Keep the updates for the next attempt
+            with self.lock:
+                self.inflight = {}
+                for session_id, (count, last_used) in deltas.items():
+                    pending_count, pending_last_used = self.deltas.get(session_id, (0, last_used))
+                    self.deltas[session_id] = (pending_count + count, max(pending_last_used, last_used))
+            self.db.disconnect()
+            self.db = None
             return False
+    
+    def stop(self):
+        """Stop the flush thread and write what is left"""
+        self.stopped.set()
+        self.flush()
+        if self.db is not None:
+            self.db.disconnect()
+            self.db = None
+
+
+session_counters = SessionCounterBuffer()
 
 # Convenience functions for easy use
-def save_calculation(expression, result, session_id=None):
+def save_calculation(expression, result, session_id=None, precision_mode='float'):
     """Save a calculation to the database"""
     db = CalculatorDB()
-    success = db.save_calculation(expression, result, session_id)
+    success = db.save_calculation(expression, result, session_id, precision_mode)
     db.disconnect()
     return success
 
+def save_calculation_once(key, fingerprint, expression, result, session_id=None,
+                          precision_mode='float'):
+    """Save a calculation unless its idempotency key has been used"""
+    db = CalculatorDB()
+    outcome = db.save_calculation_once(key, fingerprint, expression, result, session_id,
+                                       precision_mode)
+    db.disconnect()
+    return outcome
+
+def purge_idempotency_keys(before):
+    """Delete idempotency keys claimed before a time"""
+    db = CalculatorDB()
+    deleted = db.purge_idempotency_keys(before)
+    db.disconnect()
+    return deleted
+
 def get_history(limit=50):
     """Get calculation history"""
     db = CalculatorDB()
@@ -250,9 +293,31 @@ def get_history(limit=50):
     db.disconnect()
     return history
 
+def iter_history(batch_size=2000, since=None, until=None, session_id=None):
+    """Stream calculation history using a dedicated connection"""
+    db = CalculatorDB()
+    try:
+        yield from db.iter_history(batch_size, since, until, session_id)
+    finally:
+        db.disconnect()
+
+def get_stats():
+    """Get aggregate statistics over all calculation history"""
+    db = CalculatorDB()
+    stats = db.get_overall_stats()
+    db.disconnect()
+    return stats
+
 def clear_history():
     """Clear all calculation history"""
     db = CalculatorDB()
     success = db.clear_history()
     db.disconnect()
     return success
+
+def purge_history(session_id=None, since=None, until=None):
+    """Delete the calculation history in a scope right away"""
+    db = CalculatorDB()
+    deleted = db.purge_history(session_id, since, until)
+    db.disconnect()
+    return deleted
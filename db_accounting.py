@@ -0,0 +1,200 @@
+"""
+Per-Request Database Accounting
+===============================
+
+Counts the database work done while serving one request: round trips
+(statements, commits and rollbacks), connections opened, rows returned
+and time spent waiting on the database. The PostgreSQL backend reports
+each round trip here; the API server starts an accounting at the start
+of every request and returns the totals in a Server-Timing header,
+which browser developer tools show next to the request.
+
+Routes can have a round-trip budget. A request that goes over its
+budget, or opens more than CONNECT_BUDGET connections, is handled
+according to BUDGET_MODE (env CALCULATOR_DB_BUDGET_MODE):
+
+    log    Print a warning (the default)
+    raise  Raise BudgetExceeded, so tests fail on the regression
+    off    Do not check budgets
+
+Connection upkeep (liveness pings) and shared work done on behalf of
+every request (refreshing the cached overall statistics) are counted
+separately and not held against the budget, since whether they happen
+depends on idle time rather than on the request.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+BUDGET_MODE = os.environ.get('CALCULATOR_DB_BUDGET_MODE', 'log')
+CONNECT_BUDGET = 1   # Connections a request may open
+
+_current = ContextVar('db_accounting', default=None)
+
+
+class BudgetExceeded(RuntimeError):
+    """A request made more database round trips than its budget allows"""
+
+
+class RequestAccounting:
+    """Database work done for one request"""
+
+    def __init__(self, name):
+        self.name = name
+        self.round_trips = 0
+        self.upkeep_round_trips = 0
+        self.connects = 0
+        self.rows = 0
+        self.db_ms = 0.0
+        self.connect_ms = 0.0
+        self.in_upkeep = False
+
+    def as_dict(self):
+        """Totals for logging and responses"""
+        return {
+            'round_trips': self.round_trips,
+            'upkeep_round_trips': self.upkeep_round_trips,
+            'connects': self.connects,
+            'rows': self.rows,
+            'db_ms': round(self.db_ms, 3),
+            'connect_ms': round(self.connect_ms, 3),
+        }
+
+    def server_timing(self):
+        """
+        Format the totals as a Server-Timing header value
+
+        Returns:
+            str: e.g. 'db;dur=3.2;desc="4 round trips", db-connect;dur=1.1, db-rows;desc="20"'
+        """
+        metrics = [f'db;dur={self.db_ms:.3f};desc="{self.round_trips} round trips"']
+        if self.connects:
+            metrics.append(f'db-connect;dur={self.connect_ms:.3f};desc="{self.connects} connections"')
+        if self.upkeep_round_trips:
+            metrics.append(f'db-upkeep;desc="{self.upkeep_round_trips} round trips"')
+        metrics.append(f'db-rows;desc="{self.rows}"')
+        return ", ".join(metrics)
+
+
+def start(name):
+    """
+    Begin accounting for a request in this context
+
+    Args:
+        name (str): Route or task being accounted
+
+    Returns:
+        RequestAccounting: The new accounting
+    """
+    accounting = RequestAccounting(name)
+    _current.set(accounting)
+    return accounting
+
+
+def finish():
+    """
+    Stop accounting in this context
+
+    Returns:
+        RequestAccounting: The finished accounting, or None
+    """
+    accounting = _current.get()
+    _current.set(None)
+    return accounting
+
+
+def record_round_trip(duration_ms, rows=0):
+    """Report one statement, commit or rollback sent to the database"""
+    accounting = _current.get()
+    if accounting is None:
+        return
+    if accounting.in_upkeep:
+        accounting.upkeep_round_trips += 1
+    else:
+        accounting.round_trips += 1
+    accounting.rows += rows
+    accounting.db_ms += duration_ms
+
+
+def serving_request():
+    """
+    Check whether statements run now are a request's own work
+
+    Returns:
+        bool: True inside an accounted request and outside upkeep
+    """
+    accounting = _current.get()
+    return accounting is not None and not accounting.in_upkeep
+
+
+def record_connect(duration_ms):
+    """Report a newly opened connection"""
+    accounting = _current.get()
+    if accounting is not None:
+        accounting.connects += 1
+        accounting.connect_ms += duration_ms
+
+
+@contextmanager
+def upkeep():
+    """Count round trips inside the block as connection upkeep"""
+    accounting = _current.get()
+    if accounting is None:
+        yield
+        return
+    previous = accounting.in_upkeep
+    accounting.in_upkeep = True
+    try:
+        yield
+    finally:
+        accounting.in_upkeep = previous
+
+
+def check_budget(accounting, budget, mode=None):
+    """
+    Compare a finished accounting against its budget
+
+    Args:
+        accounting (RequestAccounting): Work done by the request
+        budget (int): Round trips allowed, or None for no round-trip budget
+        mode (str): 'log', 'raise' or 'off' (default: BUDGET_MODE)
+
+    Returns:
+        bool: True if the request stayed within budget
+
+    Raises:
+        BudgetExceeded: In raise mode, if the budget was exceeded
+    """
+    mode = mode or BUDGET_MODE
+    if mode == 'off':
+        return True
+
+    problems = []
+    if budget is not None and accounting.round_trips > budget:
+        problems.append(f"{accounting.round_trips} database round trips (budget {budget})")
+    if accounting.connects > CONNECT_BUDGET:
+        problems.append(f"{accounting.connects} connections (budget {CONNECT_BUDGET})")
+    if not problems:
+        return True
+
+    message = f"{accounting.name} exceeded its database budget: {', '.join(problems)}"
+    if mode == 'raise':
+        raise BudgetExceeded(message)
+    print(f"Warning: {message}")
+    return False
+
+
+def timed(function, *args, rows=0):
+    """
+    Call a function and report it as one round trip
+
+    Returns:
+        The function's return value
+    """
+    start_time = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        record_round_trip((time.perf_counter() - start_time) * 1000, rows)
@@ -6,6 +6,8 @@ This file contains database connection settings.
 Update the password with your PostgreSQL password.
 """
 
+import os
+
 # Database connection settings
 DB_CONFIG = {
     'host': 'localhost',
@@ -17,3 +19,7 @@ DB_CONFIG = {
 
 # Connection string for easy use
 CONNECTION_STRING = f"host={DB_CONFIG['host']} port={DB_CONFIG['port']} dbname={DB_CONFIG['database']} user={DB_CONFIG['user']} password={DB_CONFIG['password']}"
+
+# Storage backend: 'postgres', or 'sqlite' for an embedded database file
+STORAGE_BACKEND = os.environ.get('CALCULATOR_STORAGE', 'postgres')
+SQLITE_PATH = os.environ.get('CALCULATOR_SQLITE_PATH', 'calculator_history.db')
@@ -0,0 +1,192 @@
+"""
+Expression Interning for Calculator History
+===========================================
+
+Most saved expressions repeat, so each distinct expression is stored
+once in the expressions table and calculator_history rows reference it
+by integer id. A per-process cache maps expression text to its id so
+repeated saves skip the lookup entirely.
+
+Operator counts are computed from the parsed expression when it is
+first interned and stored alongside it, so statistics are summed in SQL
+instead of re-scanning expression text. Counts are NULL on rows interned
+before the columns existed until history_backfill.py fills them.
+
+There is deliberately no foreign key from calculator_history to
+expressions: it would add a check to every insert and stop the bulk
+import tool from loading both tables in parallel.
+"""
+
+import ast
+import threading
+from collections import OrderedDict
+
+from safe_eval import normalize_expression
+
+INTERN_CACHE_SIZE = 100000
+
+# Count column for each binary operator; // is counted as a division
+OPERATOR_COLUMNS = {
+    ast.Add: 'add_count',
+    ast.Sub: 'sub_count',
+    ast.Mult: 'mul_count',
+    ast.Div: 'div_count',
+    ast.FloorDiv: 'div_count',
+}
+COUNT_COLUMNS = ('add_count', 'sub_count', 'mul_count', 'div_count')
+
+
+def create_expressions_table(cur):
+    """Create the table holding each distinct expression once"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS expressions (
+            id SERIAL PRIMARY KEY,
+            expression VARCHAR(255) NOT NULL UNIQUE,
+            add_count SMALLINT,
+            sub_count SMALLINT,
+            mul_count SMALLINT,
+            div_count SMALLINT
+        );
+    """)
+    # Add count columns to tables created before they existed
+    cur.execute("""
+        ALTER TABLE expressions
+        ADD COLUMN IF NOT EXISTS add_count SMALLINT,
+        ADD COLUMN IF NOT EXISTS sub_count SMALLINT,
+        ADD COLUMN IF NOT EXISTS mul_count SMALLINT,
+        ADD COLUMN IF NOT EXISTS div_count SMALLINT;
+    """)
+
+
+def count_operators(expression):
+    """
+    Count the binary operators in an expression
+
+    The expression is parsed, so a negative sign such as the one in
+    "-5 + 3" is not counted as a subtraction.
+
+    Returns:
+        tuple: (additions, subtractions, multiplications, divisions),
+               all zero if the expression does not parse
+    """
+    counts = dict.fromkeys(COUNT_COLUMNS, 0)
+    try:
+        tree = ast.parse(normalize_expression(expression), mode='eval')
+    except (SyntaxError, ValueError):
+        return tuple(counts.values())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATOR_COLUMNS:
+            counts[OPERATOR_COLUMNS[type(node.op)]] += 1
+    return tuple(counts.values())
+
+
+def has_expression_column(cur):
+    """Check whether calculator_history still stores expression text"""
+    cur.execute("""
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name = 'calculator_history'
+          AND column_name = 'expression';
+    """)
+    return cur.fetchone() is not None
+
+
+def migrate_history_to_interned(cur):
+    """
+    Move existing expression text into the expressions table
+
+    Adds calculator_history.expression_id, fills it from the distinct
+    expressions and drops the old text column. Run inside a transaction.
+
+    Returns:
+        int: Number of distinct expressions
+    """
+    cur.execute("""
+        INSERT INTO expressions (expression)
+        SELECT DISTINCT expression FROM calculator_history
+        ON CONFLICT (expression) DO NOTHING;
+    """)
+    cur.execute("ALTER TABLE calculator_history ADD COLUMN IF NOT EXISTS expression_id INTEGER;")
+    cur.execute("""
+        UPDATE calculator_history AS h
+        SET expression_id = e.id
+        FROM expressions AS e
+        WHERE e.expression = h.expression;
+    """)
+    cur.execute("ALTER TABLE calculator_history ALTER COLUMN expression_id SET NOT NULL;")
+    cur.execute("ALTER TABLE calculator_history DROP COLUMN expression;")
+    cur.execute("SELECT COUNT(*) FROM expressions;")
+    return cur.fetchone()[0]
+
+
+class ExpressionInternCache:
+    """Bounded LRU map from expression text to its id in this process"""
+
+    def __init__(self, max_size=INTERN_CACHE_SIZE):
+        self.max_size = max_size
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, expression):
+        with self.lock:
+            expression_id = self.ids.get(expression)
+            if expression_id is None:
+                self.misses += 1
+                return None
+            self.ids.move_to_end(expression)
+            self.hits += 1
+            return expression_id
+
+    def put(self, expression, expression_id):
+        with self.lock:
+            self.ids[expression] = expression_id
+            self.ids.move_to_end(expression)
+            if len(self.ids) > self.max_size:
+                self.ids.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.ids),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def intern_expression(cur, expression):
+    """
+    Get the id of an expression, inserting it if it is new
+
+    Does the lookup and the insert in a single round trip, storing the
+    operator counts with a new expression. If another
+    transaction inserts the same expression concurrently, neither branch
+    sees a row and the statement is simply run again.
+
+    Returns:
+        int: The expression id
+    """
+    counts = count_operators(expression)
+    row = None
+    while row is None:
+        cur.execute("""
+            WITH inserted AS (
+                INSERT INTO expressions (expression, add_count, sub_count, mul_count, div_count)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (expression) DO NOTHING
+                RETURNING id
+            )
+            SELECT id FROM inserted
+            UNION ALL
+            SELECT id FROM expressions WHERE expression = %s
+            LIMIT 1;
+        """, (expression, *counts, expression))
+        row = cur.fetchone()
+    return row[0]
@@ -0,0 +1,342 @@
+"""
+Calculator History Admin Tool
+=============================
+
+Bulk export and import of calculator_history, expressions and
+calculator_sessions.
+
+Data is moved with PostgreSQL COPY instead of row-by-row queries, and
+tables are moved in parallel, one connection per table. Export
+connections share one snapshot, so the exported tables are consistent
+with each other. Exports can be plain CSV, gzip-compressed CSV, or
+Parquet (requires pyarrow).
+
+Usage:
+    python history_admin.py export --dir backup --format parquet
+    python history_admin.py import --dir backup --truncate
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2 import sql
+from db_config import DB_CONFIG
+
+TABLES = ['calculator_history', 'expressions', 'calculator_sessions']
+FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet'}
+PARQUET_BATCH_ROWS = 100000
+
+
+def load_pyarrow():
+    """Import pyarrow, which is only needed for Parquet files"""
+    try:
+        import pyarrow.csv
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        print("Parquet support requires pyarrow. Run: pip install pyarrow")
+        sys.exit(1)
+
+
+def table_path(directory, table, fmt):
+    """Path of the file holding one table"""
+    return os.path.join(directory, table + FORMATS[fmt])
+
+
+def find_table_file(directory, table):
+    """Find the exported file for a table and its format"""
+    for fmt in FORMATS:
+        path = table_path(directory, table, fmt)
+        if os.path.exists(path):
+            return path, fmt
+    return None, None
+
+
+def is_partitioned_table(cur, table):
+    """Check whether a table is a partitioned parent"""
+    cur.execute("""
+        SELECT relkind = 'p' FROM pg_class
+        WHERE oid = to_regclass(%s);
+    """, (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def copy_out(cur, table, stream):
+    """COPY a whole table to a stream as CSV with a header row"""
+    # COPY cannot read a partitioned parent directly, only a query over it
+    if is_partitioned_table(cur, table):
+        source = sql.SQL("(SELECT * FROM {})").format(sql.Identifier(table))
+    else:
+        source = sql.Identifier(table)
+    cur.copy_expert(
+        sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER true)").format(source),
+        stream
+    )
+    return cur.rowcount
+
+
+def copy_in(cur, table, columns, stream):
+    """COPY CSV data with a header row from a stream into a table"""
+    cur.copy_expert(
+        sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true)").format(
+            sql.Identifier(table),
+            sql.SQL(', ').join(sql.Identifier(column) for column in columns)
+        ),
+        stream
+    )
+    return cur.rowcount
+
+
+def arrow_column_types(cur, table):
+    """Map a table's column types to Arrow types for the CSV reader"""
+    pyarrow = load_pyarrow()
+    type_map = {
+        'integer': pyarrow.int32(),
+        'bigint': pyarrow.int64(),
+        'double precision': pyarrow.float64(),
+        'timestamp without time zone': pyarrow.timestamp('us'),
+    }
+    cur.execute("""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s;
+    """, (table,))
+    return {name: type_map.get(data_type, pyarrow.string()) for name, data_type in cur.fetchall()}
+
+
+def export_table(table, directory, fmt, snapshot=None):
+    """
+    Export one table using its own connection
+
+    Args:
+        snapshot (str): Snapshot from pg_export_snapshot() to read from,
+                        so parallel exports see the same data
+
+    Returns:
+        tuple: (table, rows, path)
+    """
+    path = table_path(directory, table, fmt)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        # Repeatable read keeps one snapshot for the whole COPY
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cur = conn.cursor()
+        if snapshot:
+            cur.execute("SET TRANSACTION SNAPSHOT %s;", (snapshot,))
+
+        if fmt == 'csv':
+            with open(path, 'wb') as f:
+                rows = copy_out(cur, table, f)
+        elif fmt == 'csv.gz':
+            with gzip.open(path, 'wb', compresslevel=6) as f:
+                rows = copy_out(cur, table, f)
+        else:
+            pyarrow = load_pyarrow()
+            convert_options = pyarrow.csv.ConvertOptions(
+                column_types=arrow_column_types(cur, table),
+                quoted_strings_can_be_null=False
+            )
+            # Spool the COPY output to disk and convert it in batches
+            with tempfile.TemporaryFile() as spool:
+                rows = copy_out(cur, table, spool)
+                spool.seek(0)
+                reader = pyarrow.csv.open_csv(spool, convert_options=convert_options)
+                with pyarrow.parquet.ParquetWriter(path, reader.schema, compression='zstd') as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+
+        conn.commit()
+        cur.close()
+        return table, rows, path
+    finally:
+        conn.close()
+
+
+def export_tables(tables, directory, fmt):
+    """
+    Export tables in parallel from one shared snapshot
+
+    The snapshot is exported from a transaction held open until every
+    table is written, so history rows never refer to expressions or
+    sessions missing from the export.
+
+    Returns:
+        int: Number of tables that failed to export
+    """
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cur = conn.cursor()
+        cur.execute("SELECT pg_export_snapshot();")
+        snapshot = cur.fetchone()[0]
+        failed = run_parallel(export_table, tables, directory, fmt, snapshot)
+        conn.commit()
+        return failed
+    finally:
+        conn.close()
+
+
+def read_header(path, fmt):
+    """Read the column names of an exported file"""
+    if fmt == 'parquet':
+        pyarrow = load_pyarrow()
+        return pyarrow.parquet.ParquetFile(path).schema_arrow.names
+    opener = gzip.open if fmt == 'csv.gz' else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        return next(csv.reader(f))
+
+
+def parquet_as_csv(path):
+    """Yield a Parquet file as CSV bytes, one batch at a time"""
+    pyarrow = load_pyarrow()
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    first = True
+    for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS):
+        buffer = io.BytesIO()
+        options = pyarrow.csv.WriteOptions(include_header=first)
+        pyarrow.csv.write_csv(batch, buffer, options)
+        first = False
+        yield buffer.getvalue()
+
+
+class IterStream(io.RawIOBase):
+    """File-like wrapper that lets COPY read from an iterator of bytes"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.leftover = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.leftover:
+            try:
+                self.leftover = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.leftover))
+        buffer[:size] = self.leftover[:size]
+        self.leftover = self.leftover[size:]
+        return size
+
+
+def import_table(table, directory, truncate=False):
+    """
+    Import one table using its own connection
+
+    Returns:
+        tuple: (table, rows, path)
+    """
+    path, fmt = find_table_file(directory, table)
+    if path is None:
+        return table, 0, None
+
+    columns = read_header(path, fmt)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cur = conn.cursor()
+        if truncate:
+            cur.execute(sql.SQL("TRUNCATE {}").format(sql.Identifier(table)))
+
+        if fmt == 'parquet':
+            stream = io.BufferedReader(IterStream(parquet_as_csv(path)), buffer_size=1 << 20)
+            rows = copy_in(cur, table, columns, stream)
+        else:
+            opener = gzip.open if fmt == 'csv.gz' else open
+            with opener(path, 'rb') as f:
+                rows = copy_in(cur, table, columns, f)
+
+        # Move the id sequence past the imported ids
+        if 'id' in columns:
+            cur.execute(sql.SQL("""
+                SELECT setval(pg_get_serial_sequence(%s, 'id'),
+                              COALESCE((SELECT MAX(id) FROM {}), 0) + 1, false);
+            """).format(sql.Identifier(table)), (table,))
+
+        conn.commit()
+        cur.close()
+        return table, rows, path
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def run_parallel(function, tables, *args):
+    """
+    Run one job per table in parallel and print a summary
+
+    Returns:
+        int: Number of table jobs that failed
+    """
+    start = time.perf_counter()
+    total = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+        futures = [executor.submit(function, table, *args) for table in tables]
+        for future in futures:
+            try:
+                table, rows, path = future.result()
+            except (psycopg2.Error, OSError) as e:
+                print(f"Error: {e}")
+                failed += 1
+                continue
+            if path is None:
+                print(f"  {table}: no file found, skipped")
+                continue
+            total += rows
+            print(f"  {table}: {rows} rows ({path})")
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed else 0
+    print(f"Total: {total} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    if failed:
+        print(f"{failed} of {len(tables)} tables failed")
+    return failed
+
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Bulk export and import calculator history")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Export tables with COPY TO")
+    export_parser.add_argument('--dir', default='history_export')
+    export_parser.add_argument('--format', choices=list(FORMATS), default='csv.gz')
+    export_parser.add_argument('--tables', nargs='+', choices=TABLES, default=TABLES)
+
+    import_parser = subparsers.add_parser('import', help="Import tables with COPY FROM")
+    import_parser.add_argument('--dir', default='history_export')
+    import_parser.add_argument('--tables', nargs='+', choices=TABLES, default=TABLES)
+    import_parser.add_argument('--truncate', action='store_true',
+                               help="Empty each table before loading it")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        os.makedirs(args.dir, exist_ok=True)
+        print(f"Exporting {', '.join(args.tables)} to {args.dir} as {args.format}...")
+        try:
+            failed = export_tables(args.tables, args.dir, args.format)
+        except psycopg2.Error as e:
+            print(f"Error: {e}")
+            return 1
+    else:
+        print(f"Importing {', '.join(args.tables)} from {args.dir}...")
+        failed = run_parallel(import_table, args.tables, args.dir, args.truncate)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
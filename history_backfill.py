@@ -0,0 +1,156 @@
+"""
+Backfill Precomputed History Columns
+====================================
+
+New calculations store calculator_history.result_value and the operator
+counts on their expression when they are saved. This job fills the same
+columns for rows written before those columns existed.
+
+Rows are processed in small batches in primary-key order, committing
+and pausing between batches, so the job can run while the API is
+serving requests. It only touches rows that are still NULL, so it can be
+stopped and re-run at any time:
+    python history_backfill.py --batch-size 5000
+"""
+
+import argparse
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+from db_config import DB_CONFIG
+from expression_interning import count_operators
+from safe_eval import result_value
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_PAUSE = 0.05  # Seconds between batches
+
+
+def backfill_needed(cur):
+    """Check whether any rows are still missing precomputed values"""
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM expressions WHERE add_count IS NULL)
+            OR EXISTS (SELECT 1 FROM calculator_history
+                       WHERE result_value IS NULL AND result ~ '^\\s*-?[0-9.]');
+    """)
+    return cur.fetchone()[0]
+
+
+def backfill_operator_counts(conn, batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE):
+    """
+    Compute operator counts for expressions that do not have them
+
+    Returns:
+        int: Number of expressions updated
+    """
+    cur = conn.cursor()
+    updated = 0
+    last_id = 0
+    while True:
+        cur.execute("""
+            SELECT id, expression
+            FROM expressions
+            WHERE add_count IS NULL AND id > %s
+            ORDER BY id
+            LIMIT %s;
+        """, (last_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+
+        execute_values(cur, """
+            UPDATE expressions AS e
+            SET add_count = v.add_count,
+                sub_count = v.sub_count,
+                mul_count = v.mul_count,
+                div_count = v.div_count
+            FROM (VALUES %s) AS v(id, add_count, sub_count, mul_count, div_count)
+            WHERE e.id = v.id;
+        """, [(expression_id, *count_operators(expression)) for expression_id, expression in rows],
+            template="(%s, %s::smallint, %s::smallint, %s::smallint, %s::smallint)")
+        conn.commit()
+
+        updated += len(rows)
+        last_id = rows[-1][0]
+        print(f"  expressions: {updated} updated")
+        time.sleep(pause)
+
+    cur.close()
+    return updated
+
+
+def backfill_result_values(conn, batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE):
+    """
+    Fill result_value for history rows saved before it was stored
+
+    Rows whose result is not a number (errors, sweep summaries) stay
+    NULL; the id cursor moves past them so they are read only once.
+
+    Returns:
+        int: Number of history rows updated
+    """
+    cur = conn.cursor()
+    updated = 0
+    last_id = 0
+    while True:
+        cur.execute("""
+            SELECT id, created_at, result
+            FROM calculator_history
+            WHERE result_value IS NULL AND id > %s
+            ORDER BY id
+            LIMIT %s;
+        """, (last_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+
+        values = [(row_id, created_at, result_value(result))
+                  for row_id, created_at, result in rows]
+        values = [value for value in values if value[2] is not None]
+        if values:
+            # created_at is part of the key, so each row's partition is pruned directly
+            execute_values(cur, """
+                UPDATE calculator_history AS h
+                SET result_value = v.result_value
+                FROM (VALUES %s) AS v(id, created_at, result_value)
+                WHERE h.id = v.id AND h.created_at = v.created_at;
+            """, values, template="(%s::integer, %s::timestamp, %s::double precision)")
+        conn.commit()
+
+        updated += len(values)
+        last_id = rows[-1][0]
+        print(f"  calculator_history: {updated} updated")
+        time.sleep(pause)
+
+    cur.close()
+    return updated
+
+
+def main(argv=None):
+    """Backfill operator counts and result values"""
+    parser = argparse.ArgumentParser(description="Backfill precomputed history columns")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE,
+                        help="Seconds to sleep between batches")
+    args = parser.parse_args(argv)
+
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+
+        print("Backfilling operator counts...")
+        counted = backfill_operator_counts(conn, args.batch_size, args.pause)
+        print("Backfilling result values...")
+        valued = backfill_result_values(conn, args.batch_size, args.pause)
+        print(f"Done: {counted} expressions, {valued} history rows")
+
+        conn.close()
+        return 0
+
+    except psycopg2.Error as e:
+        print(f"Error backfilling history: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
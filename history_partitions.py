@@ -0,0 +1,265 @@
+"""
+Monthly Partitions for Calculator History
+=========================================
+
+calculator_history is range-partitioned by month on created_at. This
+module creates partitions ahead of time, drops whole partitions for
+retention, and migrates an existing unpartitioned table.
+
+Run it from cron (or any scheduler) to keep partitions ahead of time:
+    python history_partitions.py --months-ahead 3 --retain-months 12
+"""
+
+import argparse
+import re
+from datetime import date
+
+import psycopg2
+from psycopg2 import sql
+from db_config import DB_CONFIG
+from expression_interning import create_expressions_table
+
+TABLE = 'calculator_history'
+DEFAULT_PARTITION = 'calculator_history_default'
+PARTITION_PATTERN = re.compile(r'^calculator_history_p(\d{4})_(\d{2})$')
+MONTHS_AHEAD = 3
+
+
+def month_start(day, offset=0):
+    """First day of the month offset months from day"""
+    month_index = day.year * 12 + (day.month - 1) + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Name of the partition holding the given month"""
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def create_partitioned_table(cur):
+    """Create the partitioned calculator_history table if it does not exist"""
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS calculator_history_id_seq;")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS calculator_history (
+            id INTEGER NOT NULL DEFAULT nextval('calculator_history_id_seq'),
+            expression_id INTEGER NOT NULL,
+            result TEXT NOT NULL,
+            result_value DOUBLE PRECISION,
+            precision_mode VARCHAR(10) NOT NULL DEFAULT 'float',
+            session_id VARCHAR(100),
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+    """)
+    cur.execute("ALTER SEQUENCE calculator_history_id_seq OWNED BY calculator_history.id;")
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT;").format(
+        sql.Identifier(DEFAULT_PARTITION), sql.Identifier(TABLE)))
+
+    # Indexes on the parent are created on every partition
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_calculator_history_created_at
+        ON calculator_history (created_at);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_calculator_history_session_id
+        ON calculator_history (session_id, created_at);
+    """)
+
+
+def is_partitioned(cur):
+    """
+    Check how calculator_history is stored
+
+    Returns:
+        bool or None: True if partitioned, False if a plain table,
+                      None if it does not exist
+    """
+    cur.execute("""
+        SELECT c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = %s;
+    """, (TABLE,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return row[0] == 'p'
+
+
+def ensure_partitions(cur, months_ahead=MONTHS_AHEAD, start=None):
+    """
+    Create monthly partitions from start through months_ahead from now
+
+    Args:
+        cur: Database cursor
+        months_ahead (int): Future months to create partitions for
+        start (date): First month to cover (default: this month)
+
+    Returns:
+        list: Names of the partitions that were created
+    """
+    today = date.today()
+    month = month_start(start or today)
+    last = month_start(today, months_ahead)
+    created = []
+
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s;
+    """, (TABLE,))
+    existing = {row[0] for row in cur.fetchall()}
+
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            create_partition(cur, name, month, month_start(month, 1))
+            created.append(name)
+        month = month_start(month, 1)
+    return created
+
+
+def create_partition(cur, name, lower, upper):
+    """
+    Create one partition, moving in any rows the default partition holds
+
+    The partition is built as a standalone table and then attached, so
+    rows that landed in the default partition while no partition existed
+    for their month are moved instead of blocking the new partition.
+    """
+    identifiers = {
+        'name': sql.Identifier(name),
+        'parent': sql.Identifier(TABLE),
+        'default': sql.Identifier(DEFAULT_PARTITION),
+    }
+    cur.execute(sql.SQL("CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS);").format(**identifiers))
+    cur.execute(sql.SQL("""
+        WITH moved AS (
+            DELETE FROM {default}
+            WHERE created_at >= %s AND created_at < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved;
+    """).format(**identifiers), (lower, upper))
+    cur.execute(sql.SQL("""
+        ALTER TABLE {parent} ATTACH PARTITION {name}
+        FOR VALUES FROM (%s) TO (%s);
+    """).format(**identifiers), (lower, upper))
+
+
+def drop_old_partitions(cur, retain_months):
+    """
+    Drop monthly partitions that are entirely older than the retention
+
+    Dropping a partition removes its rows without deleting them one by
+    one, so it is instant and leaves no dead tuples behind.
+
+    Args:
+        cur: Database cursor
+        retain_months (int): Months of history to keep, including this one
+
+    Returns:
+        list: Names of the partitions that were dropped
+    """
+    cutoff = month_start(date.today(), -(retain_months - 1))
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s;
+    """, (TABLE,))
+
+    dropped = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_PATTERN.match(name)
+        if match and date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(
+                sql.Identifier(TABLE), sql.Identifier(name)))
+            cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(name)))
+            dropped.append(name)
+    return sorted(dropped)
+
+
+def migrate_to_partitioned(cur, months_ahead=MONTHS_AHEAD):
+    """
+    Convert an existing plain calculator_history table to partitions
+
+    The old table is renamed, a partitioned table is created with
+    partitions covering all existing rows, the rows are copied over in
+    one statement and the old table is dropped. Run inside a transaction.
+
+    Returns:
+        int: Number of rows migrated
+    """
+    cur.execute("ALTER TABLE calculator_history RENAME TO calculator_history_legacy;")
+    cur.execute("ALTER TABLE calculator_history_legacy DROP CONSTRAINT IF EXISTS calculator_history_pkey;")
+    cur.execute("DROP INDEX IF EXISTS idx_calculator_history_created_at;")
+    cur.execute("DROP INDEX IF EXISTS idx_calculator_history_session_id;")
+    cur.execute("ALTER TABLE calculator_history_legacy ALTER COLUMN id DROP DEFAULT;")
+
+    # SERIAL tables own a sequence with the same name; keep using it
+    create_partitioned_table(cur)
+
+    # Intern the legacy expression text while copying the rows
+    create_expressions_table(cur)
+    cur.execute("""
+        INSERT INTO expressions (expression)
+        SELECT DISTINCT expression FROM calculator_history_legacy
+        ON CONFLICT (expression) DO NOTHING;
+    """)
+
+    cur.execute("SELECT MIN(created_at) FROM calculator_history_legacy;")
+    oldest = cur.fetchone()[0]
+    ensure_partitions(cur, months_ahead, start=oldest.date() if oldest else None)
+
+    cur.execute("""
+        INSERT INTO calculator_history (id, expression_id, result, precision_mode, session_id, created_at)
+        SELECT l.id, e.id, l.result, l.precision_mode, l.session_id,
+               COALESCE(l.created_at, CURRENT_TIMESTAMP)
+        FROM calculator_history_legacy AS l
+        JOIN expressions AS e ON e.expression = l.expression;
+    """)
+    migrated = cur.rowcount
+    cur.execute("DROP TABLE calculator_history_legacy;")
+    cur.execute("""
+        SELECT setval('calculator_history_id_seq',
+                      COALESCE((SELECT MAX(id) FROM calculator_history), 0) + 1, false);
+    """)
+    return migrated
+
+
+def main(argv=None):
+    """Create upcoming partitions and apply retention"""
+    parser = argparse.ArgumentParser(description="Maintain calculator_history partitions")
+    parser.add_argument('--months-ahead', type=int, default=MONTHS_AHEAD)
+    parser.add_argument('--retain-months', type=int,
+                        help="Drop partitions older than this many months")
+    args = parser.parse_args(argv)
+
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        cur = conn.cursor()
+
+        created = ensure_partitions(cur, args.months_ahead)
+        print(f"Created partitions: {created or 'none'}")
+
+        if args.retain_months:
+            dropped = drop_old_partitions(cur, args.retain_months)
+            print(f"Dropped partitions: {dropped or 'none'}")
+
+        conn.commit()
+        cur.close()
+        conn.close()
+        return 0
+
+    except psycopg2.Error as e:
+        print(f"Error maintaining partitions: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Idempotency Keys for Calculation Saves
+======================================
+
+A client that retries a save after a timeout cannot tell whether the
+first attempt was stored. With an Idempotency-Key header every attempt
+carries the same key, and the save happens at most once:
+
+    - The idempotency_keys table has the key as its primary key. The
+      key is claimed in the same statement that inserts the history
+      row, so concurrent retries wait on the unique index and all but
+      one find the key already taken.
+    - A per-process LRU of recent keys and their responses answers
+      repeated retries without touching the database.
+    - A key reused with a different request body is rejected; the
+      stored fingerprint is a hash of the request.
+
+Keys are kept for IDEMPOTENCY_TTL seconds (env CALCULATOR_IDEMPOTENCY_TTL,
+default one day); purge_idempotency_keys deletes older rows. Offline
+journal records carry keys as well, so replaying a segment twice does
+not save it twice.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+IDEMPOTENCY_TTL = float(os.environ.get('CALCULATOR_IDEMPOTENCY_TTL', str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = 10000
+MAX_KEY_LENGTH = 255
+PURGE_INTERVAL = 600.0   # Seconds between purges of expired keys
+
+# Outcomes of an idempotent save
+SAVED = 'saved'
+DUPLICATE = 'duplicate'
+MISMATCH = 'mismatch'
+
+
+def create_idempotency_table(cur):
+    """Create the table of claimed idempotency keys"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key VARCHAR(255) PRIMARY KEY,
+            fingerprint CHAR(32),
+            calculation_id INTEGER,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at
+        ON idempotency_keys (created_at);
+    """)
+
+
+def request_fingerprint(data):
+    """
+    Hash a request body so a reused key with a different body is caught
+
+    Returns:
+        str: 32 hex digits
+    """
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+class IdempotencyCache:
+    """Bounded LRU of recent keys, their fingerprints and responses"""
+
+    def __init__(self, max_size=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.last_purge = time.monotonic()
+
+    def get(self, key):
+        """
+        Look up a key
+
+        Returns:
+            tuple: (fingerprint, response) or None if unknown or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, fingerprint, response):
+        """Remember the response given for a key"""
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, fingerprint, response)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def purge_due(self):
+        """
+        Check whether expired keys should be purged from the database
+
+        Returns True at most once per PURGE_INTERVAL.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_purge < PURGE_INTERVAL:
+                return False
+            self.last_purge = now
+            return True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,294 @@
+"""
+Load Test for the Calculator API
+================================
+
+Drives a configurable mix of API calls at a fixed arrival rate and
+reports throughput, latency percentiles and error rates.
+
+The load is open-loop: requests are scheduled at Poisson-distributed
+arrival times whether or not earlier requests have finished, the way
+independent users arrive. Latency is measured from the scheduled time,
+so time spent queued behind a slow server is counted instead of hidden.
+Requests are sent over a pool of persistent keep-alive connections.
+
+Usage:
+    python load_test.py --rate 200 --duration 30 --connections 32
+    python load_test.py --mix calculate=70,history=20,stats=10 --output run.json
+    python load_test.py --rate 200 --output new.json --compare run.json
+"""
+
+import argparse
+import http.client
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+DEFAULT_URL = "http://localhost:5000"
+DEFAULT_MIX = {'health': 10, 'session': 5, 'calculate': 50, 'history': 20, 'stats': 15}
+PERCENTILES = (50, 95, 99, 99.9)
+REQUEST_TIMEOUT = 10.0
+
+EXPRESSIONS = [
+    "2 + 2", "12 * 7", "100 / 8", "3.5 * 4 - 1", "(1 + 2) * (3 + 4)",
+    "2 ** 10", "17 % 5", "1 / 3 + 1 / 6", "99 - 33 * 2", "7 // 2",
+]
+
+
+def build_request(operation, session_id):
+    """
+    Build the HTTP request for one operation
+
+    Returns:
+        tuple: (method, path, JSON body or None)
+    """
+    if operation == 'health':
+        return 'GET', '/api/health', None
+    if operation == 'session':
+        return 'POST', '/api/session', {}
+    if operation == 'calculate':
+        return 'POST', '/api/calculate', {
+            'expression': random.choice(EXPRESSIONS),
+            'session_id': session_id,
+        }
+    if operation == 'history':
+        return 'GET', '/api/history?limit=20', None
+    if operation == 'stats':
+        return 'GET', '/api/stats', None
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+def parse_mix(text):
+    """Parse 'calculate=70,history=30' into a weight per operation"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        build_request(name, None)  # Validates the name
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples, elapsed):
+    """
+    Summarize (latency, ok) samples
+
+    Returns:
+        dict: requests, errors, error_rate, throughput and latency in ms
+    """
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0.0,
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            f"p{p:g}": round(percentile(latencies, p) * 1000, 3) if latencies else None
+            for p in PERCENTILES
+        },
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+
+class LoadTest:
+    """Open-loop load generator over persistent connections"""
+
+    def __init__(self, url=DEFAULT_URL, rate=100.0, duration=10.0, connections=16, mix=None):
+        """
+        Args:
+            url (str): Base URL of the API
+            rate (float): Mean request arrivals per second
+            duration (float): Seconds to schedule arrivals for
+            connections (int): Concurrent keep-alive connections
+            mix (dict): Operation name -> relative weight
+        """
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.rate = rate
+        self.duration = duration
+        self.connections = connections
+        self.mix = mix or dict(DEFAULT_MIX)
+        self.pending = queue.Queue()
+        self.samples = {name: [] for name in self.mix}
+        self.samples_lock = threading.Lock()
+        self.session_id = None
+        self.max_backlog = 0
+
+    def create_session(self):
+        """Create the session used by calculate requests"""
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        try:
+            conn.request('POST', '/api/session', body='{}',
+                         headers={'Content-Type': 'application/json'})
+            data = json.loads(conn.getresponse().read())
+            self.session_id = data.get('session_id')
+        finally:
+            conn.close()
+
+    def schedule(self):
+        """Put operations on the queue at Poisson arrival times"""
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        start = time.perf_counter()
+        arrival = start
+        end = start + self.duration
+        while True:
+            arrival += random.expovariate(self.rate)
+            if arrival >= end:
+                break
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.pending.put((arrival, random.choices(names, weights)[0]))
+            self.max_backlog = max(self.max_backlog, self.pending.qsize())
+        for _ in range(self.connections):
+            self.pending.put(None)
+
+    def worker(self):
+        """Send queued requests over one keep-alive connection"""
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            scheduled, operation = item
+            method, path, body = build_request(operation, self.session_id)
+            headers = {'Connection': 'keep-alive'}
+            if body is not None:
+                body = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 400
+                if response.will_close:
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()  # Reconnects on the next request
+            latency = time.perf_counter() - scheduled
+            with self.samples_lock:
+                self.samples[operation].append((latency, ok))
+        conn.close()
+
+    def run(self):
+        """
+        Run the test and summarize it
+
+        Returns:
+            dict: Configuration, overall and per-operation results
+        """
+        started_at = datetime.now().isoformat()
+        self.create_session()
+        workers = [threading.Thread(target=self.worker, daemon=True)
+                   for _ in range(self.connections)]
+        for thread in workers:
+            thread.start()
+
+        start = time.perf_counter()
+        self.schedule()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        all_samples = [sample for samples in self.samples.values() for sample in samples]
+        return {
+            'started_at': started_at,
+            'config': {
+                'url': f"http://{self.host}:{self.port}",
+                'rate': self.rate,
+                'duration': self.duration,
+                'connections': self.connections,
+                'mix': self.mix,
+            },
+            'elapsed': round(elapsed, 3),
+            'max_backlog': self.max_backlog,
+            'overall': summarize(all_samples, elapsed),
+            'operations': {name: summarize(samples, elapsed)
+                           for name, samples in self.samples.items()},
+        }
+
+
+def print_report(results):
+    """Print a results table"""
+    header = f"{'operation':<12}{'requests':>10}{'errors':>8}{'req/s':>10}"
+    header += "".join(f"{'p' + format(p, 'g'):>10}" for p in PERCENTILES)
+    print(header)
+    print("-" * len(header))
+    rows = dict(results['operations'], overall=results['overall'])
+    for name, summary in rows.items():
+        line = f"{name:<12}{summary['requests']:>10}{summary['errors']:>8}{summary['throughput']:>10.1f}"
+        for value in summary['latency_ms'].values():
+            line += f"{value:>8.1f}ms" if value is not None else f"{'-':>10}"
+        print(line)
+    print(f"\nElapsed {results['elapsed']}s, error rate "
+          f"{results['overall']['error_rate']:.2%}, max backlog {results['max_backlog']}")
+
+
+def print_comparison(baseline, results):
+    """Print the change in throughput and latency against a baseline run"""
+    print("\nChange against baseline:")
+    old, new = baseline['overall'], results['overall']
+    if old['throughput']:
+        change = (new['throughput'] - old['throughput']) / old['throughput']
+        print(f"  throughput {old['throughput']:.1f} -> {new['throughput']:.1f} req/s ({change:+.1%})")
+    for name, old_value in old['latency_ms'].items():
+        new_value = new['latency_ms'].get(name)
+        if old_value and new_value is not None:
+            change = (new_value - old_value) / old_value
+            print(f"  {name:<6} {old_value:.1f} -> {new_value:.1f} ms ({change:+.1%})")
+    print(f"  errors {old['error_rate']:.2%} -> {new['error_rate']:.2%}")
+
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Open-loop load test for the calculator API")
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--rate', type=float, default=100.0, help="Mean requests per second")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of arrivals")
+    parser.add_argument('--connections', type=int, default=16, help="Keep-alive connections")
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help="Operation weights, e.g. calculate=70,history=20,stats=10")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Baseline results JSON file to compare against")
+    args = parser.parse_args(argv)
+
+    test = LoadTest(args.url, args.rate, args.duration, args.connections, args.mix)
+    print(f"Load testing {args.url}: {args.rate:g} req/s for {args.duration:g}s "
+          f"over {args.connections} connections")
+    try:
+        results = test.run()
+    except (OSError, ValueError) as e:
+        print(f"Cannot reach API at {args.url}: {e}")
+        return 1
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Offline Write-Ahead Journal for Calculations
+============================================
+
+The calculator GUI appends every calculation to a local journal file
+instead of writing to the database directly, so a calculation never
+waits on the database and is not lost while it is unreachable.
+
+A background thread makes appended records durable and drains them to
+the database:
+
+    1. Records written since the last pass are fsynced together, so a
+       burst of calculations costs one fsync.
+    2. The journal is renamed to a replay segment and a new journal is
+       started for further calculations.
+    3. The whole segment is saved with CalculatorDB.save_calculations_once
+       in one transaction and the segment is deleted.
+
+If the database is unreachable the segment is kept and retried every
+JOURNAL_RETRY_INTERVAL seconds; records left over from an earlier run
+are replayed at startup. Every record carries an idempotency key, so a
+crash between the commit and deleting the segment does not save that
+segment twice when it is replayed again.
+
+If a segment fails while the database still answers, some record is
+being rejected (bad data, a constraint). The segment is then saved one
+record at a time and records that fail again are moved to the rejected
+file (path + '.rejected') instead of blocking the journal forever.
+
+Each line of the journal is one JSON object, so a line torn by a crash
+is skipped on replay.
+"""
+
+import atexit
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from database_helper import CalculatorDB, session_counters
+
+JOURNAL_PATH = os.environ.get('CALCULATOR_JOURNAL_PATH', 'calculator_journal.jsonl')
+JOURNAL_SYNC_DELAY = 0.05      # Seconds to gather appends before one fsync
+JOURNAL_RETRY_INTERVAL = 5.0   # Seconds between replays while the database is down
+
+
+class OfflineJournal:
+    """Append-only local journal drained to the database in the background"""
+
+    def __init__(self, path=JOURNAL_PATH):
+        """
+        Args:
+            path (str): Journal file; the replay segment is path + '.replay'
+        """
+        self.path = path
+        self.segment_path = path + '.replay'
+        self.rejected_path = path + '.rejected'
+        self.lock = threading.Lock()
+        self.file = None
+        self.unsynced = 0
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.db = None
+
+        # Progress the GUI can poll
+        self.online = False
+        self.replayed = 0
+        self.rejected = 0
+        self.replay_passes = 0
+
+    def start(self):
+        """Start the background sync and replay thread"""
+        # Replays count session calculations; flush them on SIGTERM too
+        session_counters.start()
+        self.thread = threading.Thread(target=self.run, name="journal-replay", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        # Replay anything left over from an earlier run right away
+        self.wake.set()
+
+    def append(self, expression, result, session_id=None, precision_mode='float'):
+        """
+        Journal one calculation
+
+        Only writes to the OS buffer; the background thread fsyncs.
+        """
+        record = {
+            'expression': expression,
+            'result': result,
+            'session_id': session_id,
+            'precision_mode': precision_mode,
+            'created_at': datetime.now().isoformat(),
+            'key': str(uuid.uuid4()),
+        }
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            self.unsynced += 1
+        self.wake.set()
+
+    def pending(self):
+        """
+        Count calculations waiting to be saved to the database
+
+        Returns:
+            int: Number of journaled records not yet replayed
+        """
+        count = 0
+        for path in (self.segment_path, self.path):
+            try:
+                with open(path, 'rb') as f:
+                    count += sum(1 for _ in f)
+            except FileNotFoundError:
+                pass
+        return count
+
+    def sync(self):
+        """fsync everything appended so far"""
+        with self.lock:
+            if self.file is not None and self.unsynced:
+                os.fsync(self.file.fileno())
+                self.unsynced = 0
+
+    def rotate(self):
+        """
+        Move the journal to the replay segment
+
+        Returns:
+            bool: True if there is a segment to replay
+        """
+        with self.lock:
+            if os.path.exists(self.segment_path):
+                return True
+            if self.file is not None:
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+                self.unsynced = 0
+            if not os.path.exists(self.path) or not os.path.getsize(self.path):
+                return False
+            os.replace(self.path, self.segment_path)
+            return True
+
+    def read_segment(self):
+        """
+        Load the records in the replay segment
+
+        Returns:
+            tuple: (records, keys) where records are (expression, result,
+                   session_id, precision_mode, created_at) tuples and keys
+                   their idempotency keys (None for records journaled
+                   without one)
+        """
+        records = []
+        keys = []
+        with open(self.segment_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    records.append((
+                        record['expression'],
+                        record['result'],
+                        record['session_id'],
+                        record['precision_mode'],
+                        datetime.fromisoformat(record['created_at']),
+                    ))
+                    keys.append(record.get('key'))
+                except (ValueError, KeyError):
+                    continue  # Torn or corrupt line
+        return records, keys
+
+    def connect(self):
+        """
+        Get a connected database handle, or None if it is unavailable
+
+        Returns:
+            CalculatorDB: The connected database
+        """
+        if self.db is None:
+            self.db = CalculatorDB()
+        if not self.db.is_connected() and not self.db.connect():
+            return None
+        return self.db
+
+    def replay(self):
+        """
+        Save the replay segment to the database and delete it
+
+        Returns:
+            bool: True if the journal is fully drained
+        """
+        db = self.connect()
+        self.online = db is not None
+        if db is None:
+            return False
+
+        # Anything journaled while a segment replays goes in the next one
+        while self.rotate():
+            records, keys = self.read_segment()
+            rejected = self.rejected
+            if records:
+                for session_id in {record[2] for record in records if record[2]}:
+                    db.create_session(session_id)
+                if (db.save_calculations_once(records, keys) is None
+                        and not self.save_separately(db, records, keys)):
+                    # Drop the connection so the next attempt reconnects
+                    self.db.disconnect()
+                    self.db = None
+                    self.online = False
+                    return False
+
+            os.remove(self.segment_path)
+            self.replayed += len(records) - (self.rejected - rejected)
+
+        self.replay_passes += 1
+        return True
+
+    def save_separately(self, db, records, keys):
+        """
+        Save a failed segment record by record, quarantining rejected ones
+
+        Keys make it safe to stop part way and replay the whole segment
+        again later: records already saved are skipped.
+
+        Returns:
+            bool: False if the database stopped answering
+        """
+        if not db.probe():
+            return False
+        for record, key in zip(records, keys):
+            if db.save_calculations_once([record], [key]) is not None:
+                continue
+            if not db.probe():
+                return False
+            self.reject(record, key)
+        return True
+
+    def reject(self, record, key):
+        """Append a record the database will not accept to the rejected file"""
+        expression, result, session_id, precision_mode, created_at = record
+        print(f"Journal: rejected calculation {expression!r}, moved to {self.rejected_path}")
+        with open(self.rejected_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'expression': expression,
+                'result': result,
+                'session_id': session_id,
+                'precision_mode': precision_mode,
+                'created_at': created_at.isoformat(),
+                'key': key,
+                'rejected_at': datetime.now().isoformat(),
+            }) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.rejected += 1
+
+    def run(self):
+        """Background loop: group fsyncs, then drain to the database"""
+        drained = False
+        while not self.stopped.is_set():
+            self.wake.wait(None if drained else JOURNAL_RETRY_INTERVAL)
+            self.wake.clear()
+            if self.stopped.is_set():
+                break
+            # Let a burst of appends share one fsync
+            self.stopped.wait(JOURNAL_SYNC_DELAY)
+            try:
+                self.sync()
+                drained = self.replay()
+            except OSError as e:
+                print(f"Journal error: {e}")
+                drained = False
+
+    def stop(self):
+        """Stop the background thread and make the journal durable"""
+        self.stopped.set()
+        self.wake.set()
+        try:
+            self.sync()
+        except OSError as e:
+            print(f"Journal error: {e}")
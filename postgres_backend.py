@@ -0,0 +1,945 @@
+"""
+PostgreSQL Storage Backend
+==========================
+
+Stores calculator history in PostgreSQL using psycopg2. This is the
+default backend and the one the API server is deployed with.
+
+Connections are checked before use and reopened when they have died,
+for example after a database restart. Connection attempts go through a
+circuit breaker shared by the whole process, so while the database is
+down calls fail at once instead of each waiting on a timeout.
+
+Every statement, commit and rollback is timed and reported to
+db_accounting for the current request, and every statement to query_log. For a sample of
+slow statements the plan is captured with EXPLAIN (ANALYZE, BUFFERS),
+which runs the statement again, so it is done inside a savepoint that is
+rolled back and a sampled write is never applied twice.
+
+Overall statistics aggregate every partition, so they are computed at
+most once per STATS_TTL seconds (env CALCULATOR_STATS_TTL, default 5)
+per process and shared by all requests in between.
+"""
+
+import copy
+import os
+import random
+import threading
+import psycopg2
+from psycopg2.extensions import STATUS_READY, connection as base_connection, cursor as base_cursor
+from psycopg2.extras import execute_values
+from circuit_breaker import CircuitBreaker
+import db_accounting
+from db_config import DB_CONFIG
+from history_partitions import ensure_partitions
+from query_log import EXPLAIN_SAMPLE_RATE, query_log
+from expression_interning import ExpressionInternCache, intern_expression
+from idempotency import DUPLICATE, MISMATCH, SAVED
+from safe_eval import result_value
+from storage_backend import StorageBackend
+import time
+import uuid
+import weakref
+
+# Connect timeout and TCP keepalives so a dead server is noticed quickly
+CONNECT_OPTIONS = {
+    'connect_timeout': 3,
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+}
+
+# Connections idle longer than this are pinged before use
+LIVENESS_IDLE = 5.0
+
+# Expression text to expressions.id for this process
+expression_ids = ExpressionInternCache()
+
+# Shared by every connection in this process
+connection_breaker = CircuitBreaker('PostgreSQL')
+
+# Every backend in this process, for connection counts
+open_backends = weakref.WeakSet()
+
+# Overall statistics shared by every backend in this process
+STATS_TTL = float(os.environ.get('CALCULATOR_STATS_TTL', '5'))
+overall_stats = {'computed_at': 0.0, 'stats': None}
+overall_stats_lock = threading.Lock()
+
+
+# Statements EXPLAIN ANALYZE accepts
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'VALUES')
+
+
+class DatabaseUnavailable(psycopg2.OperationalError):
+    """Raised without contacting the server while the circuit breaker is open"""
+
+
+def explain(conn, sql):
+    """
+    Capture the executed plan of a statement without keeping its effects
+    
+    Args:
+        conn: Connection the statement ran on
+        sql (str): Statement with parameters already bound
+    
+    Returns:
+        list: The JSON plan, or None if it could not be captured
+    """
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    begin, end = (("BEGIN;", "ROLLBACK;") if conn.autocommit else
+                  ("SAVEPOINT query_log_explain;", "ROLLBACK TO SAVEPOINT query_log_explain;"))
+    # A plain cursor, so the caller's results are untouched and this is not timed
+    cur = conn.cursor(cursor_factory=base_cursor)
+    try:
+        cur.execute(begin)
+        try:
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+            return cur.fetchone()[0]
+        finally:
+            cur.execute(end)
+    except psycopg2.Error as e:
+        print(f"Could not capture query plan: {e}")
+        return None
+    finally:
+        cur.close()
+
+
+class TimedCursor(base_cursor):
+    """Cursor that reports every statement to the slow-query log"""
+    
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            result = super().execute(query, vars)
+            succeeded = True
+            return result
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            rows = self.rowcount if succeeded and self.description is not None else 0
+            db_accounting.record_round_trip(duration_ms, max(rows, 0))
+            if isinstance(query, bytes):
+                sql = query.decode('utf-8', 'replace')
+            elif isinstance(query, str):
+                sql = query
+            else:
+                sql = query.as_string(self)
+            entry = query_log.record(sql, duration_ms, vars,
+                                     request=db_accounting.serving_request())
+            # Named cursors only DECLARE here; failed statements have no plan
+            if (entry and succeeded and self.name is None
+                    and random.random() < EXPLAIN_SAMPLE_RATE):
+                bound = self.mogrify(query, vars).decode('utf-8', 'replace')
+                query_log.attach_plan(entry, explain(self.connection, bound))
+
+
+class TimedConnection(base_connection):
+    """Connection whose commits and rollbacks count as round trips"""
+    
+    def commit(self):
+        # Outside a transaction psycopg2 sends nothing to the server
+        if self.status == STATUS_READY:
+            return super().commit()
+        return db_accounting.timed(super().commit)
+    
+    def rollback(self):
+        if self.status == STATUS_READY:
+            return super().rollback()
+        return db_accounting.timed(super().rollback)
+
+
+class PostgresBackend(StorageBackend):
+    """Calculator history stored in PostgreSQL"""
+    
+    supports_purge_jobs = True
+    
+    def __init__(self):
+        self.conn = None
+        self.last_used = 0.0
+        open_backends.add(self)
+        self.connect()
+    
+    def connect(self):
+        """
+        Establish database connection
+        
+        Returns:
+            bool: True if connected, False if the attempt failed or the
+                  circuit breaker is open
+        """
+        if not connection_breaker.allow():
+            return False
+        try:
+            start = time.perf_counter()
+            self.conn = psycopg2.connect(**{**CONNECT_OPTIONS, **DB_CONFIG},
+                                         connection_factory=TimedConnection,
+                                         cursor_factory=TimedCursor)
+            db_accounting.record_connect((time.perf_counter() - start) * 1000)
+            self.last_used = time.monotonic()
+            connection_breaker.record_success()
+            return True
+        except psycopg2.Error as e:
+            print(f"Database connection error: {e}")
+            self.conn = None
+            connection_breaker.record_failure()
+            return False
+    
+    def disconnect(self):
+        """Close database connection"""
+        if self.conn:
+            self.conn.close()
+    
+    def is_connected(self):
+        """Check whether the connection is open"""
+        return self.conn is not None and not self.conn.closed
+    
+    def ping(self):
+        """
+        Check that the server still answers on this connection
+        
+        Returns:
+            bool: True if the connection is alive
+        """
+        try:
+            with db_accounting.upkeep():
+                cur = self.conn.cursor()
+                cur.execute("SELECT 1;")
+                cur.fetchone()
+                cur.close()
+                self.conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def ensure_connection(self):
+        """
+        Make sure there is a live connection, reconnecting if needed
+        
+        A connection that has been idle for LIVENESS_IDLE seconds is
+        pinged first, so a connection killed by a server restart is
+        replaced before it fails a real query.
+        
+        Raises:
+            DatabaseUnavailable: If no connection can be made
+        """
+        if (self.is_connected() and self.conn.status == STATUS_READY
+                and time.monotonic() - self.last_used > LIVENESS_IDLE
+                and not self.ping()):
+            self.disconnect()
+        if not self.is_connected() and not self.connect():
+            raise DatabaseUnavailable(
+                f"Database unavailable (circuit breaker {connection_breaker.state})")
+        self.last_used = time.monotonic()
+    
+    def connection_stats(self):
+        """Circuit breaker state and counters"""
+        return connection_breaker.stats()
+    
+    def query_stats(self, limit=20, order='total_ms'):
+        """Most expensive query shapes and recent slow queries"""
+        return query_log.stats(limit, order)
+    
+    def probe(self):
+        """
+        Run a trivial query, reconnecting first if needed
+        
+        Returns:
+            bool: True if the database answered
+        """
+        try:
+            self.ensure_connection()
+        except psycopg2.Error:
+            return False
+        return self.ping()
+    
+    def pool_stats(self):
+        """
+        Connections held by all backends in this process
+        
+        A connection inside a transaction is in use; one between
+        transactions is idle.
+        
+        Returns:
+            dict: open, in_use and idle connection counts
+        """
+        connections = [backend.conn for backend in list(open_backends)
+                       if backend.conn is not None and not backend.conn.closed]
+        in_use = sum(1 for conn in connections if conn.status != STATUS_READY)
+        return {
+            'open': len(connections),
+            'in_use': in_use,
+            'idle': len(connections) - in_use,
+        }
+    
+    def save_calculation(self, expression, result, session_id=None, precision_mode='float'):
+        """
+        Save a calculation to the database
+        
+        Args:
+            expression (str): The mathematical expression
+            result (str): The calculated result
+            session_id (str): Optional session identifier
+            precision_mode (str): Evaluator mode used ('float', 'decimal' or 'fraction')
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            # Repeated expressions reuse their id without a lookup
+            expression_id = expression_ids.get(expression)
+            if expression_id is None:
+                expression_id = intern_expression(cur, expression)
+            
+            # Insert calculation into history
+            cur.execute("""
+                INSERT INTO calculator_history
+                    (expression_id, result, result_value, precision_mode, session_id)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id;
+            """, (expression_id, result, result_value(result), precision_mode, session_id))
+            
+            calculation_id = cur.fetchone()[0]
+            
+            self.conn.commit()
+            cur.close()
+            
+            # Only cache ids whose insert has been committed
+            expression_ids.put(expression, expression_id)
+            return True
+            
+        except psycopg2.Error as e:
+            print(f"Error saving calculation: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return False
+    
+    def save_calculations(self, records):
+        """
+        Save many calculations in one transaction
+        
+        Each distinct expression is interned once and the rows are
+        inserted with multi-row INSERT statements, keeping the original
+        created_at of every record.
+        
+        Args:
+            records (list): (expression, result, session_id, precision_mode,
+                            created_at) tuples
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            ids = {}
+            for expression in {record[0] for record in records}:
+                expression_id = expression_ids.get(expression)
+                if expression_id is None:
+                    expression_id = intern_expression(cur, expression)
+                ids[expression] = expression_id
+            
+            execute_values(cur, """
+                INSERT INTO calculator_history
+                    (expression_id, result, result_value, precision_mode, session_id, created_at)
+                VALUES %s;
+            """, [(ids[expression], result, result_value(result), precision_mode, session_id, created_at)
+                  for expression, result, session_id, precision_mode, created_at in records],
+                page_size=1000)
+            
+            self.conn.commit()
+            cur.close()
+            
+            for expression, expression_id in ids.items():
+                expression_ids.put(expression, expression_id)
+            return True
+            
+        except psycopg2.Error as e:
+            print(f"Error saving calculations: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return False
+    
+    def save_calculation_once(self, key, fingerprint, expression, result, session_id=None,
+                              precision_mode='float'):
+        """
+        Save a calculation unless its idempotency key has been used
+        
+        The key is claimed and the history row inserted by one statement;
+        the row id comes from the history sequence so the key can point
+        at it. A concurrent save with the same key waits on the key's
+        unique index and then finds it taken.
+        
+        Args:
+            key (str): Idempotency key sent by the client
+            fingerprint (str): Hash of the request, see request_fingerprint
+            expression, result, session_id, precision_mode: As for save_calculation
+        
+        Returns:
+            dict: status (SAVED, DUPLICATE or MISMATCH), and the result and
+                  session_id of the stored calculation; None on error
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            expression_id = expression_ids.get(expression)
+            if expression_id is None:
+                expression_id = intern_expression(cur, expression)
+            
+            cur.execute("""
+                WITH claimed AS (
+                    INSERT INTO idempotency_keys (key, fingerprint, calculation_id)
+                    VALUES (%s, %s, nextval('calculator_history_id_seq'))
+                    ON CONFLICT (key) DO NOTHING
+                    RETURNING calculation_id
+                )
+                INSERT INTO calculator_history
+                    (id, expression_id, result, result_value, precision_mode, session_id)
+                SELECT calculation_id, %s, %s, %s, %s, %s
+                FROM claimed
+                RETURNING id;
+            """, (key, fingerprint, expression_id, result, result_value(result),
+                  precision_mode, session_id))
+            
+            if cur.fetchone():
+                outcome = {'status': SAVED, 'result': result, 'session_id': session_id}
+            else:
+                cur.execute("""
+                    SELECT k.fingerprint, h.result, h.session_id
+                    FROM idempotency_keys k
+                    LEFT JOIN calculator_history h ON h.id = k.calculation_id
+                    WHERE k.key = %s;
+                """, (key,))
+                stored_fingerprint, stored_result, stored_session_id = cur.fetchone()
+                status = DUPLICATE if stored_fingerprint in (None, fingerprint) else MISMATCH
+                outcome = {'status': status, 'result': stored_result,
+                           'session_id': stored_session_id}
+            
+            self.conn.commit()
+            cur.close()
+            
+            expression_ids.put(expression, expression_id)
+            return outcome
+            
+        except psycopg2.Error as e:
+            print(f"Error saving calculation: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return None
+    
+    def save_calculations_once(self, records, keys):
+        """
+        Save many calculations in one transaction, skipping used keys
+        
+        Args:
+            records (list): (expression, result, session_id, precision_mode,
+                            created_at) tuples
+            keys (list): Idempotency key of each record, or None for
+                         records saved unconditionally
+        
+        Returns:
+            list: True for each record saved, False for each skipped as a
+                  duplicate; None on error
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            ids = {}
+            for expression in {record[0] for record in records}:
+                expression_id = expression_ids.get(expression)
+                if expression_id is None:
+                    expression_id = intern_expression(cur, expression)
+                ids[expression] = expression_id
+            
+            # Claim every key at once; only new keys come back, with a row id
+            claimed = {}
+            if any(key is not None for key in keys):
+                claimed = dict(execute_values(cur, """
+                    INSERT INTO idempotency_keys (key, calculation_id)
+                    VALUES %s
+                    ON CONFLICT (key) DO NOTHING
+                    RETURNING key, calculation_id;
+                """, [(key,) for key in set(keys) if key is not None],
+                    template="(%s, nextval('calculator_history_id_seq'))",
+                    page_size=1000, fetch=True))
+            
+            saved = []
+            rows = []
+            for record, key in zip(records, keys):
+                if key is None:
+                    row_id = None
+                else:
+                    # pop: a key repeated within the batch is saved once
+                    row_id = claimed.pop(key, None)
+                    if row_id is None:
+                        saved.append(False)
+                        continue
+                expression, result, session_id, precision_mode, created_at = record
+                rows.append((row_id, ids[expression], result, result_value(result),
+                             precision_mode, session_id, created_at))
+                saved.append(True)
+            
+            execute_values(cur, """
+                INSERT INTO calculator_history
+                    (id, expression_id, result, result_value, precision_mode, session_id, created_at)
+                VALUES %s;
+            """, rows, template="""(COALESCE(%s, nextval('calculator_history_id_seq')),
+                                    %s, %s, %s, %s, %s, %s)""", page_size=1000)
+            
+            self.conn.commit()
+            cur.close()
+            
+            for expression, expression_id in ids.items():
+                expression_ids.put(expression, expression_id)
+            return saved
+            
+        except psycopg2.Error as e:
+            print(f"Error saving calculations: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return None
+    
+    def purge_idempotency_keys(self, before):
+        """
+        Delete idempotency keys claimed before a time
+        
+        Args:
+            before (datetime): Keys older than this are deleted
+        
+        Returns:
+            int: Number of keys deleted, or None on error
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            cur.execute("DELETE FROM idempotency_keys WHERE created_at < %s;", (before,))
+            deleted = cur.rowcount
+            self.conn.commit()
+            cur.close()
+            return deleted
+            
+        except psycopg2.Error as e:
+            print(f"Error purging idempotency keys: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return None
+    
+    def get_calculation_history(self, limit=50):
+        """
+        Retrieve calculation history from database
+        
+        The current month is queried first so that, when it holds enough
+        rows, only the newest partition is read. Older partitions are only
+        touched when the current month has fewer than limit rows.
+        
+        Args:
+            limit (int): Maximum number of records to return
+        
+        Returns:
+            list: List of calculation records
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            cur.execute("""
+                SELECT h.id, e.expression, h.result, h.created_at
+                FROM calculator_history h
+                JOIN expressions e ON e.id = h.expression_id
+                WHERE h.created_at >= date_trunc('month', LOCALTIMESTAMP)
+                  AND h.created_at < date_trunc('month', LOCALTIMESTAMP) + INTERVAL '1 month'
+                ORDER BY h.created_at DESC
+                LIMIT %s;
+            """, (limit,))
+            
+            history = cur.fetchall()
+            
+            if len(history) < limit:
+                cur.execute("""
+                    SELECT h.id, e.expression, h.result, h.created_at
+                    FROM calculator_history h
+                    JOIN expressions e ON e.id = h.expression_id
+                    ORDER BY h.created_at DESC
+                    LIMIT %s;
+                """, (limit,))
+                history = cur.fetchall()
+            
+            cur.close()
+            # End the read transaction so the connection is not left idle in it
+            self.conn.commit()
+            
+            return history
+            
+        except psycopg2.Error as e:
+            print(f"Error retrieving history: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return []
+    
+    def iter_history(self, batch_size=2000, since=None, until=None, session_id=None):
+        """
+        Stream calculation history with a server-side cursor
+        
+        Rows are fetched from the server batch_size at a time, so memory
+        use stays constant however large the table is. The cursor holds a
+        transaction open until iteration finishes, so use a CalculatorDB
+        instance that is not shared with other work while iterating.
+        
+        Args:
+            batch_size (int): Rows fetched per round trip (cursor itersize)
+            since (datetime): Only rows created at or after this time
+            until (datetime): Only rows created before this time
+            session_id (str): Only rows saved by this session
+        
+        Yields:
+            tuple: (id, expression, result, created_at, session_id, precision_mode)
+                   in creation order
+        
+        Raises:
+            psycopg2.Error: If the stream fails, so a cut-short stream is
+                            not mistaken for the whole history
+        """
+        try:
+            self.ensure_connection()
+        except psycopg2.Error as e:
+            print(f"Error streaming history: {e}")
+            raise
+        
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append("h.created_at >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("h.created_at < %s")
+            params.append(until)
+        if session_id is not None:
+            conditions.append("h.session_id = %s")
+            params.append(session_id)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        
+        cur = self.conn.cursor(name=f"history_{uuid.uuid4().hex}")
+        cur.itersize = batch_size
+        try:
+            cur.execute(f"""
+                SELECT h.id, e.expression, h.result, h.created_at, h.session_id, h.precision_mode
+                FROM calculator_history h
+                JOIN expressions e ON e.id = h.expression_id
+                {where}
+                ORDER BY h.created_at, h.id;
+            """, params)
+            
+            for row in cur:
+                yield row
+            
+            cur.close()
+            self.conn.commit()
+        except psycopg2.Error as e:
+            print(f"Error streaming history: {e}")
+            if not self.conn.closed:
+                self.conn.rollback()
+            raise
+        finally:
+            if not cur.closed and not self.conn.closed:
+                cur.close()
+                self.conn.rollback()
+    
+    def get_overall_stats(self):
+        """
+        Aggregate statistics over all calculation history
+        
+        The aggregate scans and sorts every partition, so its result is
+        reused for STATS_TTL seconds. While one thread recomputes it,
+        others get the previous figures instead of running it as well.
+        
+        Returns:
+            dict: total_calculations, operations, date_range and results,
+                  or None on error
+        """
+        cached = overall_stats['stats']
+        if cached is not None and time.monotonic() - overall_stats['computed_at'] < STATS_TTL:
+            return copy.deepcopy(cached)
+        if not overall_stats_lock.acquire(blocking=cached is None):
+            return copy.deepcopy(cached)
+        try:
+            # Another thread may have recomputed while this one waited
+            cached = overall_stats['stats']
+            if cached is not None and time.monotonic() - overall_stats['computed_at'] < STATS_TTL:
+                return copy.deepcopy(cached)
+            # Shared by every request, so not one request's own work
+            with db_accounting.upkeep():
+                stats = self.compute_overall_stats()
+            if stats is not None:
+                overall_stats.update(computed_at=time.monotonic(), stats=stats)
+            return copy.deepcopy(stats)
+        finally:
+            overall_stats_lock.release()
+    
+    def compute_overall_stats(self):
+        """
+        Run the aggregate behind get_overall_stats
+        
+        Operator counts come from the counts stored with each interned
+        expression and result figures from result_value, so nothing is
+        re-parsed. Results that are not numbers are left out of the
+        result figures.
+        
+        Returns:
+            dict: total_calculations, operations, date_range and results,
+                  or None on error
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            cur.execute("""
+                SELECT COUNT(*),
+                       COALESCE(SUM(e.add_count), 0),
+                       COALESCE(SUM(e.sub_count), 0),
+                       COALESCE(SUM(e.mul_count), 0),
+                       COALESCE(SUM(e.div_count), 0),
+                       MIN(h.created_at),
+                       MAX(h.created_at),
+                       COUNT(h.result_value),
+                       SUM(h.result_value),
+                       AVG(h.result_value),
+                       MIN(h.result_value),
+                       MAX(h.result_value),
+                       percentile_cont(0.5) WITHIN GROUP (ORDER BY h.result_value),
+                       percentile_cont(0.95) WITHIN GROUP (ORDER BY h.result_value)
+                FROM calculator_history h
+                JOIN expressions e ON e.id = h.expression_id;
+            """)
+            
+            row = cur.fetchone()
+            cur.close()
+            self.conn.commit()
+            
+            return {
+                'total_calculations': row[0],
+                'operations': {'+': row[1], '-': row[2], '*': row[3], '/': row[4]},
+                'date_range': {'oldest': row[5], 'newest': row[6]} if row[0] else None,
+                'results': {
+                    'count': row[7],
+                    'sum': row[8],
+                    'avg': row[9],
+                    'min': row[10],
+                    'max': row[11],
+                    'median': row[12],
+                    'p95': row[13],
+                }
+            }
+            
+        except psycopg2.Error as e:
+            print(f"Error getting statistics: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return None
+    
+    def create_session(self, session_id):
+        """
+        Create a new calculator session
+        
+        Args:
+            session_id (str): Unique session identifier
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            cur.execute("""
+                INSERT INTO calculator_sessions (session_id)
+                VALUES (%s)
+                ON CONFLICT (session_id) DO NOTHING;
+            """, (session_id,))
+            
+            self.conn.commit()
+            cur.close()
+            return True
+            
+        except psycopg2.Error as e:
+            print(f"Error creating session: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return False
+    
+    def update_session(self, session_id, calculation_id=None):
+        """
+        Update session statistics
+        
+        Args:
+            session_id (str): Session identifier
+            calculation_id (int): Optional calculation ID
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            # Update total calculations and last used timestamp
+            cur.execute("""
+                UPDATE calculator_sessions
+                SET total_calculations = total_calculations + 1,
+                    last_used = CURRENT_TIMESTAMP
+                WHERE session_id = %s;
+            """, (session_id,))
+            
+            self.conn.commit()
+            cur.close()
+            return True
+            
+        except psycopg2.Error as e:
+            print(f"Error updating session: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return False
+    
+    def get_session_stats(self, session_id):
+        """
+        Get statistics for a session
+        
+        Args:
+            session_id (str): Session identifier
+        
+        Returns:
+            dict: Session statistics
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            cur.execute("""
+                SELECT total_calculations, created_at, last_used
+                FROM calculator_sessions
+                WHERE session_id = %s;
+            """, (session_id,))
+            
+            result = cur.fetchone()
+            cur.close()
+            self.conn.commit()
+            
+            if result:
+                return {
+                    'total_calculations': result[0],
+                    'created_at': result[1],
+                    'last_used': result[2]
+                }
+            return None
+            
+        except psycopg2.Error as e:
+            print(f"Error getting session stats: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return None
+    
+    def apply_session_deltas(self, deltas):
+        """
+        Apply buffered session counter updates in a single statement
+        
+        Args:
+            deltas (dict): session_id -> (calculation count, last used time)
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            # Sorted so concurrent flushes from other workers lock rows in the same order
+            rows = [(session_id, count, last_used)
+                    for session_id, (count, last_used) in sorted(deltas.items())]
+            execute_values(cur, """
+                UPDATE calculator_sessions AS s
+                SET total_calculations = s.total_calculations + v.count,
+                    last_used = GREATEST(s.last_used, v.last_used)
+                FROM (VALUES %s) AS v(session_id, count, last_used)
+                WHERE s.session_id = v.session_id;
+            """, rows, template="(%s, %s::integer, %s::timestamp)")
+            
+            self.conn.commit()
+            cur.close()
+            return True
+            
+        except psycopg2.Error as e:
+            print(f"Error updating sessions: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return False
+    
+    def maintain_partitions(self, months_ahead=3):
+        """
+        Create any missing monthly history partitions ahead of time
+        
+        Args:
+            months_ahead (int): Future months to create partitions for
+        
+        Returns:
+            list: Names of the partitions that were created
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            created = ensure_partitions(cur, months_ahead)
+            self.conn.commit()
+            cur.close()
+            return created
+            
+        except psycopg2.Error as e:
+            print(f"Error creating partitions: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return []
+    
+    def clear_history(self):
+        """
+        Clear all calculation history
+        
+        Uses TRUNCATE, which empties every partition at once instead of
+        deleting and logging each row.
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            self.ensure_connection()
+            
+            cur = self.conn.cursor()
+            
+            cur.execute("TRUNCATE calculator_history;")
+            
+            self.conn.commit()
+            cur.close()
+            overall_stats.update(computed_at=0.0, stats=None)
+            return True
+            
+        except psycopg2.Error as e:
+            print(f"Error clearing history: {e}")
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
+            return False
@@ -0,0 +1,310 @@
+"""
+Sampling Profiler and Memory Snapshots
+======================================
+
+Lets a running API server be profiled without restarting it.
+
+CPU: a background thread reads the stack of every thread with
+sys._current_frames() at a fixed interval and counts each distinct
+stack. Nothing is hooked into function calls, so the overhead is one
+stack walk per thread per interval. Samples are wall-clock: a thread
+blocked on the database shows up waiting in psycopg2, which is usually
+what is wanted when requests are slow. Results are returned in the
+collapsed-stack format ("frame;frame;frame count" per line) read by
+flamegraph.pl, speedscope and similar tools.
+
+    - profile(seconds) samples all threads for a fixed time.
+    - request_profiler samples only threads serving requests chosen by
+      start_request() with probability PROFILE_SAMPLE_RATE (env
+      CALCULATOR_PROFILE_SAMPLE_RATE, default 0: off), continuously,
+      with stacks grouped under the route name.
+
+Memory: MemoryTracker starts tracemalloc on first use, keeps a baseline
+snapshot and reports the allocations that grew since it.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.005        # Seconds between stack samples (200 Hz)
+MAX_PROFILE_SECONDS = 60
+MAX_STACK_DEPTH = 128
+THREAD_NAME = "sampling-profiler"
+PROFILE_SAMPLE_RATE = float(os.environ.get('CALCULATOR_PROFILE_SAMPLE_RATE', '0'))
+
+TRACEMALLOC_FRAMES = 10        # Frames stored per allocation traceback
+TOP_ALLOCATIONS = 25
+GROUPINGS = ('lineno', 'filename', 'traceback')
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+
+def folded_stack(frame):
+    """
+    Describe a stack as 'outer;...;inner' with one entry per function
+
+    Args:
+        frame: Innermost frame of the stack
+
+    Returns:
+        str: The frames from the outermost call inwards
+    """
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Counts the stacks of selected threads, sampled at a fixed interval"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL, all_threads=True):
+        """
+        Args:
+            interval (float): Seconds between samples
+            all_threads (bool): Sample every thread, labelled with its name;
+                                otherwise only threads added with add_thread
+        """
+        self.interval = interval
+        self.all_threads = all_threads
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.samples = 0
+        self.targets = {}   # Thread id -> label, when not sampling all threads
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start sampling in a background thread"""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name=THREAD_NAME, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampling thread"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def is_running(self):
+        """Check whether the sampling thread is alive"""
+        return self.thread is not None and self.thread.is_alive()
+
+    def add_thread(self, thread_id, label):
+        """Sample a thread under the given label"""
+        with self.lock:
+            self.targets[thread_id] = label
+
+    def remove_thread(self, thread_id):
+        """Stop sampling a thread"""
+        with self.lock:
+            self.targets.pop(thread_id, None)
+
+    def run(self):
+        """Sampling loop"""
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """Record the current stack of each selected thread"""
+        if self.all_threads:
+            # Leave out the sampling threads of this and other profilers
+            labels = {thread.ident: thread.name for thread in threading.enumerate()
+                      if thread.name != THREAD_NAME}
+        else:
+            with self.lock:
+                labels = dict(self.targets)
+            if not labels:
+                return  # Nothing to sample; skip the stack walk
+
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id not in labels:
+                continue
+            stacks.append(f"{labels[thread_id]};{folded_stack(frame)}")
+
+        with self.lock:
+            self.counts.update(stacks)
+            self.samples += 1
+
+    def folded(self):
+        """
+        The samples in collapsed-stack format
+
+        Returns:
+            str: One 'stack count' line per distinct stack, most frequent first
+        """
+        with self.lock:
+            lines = [f"{stack} {count}" for stack, count in self.counts.most_common()]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def reset(self):
+        """Discard the samples collected so far"""
+        with self.lock:
+            self.counts.clear()
+            self.samples = 0
+
+
+# Only one on-demand profile runs at a time
+_profile_lock = threading.Lock()
+
+
+def profile(seconds, interval=SAMPLE_INTERVAL):
+    """
+    Sample every thread for a fixed time
+
+    Args:
+        seconds (float): How long to sample, at most MAX_PROFILE_SECONDS
+        interval (float): Seconds between samples
+
+    Returns:
+        SamplingProfiler: The stopped profiler with its samples
+
+    Raises:
+        ProfilerBusy: If another profile is already running
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+        time.sleep(min(seconds, MAX_PROFILE_SECONDS))
+        profiler.stop()
+        return profiler
+    finally:
+        _profile_lock.release()
+
+
+# Continuous profiler for a sample of requests
+request_profiler = SamplingProfiler(all_threads=False)
+_request_profiler_lock = threading.Lock()
+
+
+def start_request(label, rate=None):
+    """
+    Decide whether to profile the current request and start sampling it
+
+    Args:
+        label (str): Name the request's stacks are grouped under
+        rate (float): Fraction of requests to profile (default: PROFILE_SAMPLE_RATE)
+
+    Returns:
+        bool: True if this request is being profiled
+    """
+    rate = PROFILE_SAMPLE_RATE if rate is None else rate
+    if rate <= 0 or random.random() >= rate:
+        return False
+    with _request_profiler_lock:
+        if not request_profiler.is_running():
+            request_profiler.start()
+    request_profiler.add_thread(threading.get_ident(), label)
+    return True
+
+
+def end_request():
+    """Stop sampling the current request's thread"""
+    request_profiler.remove_thread(threading.get_ident())
+
+
+class MemoryTracker:
+    """tracemalloc snapshots compared against a baseline"""
+
+    def __init__(self, frames=TRACEMALLOC_FRAMES):
+        """
+        Args:
+            frames (int): Frames stored per allocation when tracing starts
+        """
+        self.frames = frames
+        self.lock = threading.Lock()
+        self.baseline = None
+
+    def take_snapshot(self):
+        """Snapshot current allocations, starting tracemalloc if needed"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+
+    def traced_memory(self):
+        """Current and peak traced memory in KiB"""
+        current, peak = tracemalloc.get_traced_memory()
+        return {'current_kb': round(current / 1024, 1), 'peak_kb': round(peak / 1024, 1)}
+
+    def snapshot(self, group='lineno', limit=TOP_ALLOCATIONS):
+        """
+        Take a new baseline snapshot
+
+        Allocations made before tracing started are not seen, so the
+        first baseline is mostly useful as the starting point for diff.
+
+        Returns:
+            dict: Traced memory and the largest allocation sites
+        """
+        with self.lock:
+            self.baseline = self.take_snapshot()
+            stats = self.baseline.statistics(group)[:limit]
+            return {
+                'tracing_frames': tracemalloc.get_traceback_limit(),
+                'memory': self.traced_memory(),
+                'top': [self.describe(stat) for stat in stats],
+            }
+
+    def diff(self, group='lineno', limit=TOP_ALLOCATIONS, reset=False):
+        """
+        Compare a new snapshot against the baseline
+
+        Args:
+            group (str): One of GROUPINGS
+            limit (int): Number of allocation sites to return
+            reset (bool): Make the new snapshot the baseline
+
+        Returns:
+            dict: Traced memory and the sites that grew the most, or
+                  None if no baseline has been taken
+        """
+        with self.lock:
+            if self.baseline is None:
+                return None
+            current = self.take_snapshot()
+            stats = current.compare_to(self.baseline, group)[:limit]
+            if reset:
+                self.baseline = current
+            return {
+                'memory': self.traced_memory(),
+                'top': [self.describe(stat) for stat in stats],
+            }
+
+    def stop(self):
+        """Stop tracing and drop the baseline"""
+        with self.lock:
+            self.baseline = None
+            tracemalloc.stop()
+
+    @staticmethod
+    def describe(stat):
+        """Convert a Statistic or StatisticDiff to a dict"""
+        description = {
+            'location': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count,
+        }
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            description['size_diff_kb'] = round(stat.size_diff / 1024, 1)
+            description['count_diff'] = stat.count_diff
+        return description
+
+
+memory_tracker = MemoryTracker()
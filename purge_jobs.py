@@ -0,0 +1,282 @@
+"""
+Background History Purge Jobs
+=============================
+
+Deletes calculation history in the background so API requests return
+immediately.
+
+A purge covering all history truncates the table, which is instant.
+Purges scoped to a session or a time range delete in small batches in
+primary-key order, committing and pausing between batches so locks are
+held briefly and autovacuum can keep up. Job progress is stored in the
+purge_jobs table, so any API worker can report on any job.
+
+A job runs in a thread of the API worker that started it, so a worker
+restart kills it mid-purge. A running job writes progress after every
+batch; a queued or running job whose row has not been updated for
+STALE_AFTER seconds (env CALCULATOR_PURGE_STALE_AFTER) is taken to have
+died with its worker and is marked failed, when the API starts and when
+the job is looked up. Deleted batches are committed, so the purge can
+simply be requested again. A job that is only slow (a TRUNCATE waiting
+on a lock) and finishes afterwards still records itself as completed.
+
+Purge jobs need the PostgreSQL backend; with other storage backends the
+API deletes synchronously through StorageBackend.purge_history.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+import psycopg2
+from db_config import DB_CONFIG
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_PAUSE = 0.05  # Seconds between batches
+STALE_AFTER = float(os.environ.get('CALCULATOR_PURGE_STALE_AFTER', '300'))
+
+
+def create_purge_jobs_table(cur):
+    """Create the table that tracks purge job progress"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS purge_jobs (
+            job_id VARCHAR(36) PRIMARY KEY,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            session_id VARCHAR(100),
+            since TIMESTAMP,
+            until TIMESTAMP,
+            total_rows BIGINT,
+            deleted_rows BIGINT NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def scope_filter(session_id=None, since=None, until=None):
+    """
+    Build the WHERE conditions for a purge scope
+
+    Returns:
+        tuple: (list of SQL conditions, list of parameters)
+    """
+    conditions = []
+    params = []
+    if session_id is not None:
+        conditions.append("session_id = %s")
+        params.append(session_id)
+    if since is not None:
+        conditions.append("created_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("created_at < %s")
+        params.append(until)
+    return conditions, params
+
+
+class PurgeJob:
+    """One purge of calculation history, run in a background thread"""
+
+    def __init__(self, session_id=None, since=None, until=None,
+                 batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE):
+        """
+        Args:
+            session_id (str): Only delete this session's calculations
+            since (datetime): Only delete rows created at or after this time
+            until (datetime): Only delete rows created before this time
+            batch_size (int): Rows deleted per transaction
+            pause (float): Seconds to sleep between batches
+        """
+        self.job_id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.since = since
+        self.until = until
+        self.batch_size = batch_size
+        self.pause = pause
+        self.conn = None
+
+    @property
+    def is_scoped(self):
+        return any(value is not None for value in (self.session_id, self.since, self.until))
+
+    def start(self):
+        """
+        Record the job and start it in a background thread
+
+        Returns:
+            bool: True if the job was queued
+        """
+        try:
+            self.conn = psycopg2.connect(**DB_CONFIG)
+            cur = self.conn.cursor()
+            cur.execute("""
+                INSERT INTO purge_jobs (job_id, session_id, since, until)
+                VALUES (%s, %s, %s, %s);
+            """, (self.job_id, self.session_id, self.since, self.until))
+            self.conn.commit()
+            cur.close()
+        except psycopg2.Error as e:
+            print(f"Error starting purge job: {e}")
+            if self.conn:
+                self.conn.close()
+            return False
+
+        thread = threading.Thread(target=self.run, name=f"purge-{self.job_id}", daemon=True)
+        thread.start()
+        return True
+
+    def update(self, cur, **fields):
+        """Write job progress and commit it"""
+        assignments = ", ".join(f"{name} = %s" for name in fields)
+        cur.execute(f"""
+            UPDATE purge_jobs
+            SET {assignments}, updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = %s;
+        """, list(fields.values()) + [self.job_id])
+        self.conn.commit()
+
+    def run(self):
+        """Delete the rows in scope, updating progress as it goes"""
+        cur = self.conn.cursor()
+        try:
+            if self.is_scoped:
+                self.delete_in_batches(cur)
+            else:
+                cur.execute("SELECT COUNT(*) FROM calculator_history;")
+                total = cur.fetchone()[0]
+                cur.execute("TRUNCATE calculator_history;")
+                self.update(cur, status='completed', total_rows=total, deleted_rows=total)
+        except psycopg2.Error as e:
+            print(f"Error in purge job {self.job_id}: {e}")
+            self.conn.rollback()
+            try:
+                self.update(cur, status='failed', error=str(e))
+            except psycopg2.Error:
+                pass
+        finally:
+            cur.close()
+            self.conn.close()
+
+    def delete_in_batches(self, cur):
+        """Delete scoped rows batch_size at a time in id order"""
+        conditions, params = scope_filter(self.session_id, self.since, self.until)
+        where = " AND ".join(conditions)
+
+        cur.execute(f"SELECT COUNT(*) FROM calculator_history WHERE {where};", params)
+        total = cur.fetchone()[0]
+        self.update(cur, status='running', total_rows=total)
+
+        deleted = 0
+        last_id = 0
+        while True:
+            cur.execute(f"""
+                WITH batch AS (
+                    SELECT id, created_at
+                    FROM calculator_history
+                    WHERE {where} AND id > %s
+                    ORDER BY id
+                    LIMIT %s
+                )
+                DELETE FROM calculator_history h
+                USING batch
+                WHERE h.id = batch.id AND h.created_at = batch.created_at
+                RETURNING h.id;
+            """, params + [last_id, self.batch_size])
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+
+            deleted += len(ids)
+            last_id = max(ids)
+            # Commits the batch together with the progress update
+            self.update(cur, deleted_rows=deleted)
+            time.sleep(self.pause)
+
+        self.update(cur, status='completed', deleted_rows=deleted)
+
+
+def fail_stale_jobs(cur, job_id=None, stale_after=STALE_AFTER):
+    """
+    Mark queued or running jobs that stopped updating as failed
+
+    Args:
+        cur: Cursor to run the update on; the caller commits
+        job_id (str): Only check this job (default: all jobs)
+        stale_after (float): Seconds without progress before a job counts as dead
+
+    Returns:
+        int: Number of jobs marked failed
+    """
+    condition = "AND job_id = %s" if job_id is not None else ""
+    params = [stale_after] + ([job_id] if job_id is not None else [])
+    cur.execute(f"""
+        UPDATE purge_jobs
+        SET status = 'failed',
+            error = 'Purge stopped without finishing; the worker running it exited',
+            updated_at = CURRENT_TIMESTAMP
+        WHERE status IN ('queued', 'running')
+          AND updated_at < LOCALTIMESTAMP - make_interval(secs => %s)
+          {condition};
+    """, params)
+    return cur.rowcount
+
+
+def fail_orphaned_jobs():
+    """
+    Mark jobs left behind by exited workers as failed; run when the API starts
+
+    Returns:
+        int: Number of jobs marked failed, or None on error
+    """
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            cur = conn.cursor()
+            failed = fail_stale_jobs(cur)
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        print(f"Error checking for orphaned purge jobs: {e}")
+        return None
+
+    if failed:
+        print(f"Marked {failed} orphaned purge job(s) as failed")
+    return failed
+
+
+def get_purge_job(job_id):
+    """
+    Look up the progress of a purge job
+
+    A job whose worker has exited is reported as failed.
+
+    Returns:
+        dict: Job status, or None if the job does not exist
+    """
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        cur = conn.cursor()
+        fail_stale_jobs(cur, job_id)
+        conn.commit()
+        cur.execute("""
+            SELECT job_id, status, session_id, since, until,
+                   total_rows, deleted_rows, error, created_at, updated_at
+            FROM purge_jobs
+            WHERE job_id = %s;
+        """, (job_id,))
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+    except psycopg2.Error as e:
+        print(f"Error reading purge job: {e}")
+        return None
+
+    if not row:
+        return None
+    columns = ['job_id', 'status', 'session_id', 'since', 'until',
+               'total_rows', 'deleted_rows', 'error', 'created_at', 'updated_at']
+    return dict(zip(columns, row))
@@ -0,0 +1,275 @@
+"""
+Slow-Query Log and Query Statistics
+===================================
+
+The database layer reports every statement it runs here with how long
+it took. Statements are grouped by shape, the SQL with literals replaced
+by ? and repeated VALUES rows collapsed, so the same query with
+different parameters counts as one.
+
+    - Every statement slower than SLOW_QUERY_MS is printed with its
+      parameters and kept in a list of recent slow queries.
+    - Parameters are logged according to LOG_PARAMETERS: 'full',
+      'redacted' (strings shown only as their length, the default) or
+      'none'.
+    - A sample of slow queries (EXPLAIN_SAMPLE_RATE) also has its plan
+      captured by the backend.
+    - Per-shape totals are kept for a rolling window of two
+      WINDOW_SECONDS periods, for a top-N of the most expensive shapes.
+    - Durations of statements run for requests are kept with the time
+      they finished, for latency percentiles over a recent window.
+      Background work (purges, connection upkeep) is left out.
+
+Settings can be overridden with CALCULATOR_SLOW_QUERY_MS,
+CALCULATOR_EXPLAIN_SAMPLE_RATE and CALCULATOR_LOG_PARAMETERS.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+
+SLOW_QUERY_MS = float(os.environ.get('CALCULATOR_SLOW_QUERY_MS', '100'))
+EXPLAIN_SAMPLE_RATE = float(os.environ.get('CALCULATOR_EXPLAIN_SAMPLE_RATE', '0.1'))
+LOG_PARAMETERS = os.environ.get('CALCULATOR_LOG_PARAMETERS', 'redacted')
+
+TOP_QUERIES = 20
+MAX_SHAPES = 500          # Shapes tracked per window; the cheapest is dropped beyond this
+WINDOW_SECONDS = 300
+RECENT_SLOW = 50          # Slow queries kept for the admin endpoint
+LATENCY_SAMPLES = 1000    # Recent request statement durations kept for percentiles
+MAX_LOGGED_VALUE = 100    # Longest parameter value printed in full mode
+SHAPE_CACHE_LENGTH = 2000 # Longer SQL (execute_values batches) is not cached
+
+ORDERS = ('total_ms', 'max_ms', 'mean_ms', 'calls')
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.IGNORECASE)
+ROW = r"\((?:[?, ]|::\w+)*\)"
+REPEATED_ROWS = re.compile(rf"({ROW})(?:\s*,\s*{ROW})+")
+WHITESPACE = re.compile(r"\s+")
+
+
+def _shape(sql):
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    sql = WHITESPACE.sub(" ", sql).strip()
+    return REPEATED_ROWS.sub(r"\1, ...", sql)
+
+
+_cached_shape = lru_cache(maxsize=256)(_shape)
+
+
+def query_shape(sql):
+    """
+    Normalize SQL so queries differing only in literals group together
+
+    Args:
+        sql (str): Statement text, with or without inlined literals
+
+    Returns:
+        str: The statement with literals as ? and whitespace collapsed
+    """
+    if len(sql) > SHAPE_CACHE_LENGTH:
+        return _shape(sql)
+    return _cached_shape(sql)
+
+
+def redact_params(params, mode=None):
+    """
+    Prepare query parameters for logging
+
+    Args:
+        params: Tuple, list or dict of parameters, or None
+        mode (str): 'full', 'redacted' or 'none' (default: LOG_PARAMETERS)
+
+    Returns:
+        The parameters safe to log, or None
+    """
+    mode = mode or LOG_PARAMETERS
+    if params is None or mode == 'none':
+        return None
+
+    def clean(value):
+        if isinstance(value, (bytes, str)):
+            if mode == 'redacted':
+                return f"<{type(value).__name__}:{len(value)}>"
+            text = value if isinstance(value, str) else repr(value)
+            return text if len(text) <= MAX_LOGGED_VALUE else text[:MAX_LOGGED_VALUE] + "..."
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        return f"<{type(value).__name__}>" if mode == 'redacted' else str(value)
+
+    if isinstance(params, dict):
+        return {key: clean(value) for key, value in params.items()}
+    return [clean(value) for value in params]
+
+
+class QueryLog:
+    """Thread-safe per-shape timings and recent slow queries"""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, window=WINDOW_SECONDS):
+        """
+        Args:
+            slow_ms (float): Duration in milliseconds that counts as slow
+            window (float): Seconds per statistics window
+        """
+        self.slow_ms = slow_ms
+        self.window = window
+        self.lock = threading.Lock()
+        self.current = {}
+        self.previous = {}
+        self.window_started = time.monotonic()
+        self.recent = deque(maxlen=RECENT_SLOW)
+        self.durations = deque(maxlen=LATENCY_SAMPLES)
+        self.queries = 0
+        self.slow_queries = 0
+
+    def _rotate(self, now):
+        """Start a new window if the current one is over; the caller holds the lock"""
+        if now - self.window_started >= self.window:
+            # After a long quiet spell the old window is stale too
+            expired = now - self.window_started >= 2 * self.window
+            self.previous = {} if expired else self.current
+            self.current = {}
+            self.window_started = now
+
+    def record(self, sql, duration_ms, params=None, request=False):
+        """
+        Record one executed statement
+
+        Args:
+            sql (str): Statement text
+            duration_ms (float): Time the statement took
+            params: Parameters it was executed with
+            request (bool): Whether the statement was run for a request
+
+        Returns:
+            dict: The slow-query entry if the statement was slow, else None;
+                  a plan can be attached later with attach_plan
+        """
+        shape = query_shape(sql)
+        slow = duration_ms >= self.slow_ms
+        entry = None
+        with self.lock:
+            now = time.monotonic()
+            self._rotate(now)
+            self.queries += 1
+            if request:
+                self.durations.append((now, duration_ms))
+            stats = self.current.get(shape)
+            if stats is None:
+                if len(self.current) >= MAX_SHAPES:
+                    cheapest = min(self.current, key=lambda key: self.current[key]['total_ms'])
+                    del self.current[cheapest]
+                stats = self.current[shape] = {
+                    'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow_calls': 0, 'plan': None,
+                }
+            stats['calls'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+
+            if slow:
+                self.slow_queries += 1
+                stats['slow_calls'] += 1
+                entry = {
+                    'at': datetime.now().isoformat(),
+                    'query': shape,
+                    'duration_ms': round(duration_ms, 3),
+                    'params': redact_params(params),
+                    'plan': None,
+                }
+                self.recent.append(entry)
+
+        if entry:
+            print(f"Slow query ({duration_ms:.1f} ms): {shape} params={entry['params']}")
+        return entry
+
+    def attach_plan(self, entry, plan):
+        """Store a captured plan on a slow-query entry and its shape"""
+        with self.lock:
+            entry['plan'] = plan
+            stats = self.current.get(entry['query'])
+            if stats is not None:
+                stats['plan'] = plan
+
+    def latency_percentile(self, percent, window):
+        """
+        Nearest-rank percentile of recent request statement durations
+
+        Args:
+            percent (float): Percentile to report
+            window (float): Only statements finished this many seconds
+                            ago or less count
+
+        Returns:
+            float: Milliseconds, or None if no request statement ran
+                   in the window
+        """
+        since = time.monotonic() - window
+        with self.lock:
+            durations = sorted(duration for at, duration in self.durations if at >= since)
+        if not durations:
+            return None
+        rank = max(1, -(-len(durations) * percent // 100))
+        return round(durations[int(rank) - 1], 3)
+
+    def top(self, limit=TOP_QUERIES, order='total_ms'):
+        """
+        Most expensive query shapes over the last one to two windows
+
+        Args:
+            limit (int): Number of shapes to return
+            order (str): One of ORDERS
+
+        Returns:
+            list: Per-shape statistics, most expensive first
+        """
+        with self.lock:
+            self._rotate(time.monotonic())
+            merged = {}
+            for window in (self.previous, self.current):
+                for shape, stats in window.items():
+                    totals = merged.setdefault(shape, {
+                        'query': shape, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                        'slow_calls': 0, 'plan': None,
+                    })
+                    totals['calls'] += stats['calls']
+                    totals['total_ms'] += stats['total_ms']
+                    totals['max_ms'] = max(totals['max_ms'], stats['max_ms'])
+                    totals['slow_calls'] += stats['slow_calls']
+                    totals['plan'] = stats['plan'] or totals['plan']
+
+        for totals in merged.values():
+            totals['mean_ms'] = round(totals['total_ms'] / totals['calls'], 3)
+            totals['total_ms'] = round(totals['total_ms'], 3)
+            totals['max_ms'] = round(totals['max_ms'], 3)
+        return sorted(merged.values(), key=lambda totals: totals[order], reverse=True)[:limit]
+
+    def stats(self, limit=TOP_QUERIES, order='total_ms'):
+        """
+        Everything the admin endpoint shows
+
+        Returns:
+            dict: settings, counters, top query shapes and recent slow queries
+        """
+        top = self.top(limit, order)
+        with self.lock:
+            recent = list(self.recent)
+            queries, slow_queries = self.queries, self.slow_queries
+        return {
+            'slow_query_ms': self.slow_ms,
+            'explain_sample_rate': EXPLAIN_SAMPLE_RATE,
+            'window_seconds': self.window,
+            'queries': queries,
+            'slow_queries': slow_queries,
+            'top': top,
+            'recent_slow': recent[::-1],
+        }
+
+
+# Shared by every connection in this process
+query_log = QueryLog()
@@ -0,0 +1,145 @@
+"""
+Readiness Check for the API Server
+==================================
+
+/api/health only says the process is alive. A load balancer also needs
+to know whether sending this worker more traffic is a good idea, so
+/api/ready reports:
+
+    - a database probe (SELECT 1 on a dedicated connection), run at most
+      once per PROBE_INTERVAL however often readiness is polled
+    - database connections open, in use and idle in this process
+    - requests in flight in this worker
+    - depth of the write-behind session counter buffer
+    - p99 latency of the statements run for requests in the last
+      P99_WINDOW seconds; background work such as purges is left out
+
+The worker reports not ready when the database does not answer or any
+of these is over its limit, so traffic can be shed before requests
+start to queue. Limits can be set with CALCULATOR_READY_PROBE_INTERVAL,
+CALCULATOR_READY_MAX_IN_FLIGHT, CALCULATOR_READY_MAX_PENDING,
+CALCULATOR_READY_MAX_P99_MS and CALCULATOR_READY_P99_WINDOW.
+
+Because only recent statements count, a worker taken out of rotation
+for slow statements reports ready again once the window has passed
+without them, rather than waiting for traffic it will not receive.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from database_helper import session_counters
+from query_log import query_log
+
+PROBE_INTERVAL = float(os.environ.get('CALCULATOR_READY_PROBE_INTERVAL', '1.0'))
+MAX_IN_FLIGHT = int(os.environ.get('CALCULATOR_READY_MAX_IN_FLIGHT', '32'))
+MAX_PENDING = int(os.environ.get('CALCULATOR_READY_MAX_PENDING', '5000'))
+MAX_P99_MS = float(os.environ.get('CALCULATOR_READY_MAX_P99_MS', '500'))
+P99_WINDOW = float(os.environ.get('CALCULATOR_READY_P99_WINDOW', '60'))
+
+
+class ReadinessCheck:
+    """Decides whether this worker should receive traffic"""
+
+    def __init__(self, db, probe_interval=PROBE_INTERVAL, max_in_flight=MAX_IN_FLIGHT,
+                 max_pending=MAX_PENDING, max_p99_ms=MAX_P99_MS, p99_window=P99_WINDOW):
+        """
+        Args:
+            db (CalculatorDB): Database used only for readiness probes
+            probe_interval (float): Seconds a probe result is reused for
+            max_in_flight (int): Concurrent requests before not ready
+            max_pending (int): Buffered session counter updates before not ready
+            max_p99_ms (float): Statement p99 latency before not ready
+            p99_window (float): Seconds of recent statements the p99 covers
+        """
+        self.db = db
+        self.probe_interval = probe_interval
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.max_p99_ms = max_p99_ms
+        self.p99_window = p99_window
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+        self.in_flight = 0
+        self.last_probe = None
+        self.probed_at = 0.0
+
+    def request_started(self):
+        """Count a request entering the worker"""
+        with self.lock:
+            self.in_flight += 1
+
+    def request_finished(self):
+        """Count a request leaving the worker"""
+        with self.lock:
+            self.in_flight -= 1
+
+    def probe_database(self):
+        """
+        Probe the database, reusing a recent result
+
+        While one thread probes, others get the previous result instead
+        of waiting, so a slow database cannot pile up readiness requests.
+
+        Returns:
+            dict: ok, latency_ms and checked_at of the latest probe
+        """
+        if self.last_probe and time.monotonic() - self.probed_at < self.probe_interval:
+            return self.last_probe
+        if not self.probe_lock.acquire(blocking=self.last_probe is None):
+            return self.last_probe
+        try:
+            # Another thread may have probed while this one waited
+            if self.last_probe and time.monotonic() - self.probed_at < self.probe_interval:
+                return self.last_probe
+            start = time.perf_counter()
+            ok = self.db.probe()
+            self.last_probe = {
+                'ok': ok,
+                'latency_ms': round((time.perf_counter() - start) * 1000, 3),
+                'checked_at': datetime.now().isoformat(),
+            }
+            self.probed_at = time.monotonic()
+            return self.last_probe
+        finally:
+            self.probe_lock.release()
+
+    def check(self):
+        """
+        Evaluate readiness
+
+        Returns:
+            tuple: (ready, report) where report holds the measurements and
+                   the reasons the worker is not ready
+        """
+        database = self.probe_database()
+        with self.lock:
+            in_flight = self.in_flight
+        pending_sessions, pending_calculations = session_counters.depth()
+        p99 = query_log.latency_percentile(99, self.p99_window)
+
+        reasons = []
+        if not database['ok']:
+            reasons.append("database is not answering")
+        if in_flight > self.max_in_flight:
+            reasons.append(f"{in_flight} requests in flight (limit {self.max_in_flight})")
+        if pending_calculations > self.max_pending:
+            reasons.append(f"{pending_calculations} buffered session updates "
+                           f"(limit {self.max_pending})")
+        if p99 is not None and p99 > self.max_p99_ms:
+            reasons.append(f"database p99 latency {p99} ms (limit {self.max_p99_ms} ms)")
+
+        report = {
+            'database': dict(database, circuit_breaker=self.db.connection_stats().get('state')),
+            'connections': self.db.pool_stats(),
+            'requests_in_flight': in_flight,
+            'write_behind': {
+                'sessions': pending_sessions,
+                'calculations': pending_calculations,
+            },
+            'db_latency_p99_ms': p99,
+            'reasons': reasons,
+        }
+        return not reasons, report
@@ -0,0 +1,329 @@
+"""
+Shared Expression Result Cache
+==============================
+
+Caches evaluated results keyed by a canonical form of the expression.
+
+Expressions are canonicalized so that spacing and symbol variants such
+as "2 × 3", "2*3" and "2 * 3", and commutative reorderings such as
+"3 + 2" and "2 + 3", share one entry. Entries live in a memory-mapped file, so every API worker
+process on the machine sees the same cache.
+
+The file is a set-associative hash table: each key hashes to a bucket
+of a few slots, a bucket is locked with a byte-range lock while it is
+read or written, and the least recently used slot in a bucket is evicted
+when it is full. Hit, miss and eviction counters are kept per bucket and
+summed for the stats. Byte-range locks belong to the process, so threads
+of one process also take a per-cache thread lock around them.
+
+The file lives in a directory only the current user can access
+(CALCULATOR_CACHE_PATH overrides it), so another local user cannot
+create or poison it.
+"""
+
+import ast
+import decimal
+import hashlib
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: the cache is only shared within one process
+    fcntl = None
+
+from safe_eval import parse_expression, evaluate, format_result, DEFAULT_PRECISION_MODE
+
+CACHE_FILE_NAME = 'calculator_result_cache.bin'
+DEFAULT_BUCKETS = 4096
+DEFAULT_WAYS = 8
+
+KEY_SIZE = 320
+VALUE_SIZE = 104
+
+MAGIC = b'CALCRC01'
+FILE_HEADER = struct.Struct('8sII')                    # magic, buckets, ways
+BUCKET_HEADER = struct.Struct('QQQ')                   # hits, misses, evictions
+SLOT = struct.Struct(f'QQHH{KEY_SIZE}s{VALUE_SIZE}s')  # hash, last_used, lengths, key, value
+
+OPERATOR_SYMBOLS = {
+    ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
+    ast.FloorDiv: '//', ast.Mod: '%', ast.Pow: '**',
+}
+COMMUTATIVE = (ast.Add, ast.Mult)
+
+
+def default_cache_path():
+    """
+    Path of the cache file in a directory private to the current user
+
+    Uses $XDG_RUNTIME_DIR when set, otherwise a calculator-<uid> directory
+    in the temp directory, created with mode 0700.
+
+    Raises:
+        OSError: If the directory exists but is not a private directory
+                 owned by the current user
+    """
+    path = os.environ.get('CALCULATOR_CACHE_PATH')
+    if path:
+        return path
+    if not hasattr(os, 'getuid'):  # Windows: the temp directory is per user
+        return os.path.join(tempfile.gettempdir(), CACHE_FILE_NAME)
+
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir:
+        runtime_dir = os.path.join(tempfile.gettempdir(), f'calculator-{os.getuid()}')
+        try:
+            os.mkdir(runtime_dir, 0o700)
+        except FileExistsError:
+            pass
+        info = os.lstat(runtime_dir)
+        if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+                or info.st_mode & 0o077):
+            raise OSError(f"Cache directory {runtime_dir} is not private to this user")
+    return os.path.join(runtime_dir, CACHE_FILE_NAME)
+
+
+def _canonical_constant(node, source, mode):
+    """
+    Text for a literal that keeps its exact value in every mode
+
+    Float literals always read as floats ("1.0", "1.0E+30"), because a
+    float literal makes the decimal and fraction modes promote the whole
+    expression: 10**30+1 and 10**30+1.0 evaluate differently.
+    """
+    if isinstance(node.value, int):
+        return str(node.value)
+    if mode == 'float':
+        return repr(node.value)
+    text = ast.get_source_segment(source, node) or repr(node.value)
+    text = str(decimal.Decimal(text).normalize())
+    if '.' not in text:
+        mantissa, _, exponent = text.partition('E')
+        text = mantissa + '.0' + (f'E{exponent}' if exponent else '')
+    return text
+
+
+def _canonical_text(node, source, mode):
+    """Fully parenthesized text with commutative operands sorted"""
+    if isinstance(node, ast.Expression):
+        return _canonical_text(node.body, source, mode)
+    if isinstance(node, ast.Constant):
+        return _canonical_constant(node, source, mode)
+    if isinstance(node, ast.UnaryOp):
+        operand = _canonical_text(node.operand, source, mode)
+        return ('-' if isinstance(node.op, ast.USub) else '') + operand
+
+    left = _canonical_text(node.left, source, mode)
+    right = _canonical_text(node.right, source, mode)
+    if isinstance(node.op, COMMUTATIVE) and right < left:
+        left, right = right, left
+    return f"({left}{OPERATOR_SYMBOLS[type(node.op)]}{right})"
+
+
+def canonicalize(expression, mode=DEFAULT_PRECISION_MODE):
+    """
+    Build the canonical form of an expression
+
+    Only the two operands of a single + or * are swapped; chains are not
+    regrouped because that could change a float result.
+
+    Args:
+        expression (str): The mathematical expression
+        mode (str): Precision mode the result is evaluated in
+
+    Returns:
+        str: Canonical expression text
+    """
+    tree = parse_expression(expression)
+    return _canonical_text(tree, tree.source, mode)
+
+
+class SharedResultCache:
+    """LRU result cache stored in a memory-mapped file"""
+
+    def __init__(self, path=None, buckets=DEFAULT_BUCKETS, ways=DEFAULT_WAYS):
+        """
+        Args:
+            path (str): Cache file shared by all processes (default:
+                        default_cache_path())
+            buckets (int): Number of hash buckets
+            ways (int): Slots per bucket
+        """
+        self.path = path or default_cache_path()
+        self.buckets = buckets
+        self.ways = ways
+        self.bucket_size = BUCKET_HEADER.size + ways * SLOT.size
+        self.size = FILE_HEADER.size + buckets * self.bucket_size
+
+        self.thread_lock = threading.Lock()
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+        self._lock_range(0, FILE_HEADER.size)
+        try:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            header = os.read(self.fd, FILE_HEADER.size)
+            if (os.fstat(self.fd).st_size != self.size
+                    or header != FILE_HEADER.pack(MAGIC, buckets, ways)):
+                # New file or different dimensions: start empty
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.write(self.fd, FILE_HEADER.pack(MAGIC, buckets, ways))
+        finally:
+            self._unlock_range(0, FILE_HEADER.size)
+        self.map = mmap.mmap(self.fd, self.size)
+
+    def _lock_range(self, offset, length):
+        # lockf only excludes other processes; the thread lock excludes
+        # other threads of this one
+        self.thread_lock.acquire()
+        if fcntl:
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, length, offset)
+            except OSError:
+                self.thread_lock.release()
+                raise
+
+    def _unlock_range(self, offset, length):
+        try:
+            if fcntl:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, offset)
+        finally:
+            self.thread_lock.release()
+
+    def _locate(self, key):
+        """Return the key bytes, their hash and the bucket offset"""
+        key_bytes = key.encode('utf-8')
+        key_hash = int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little')
+        key_hash = key_hash or 1  # 0 marks an empty slot
+        bucket = key_hash % self.buckets
+        return key_bytes, key_hash, FILE_HEADER.size + bucket * self.bucket_size
+
+    def _count(self, offset, hits=0, misses=0, evictions=0):
+        """Update a bucket's counters; the caller holds the bucket lock"""
+        counters = BUCKET_HEADER.unpack_from(self.map, offset)
+        BUCKET_HEADER.pack_into(self.map, offset, counters[0] + hits,
+                                counters[1] + misses, counters[2] + evictions)
+
+    def get(self, key):
+        """
+        Look up a cached value
+
+        Returns:
+            str: The cached value, or None on a miss
+        """
+        key_bytes, key_hash, offset = self._locate(key)
+        self._lock_range(offset, self.bucket_size)
+        try:
+            slot_offset = offset + BUCKET_HEADER.size
+            for _ in range(self.ways):
+                slot_hash, _, key_len, value_len, slot_key, value = SLOT.unpack_from(self.map, slot_offset)
+                if slot_hash == key_hash and slot_key[:key_len] == key_bytes:
+                    struct.pack_into('Q', self.map, slot_offset + 8, time.time_ns())
+                    self._count(offset, hits=1)
+                    return value[:value_len].decode('utf-8')
+                slot_offset += SLOT.size
+            self._count(offset, misses=1)
+            return None
+        finally:
+            self._unlock_range(offset, self.bucket_size)
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used slot if needed
+
+        Returns:
+            bool: False if the key or value is too large to cache
+        """
+        key_bytes, key_hash, offset = self._locate(key)
+        value_bytes = value.encode('utf-8')
+        if len(key_bytes) > KEY_SIZE or len(value_bytes) > VALUE_SIZE:
+            return False
+
+        self._lock_range(offset, self.bucket_size)
+        try:
+            target = None
+            oldest = None
+            slot_offset = offset + BUCKET_HEADER.size
+            for _ in range(self.ways):
+                slot_hash, last_used, key_len, _, slot_key, _ = SLOT.unpack_from(self.map, slot_offset)
+                if slot_hash == key_hash and slot_key[:key_len] == key_bytes:
+                    target = slot_offset
+                    break
+                if slot_hash == 0 and target is None:
+                    target = slot_offset
+                elif slot_hash and (oldest is None or last_used < oldest[0]):
+                    oldest = (last_used, slot_offset)
+                slot_offset += SLOT.size
+
+            if target is None:
+                target = oldest[1]
+                self._count(offset, evictions=1)
+
+            SLOT.pack_into(self.map, target, key_hash, time.time_ns(),
+                           len(key_bytes), len(value_bytes), key_bytes, value_bytes)
+            return True
+        finally:
+            self._unlock_range(offset, self.bucket_size)
+
+    def stats(self):
+        """
+        Summed cache counters
+
+        Returns:
+            dict: hits, misses, evictions, entries, capacity and hit_rate
+        """
+        hits = misses = evictions = entries = 0
+        for bucket in range(self.buckets):
+            offset = FILE_HEADER.size + bucket * self.bucket_size
+            bucket_hits, bucket_misses, bucket_evictions = BUCKET_HEADER.unpack_from(self.map, offset)
+            hits += bucket_hits
+            misses += bucket_misses
+            evictions += bucket_evictions
+            slot_offset = offset + BUCKET_HEADER.size
+            for _ in range(self.ways):
+                if struct.unpack_from('Q', self.map, slot_offset)[0]:
+                    entries += 1
+                slot_offset += SLOT.size
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'entries': entries,
+            'capacity': self.buckets * self.ways,
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """Unmap and close the cache file"""
+        self.map.close()
+        os.close(self.fd)
+
+
+def cached_evaluate(cache, expression, mode=DEFAULT_PRECISION_MODE):
+    """
+    Evaluate an expression, using the shared cache when possible
+
+    Args:
+        cache (SharedResultCache): The cache
+        expression (str): The mathematical expression
+        mode (str): Precision mode
+
+    Returns:
+        str: The formatted result
+
+    Raises:
+        EvaluationError, ZeroDivisionError: As safe_eval.evaluate
+    """
+    key = f"{mode}:{canonicalize(expression, mode)}"
+    result = cache.get(key)
+    if result is None:
+        result = str(format_result(evaluate(expression, mode=mode)))
+        cache.put(key, result)
+    return result
@@ -0,0 +1,451 @@
+"""
+Safe Expression Evaluator for Calculator Applications
+=====================================================
+
+Evaluates calculator expressions without handing them to eval().
+
+Expressions are parsed into an AST that only allows numbers, the
+arithmetic operators and parentheses. Before anything is computed the
+cost of the expression is estimated from the size of its operands, so
+inputs like 9**9**9 are rejected up front instead of pinning a core.
+Expressions that are allowed but still expensive run in a separate
+worker process that is killed when it exceeds the time limit.
+
+Three precision modes are supported: 'float' (the fast default),
+'decimal' with a configurable context, and exact 'fraction'. Integer-only
+expressions are exact already and always take the native integer path;
+numbers are only promoted to Decimal or Fraction when the expression
+contains decimals or division.
+"""
+
+import ast
+import decimal
+import math
+import multiprocessing
+import operator
+import re
+from fractions import Fraction
+
+# Limits for a single evaluation
+MAX_EXPRESSION_LENGTH = 255      # Matches expressions.expression
+MAX_RESULT_BITS = 10000          # About 3000 decimal digits
+MAX_RESULT_LENGTH = 4000         # Characters of a formatted or client-supplied result
+MAX_EXPONENT_BITS = 64
+INLINE_COST_LIMIT = 2048         # Estimated cost evaluated in-process
+TIME_LIMIT = 2.0                 # Seconds allowed in the worker process
+
+FLOAT_BITS = 64
+
+# Longest stored result result_value parses, and the fractions it accepts
+MAX_RESULT_VALUE_LENGTH = 1000
+FRACTION_PATTERN = re.compile(r'([+-]?\d{1,400})\s*/\s*(\d{1,400})$')
+
+PRECISION_MODES = ('float', 'decimal', 'fraction')
+DEFAULT_PRECISION_MODE = 'float'
+DECIMAL_CONTEXT = decimal.Context(prec=28)
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+class EvaluationError(ValueError):
+    """Raised when an expression is invalid or exceeds the evaluation limits"""
+
+
+class EvaluationTimeout(EvaluationError):
+    """Raised when an expression does not finish within the time limit"""
+
+
+def normalize_expression(expression):
+    """Replace display symbols with Python operators"""
+    return expression.replace('×', '*').replace('÷', '/').strip()
+
+
+def parse_expression(expression, variables=()):
+    """
+    Parse an expression and check that it only uses allowed syntax
+
+    Args:
+        expression (str): The mathematical expression
+        variables (iterable): Names that may appear in the expression
+
+    Returns:
+        ast.Expression: The validated syntax tree
+    """
+    if not isinstance(expression, str):
+        raise EvaluationError("Expression must be a string")
+    expression = normalize_expression(expression)
+    if not expression:
+        raise EvaluationError("Empty expression")
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise EvaluationError("Expression is too long")
+
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        raise EvaluationError("Invalid expression")
+
+    allowed_names = set(variables)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Load)):
+            continue
+        if isinstance(node, tuple(BINARY_OPERATORS) + tuple(UNARY_OPERATORS)):
+            continue
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            continue
+        if isinstance(node, ast.Name) and node.id in allowed_names:
+            continue
+        raise EvaluationError("Invalid expression")
+
+    # Keep the normalized source so literals can be re-read exactly
+    tree.source = expression
+    return tree
+
+
+def needs_promotion(tree):
+    """
+    Check whether an expression can produce a non-integer result
+
+    Returns:
+        bool: False if the expression only uses integers and operators
+              that keep integers exact
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, float):
+            return True
+        if isinstance(node, ast.Name):
+            return True
+        if isinstance(node, ast.BinOp):
+            if isinstance(node.op, ast.Div):
+                return True
+            if isinstance(node.op, ast.Pow) and not _is_natural(node.right):
+                return True
+    return False
+
+
+def _is_natural(node):
+    """
+    Check whether a node is built only from integer literals with +, *
+    and **, so its value is a non-negative integer and a power raised to
+    it stays an integer
+    """
+    if isinstance(node, ast.Constant):
+        return type(node.value) is int
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Mult, ast.Pow)):
+        return _is_natural(node.left) and _is_natural(node.right)
+    return False
+
+
+def convert_constants(tree, mode, context=None):
+    """
+    Convert the numeric literals of a tree for a precision mode
+
+    Literals are rebuilt from their source text, so 0.1 becomes exactly
+    Decimal('0.1') or Fraction(1, 10) rather than the nearest double.
+
+    Args:
+        tree (ast.Expression): Tree returned by parse_expression
+        mode (str): One of PRECISION_MODES
+        context (decimal.Context): Context used in decimal mode
+    """
+    if mode == 'float':
+        return tree
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant):
+            text = ast.get_source_segment(tree.source, node) or repr(node.value)
+            if mode == 'decimal':
+                node.value = (context or DECIMAL_CONTEXT).create_decimal(text)
+            else:
+                node.value = Fraction(text)
+    return tree
+
+
+def _literal_integer(node):
+    """The integer value of a literal such as 7, -7 or Fraction(7), or None"""
+    sign = 1
+    while isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.USub):
+            sign = -sign
+        node = node.operand
+    if not isinstance(node, ast.Constant):
+        return None
+    value = node.value
+    if isinstance(value, Fraction) and value.denominator == 1:
+        value = value.numerator
+    if type(value) is not int:
+        return None
+    return sign * value
+
+
+def _estimate_node(node, sizes):
+    """
+    Estimate the size of the value a node produces
+
+    Every integer size seen is appended to sizes so the caller can find
+    the largest intermediate value in a single pass.
+
+    Returns:
+        tuple: (is_float, bits) where bits is an upper bound on the
+               size of an integer result
+    """
+    if isinstance(node, ast.Expression):
+        return _estimate_node(node.body, sizes)
+
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, (float, decimal.Decimal)):
+            # Decimal arithmetic is bounded by the context precision
+            return True, FLOAT_BITS
+        if isinstance(value, Fraction) and value.denominator != 1:
+            bits = value.numerator.bit_length() + value.denominator.bit_length()
+        elif isinstance(value, Fraction):
+            bits = max(abs(value.numerator).bit_length(), 1)
+        else:
+            bits = max(abs(value).bit_length(), 1)
+    elif isinstance(node, ast.Name):
+        return True, FLOAT_BITS
+    elif isinstance(node, ast.UnaryOp):
+        return _estimate_node(node.operand, sizes)
+    else:
+        left_float, left_bits = _estimate_node(node.left, sizes)
+        right_float, right_bits = _estimate_node(node.right, sizes)
+        is_float = left_float or right_float
+
+        if isinstance(node.op, ast.Div) and is_float:
+            return True, FLOAT_BITS
+
+        if isinstance(node.op, ast.Pow):
+            if right_bits > MAX_EXPONENT_BITS:
+                raise EvaluationError("Exponent is too large")
+            if is_float:
+                # Float powers either fit in a double or raise OverflowError
+                return True, FLOAT_BITS
+            exponent = _literal_integer(node.right)
+            if exponent is not None:
+                max_exponent = abs(exponent)
+            else:
+                max_exponent = (1 << right_bits) - 1
+            base = _literal_integer(node.left)
+            if base is not None:
+                # A literal base gives the size exactly: floor(e * log2|b|) + 1
+                # bits, so 2**9999 fits where bit_length * e would not
+                bits = int(max_exponent * math.log2(abs(base))) + 1 if abs(base) > 1 else 1
+            else:
+                bits = left_bits * max_exponent
+        elif is_float:
+            return True, FLOAT_BITS
+        elif isinstance(node.op, (ast.Add, ast.Sub)):
+            bits = max(left_bits, right_bits) + 1
+        elif isinstance(node.op, (ast.Mult, ast.Div)):
+            # Only exact fractions reach Div here; sizes add up
+            bits = left_bits + right_bits
+        else:
+            # Floor division and modulo never grow the result
+            bits = left_bits
+
+    if bits > MAX_RESULT_BITS:
+        raise EvaluationError("Result is too large")
+    sizes.append(bits)
+    return False, bits
+
+
+def estimate_cost(tree):
+    """
+    Estimate how expensive it is to evaluate a parsed expression
+
+    Args:
+        tree (ast.Expression): Tree returned by parse_expression
+
+    Returns:
+        int: Estimated cost, roughly the number of bits of the largest
+             intermediate integer
+    """
+    sizes = [FLOAT_BITS]
+    _estimate_node(tree, sizes)
+    return max(sizes)
+
+
+def evaluate_tree(node, variables=None):
+    """Evaluate a validated syntax tree"""
+    if isinstance(node, ast.Expression):
+        return evaluate_tree(node.body, variables)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        return variables[node.id]
+    if isinstance(node, ast.UnaryOp):
+        return UNARY_OPERATORS[type(node.op)](evaluate_tree(node.operand, variables))
+    left = evaluate_tree(node.left, variables)
+    right = evaluate_tree(node.right, variables)
+    return BINARY_OPERATORS[type(node.op)](left, right)
+
+
+def _evaluate_in_context(tree, context=None):
+    """Evaluate a tree, using a decimal context when one is given"""
+    if context is None:
+        return evaluate_tree(tree)
+    with decimal.localcontext(context):
+        return evaluate_tree(tree)
+
+
+def _worker(tree, context, connection):
+    """Evaluate a tree in a worker process and send back the outcome"""
+    try:
+        connection.send(('ok', _evaluate_in_context(tree, context)))
+    except Exception as e:
+        connection.send(('error', e))
+    finally:
+        connection.close()
+
+
+def evaluate_in_worker(tree, timeout=TIME_LIMIT, context=None):
+    """
+    Evaluate a tree in a separate process that is killed on timeout
+
+    Args:
+        tree (ast.Expression): Tree returned by parse_expression
+        timeout (float): Wall-clock limit in seconds
+        context (decimal.Context): Context used in decimal mode
+
+    Returns:
+        The result of the expression
+    """
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_worker, args=(tree, context, child_conn), daemon=True)
+    process.start()
+    child_conn.close()
+
+    try:
+        if not parent_conn.poll(timeout):
+            raise EvaluationTimeout("Calculation took too long")
+        status, value = parent_conn.recv()
+    except EOFError:
+        raise EvaluationError("Calculation failed")
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        parent_conn.close()
+
+    if status == 'error':
+        raise value
+    return value
+
+
+def check_result(result):
+    """Reject results that are too large, infinite, complex or not a number"""
+    if isinstance(result, complex):
+        raise EvaluationError("Result is not a real number")
+    if isinstance(result, (float, decimal.Decimal)) and not math.isfinite(result):
+        raise EvaluationError("Result is too large" if not math.isnan(result)
+                              else "Result is not a number")
+    if isinstance(result, int) and result.bit_length() > MAX_RESULT_BITS:
+        raise EvaluationError("Result is too large")
+    if isinstance(result, Fraction):
+        bits = result.numerator.bit_length() + result.denominator.bit_length()
+        if bits > MAX_RESULT_BITS:
+            raise EvaluationError("Result is too large")
+    return result
+
+
+def format_result(result):
+    """Format a result the way the calculator displays and stores it"""
+    if isinstance(result, float):
+        if result.is_integer():
+            return int(result)
+        return round(result, 10)  # Limit decimal places
+    if isinstance(result, decimal.Decimal):
+        if result.is_finite() and result == result.to_integral_value():
+            if result.adjusted() < 100:
+                return int(result)
+        return result.normalize()
+    if isinstance(result, Fraction) and result.denominator == 1:
+        return result.numerator
+    return result
+
+
+def result_value(result):
+    """
+    Numeric value of a stored result, for the result_value column
+
+    Accepts integers, decimals, exponent notation and fractions such as
+    "1/3", so results from every precision mode convert. Results can come
+    from clients, so only float() and short integer fractions are parsed;
+    Fraction("1e10000000") alone would take seconds of CPU.
+
+    Returns:
+        float: The value, or None if the result is not a finite number
+    """
+    text = str(result).strip()
+    if len(text) > MAX_RESULT_VALUE_LENGTH:
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        match = FRACTION_PATTERN.match(text)
+        if not match:
+            return None
+        try:
+            value = float(Fraction(int(match.group(1)), int(match.group(2))))
+        except (ZeroDivisionError, OverflowError):
+            return None
+    return value if math.isfinite(value) else None
+
+
+def evaluate(expression, timeout=TIME_LIMIT, isolate=True, mode=DEFAULT_PRECISION_MODE,
+             context=None):
+    """
+    Safely evaluate a calculator expression
+
+    Args:
+        expression (str): The mathematical expression
+        timeout (float): Wall-clock limit for expensive expressions
+        isolate (bool): Run expensive expressions in a worker process.
+            Callers that already run inside a worker pass False.
+        mode (str): 'float', 'decimal' or 'fraction'
+        context (decimal.Context): Decimal context (default: DECIMAL_CONTEXT)
+
+    Returns:
+        int, float, Decimal or Fraction: The result of the expression
+
+    Raises:
+        EvaluationError: If the expression is invalid or too expensive
+        ZeroDivisionError: If the expression divides by zero
+    """
+    if mode not in PRECISION_MODES:
+        raise EvaluationError(f"Unknown precision mode: {mode}")
+
+    tree = parse_expression(expression)
+    if mode == 'decimal':
+        context = context or DECIMAL_CONTEXT
+    else:
+        context = None
+    if mode != 'float' and needs_promotion(tree):
+        convert_constants(tree, mode, context)
+    else:
+        context = None
+    cost = estimate_cost(tree)
+
+    try:
+        if cost <= INLINE_COST_LIMIT or not isolate:
+            result = _evaluate_in_context(tree, context)
+        else:
+            result = evaluate_in_worker(tree, timeout, context)
+    except (OverflowError, decimal.Overflow):
+        raise EvaluationError("Result is too large")
+    except decimal.InvalidOperation:
+        raise EvaluationError("Invalid expression")
+
+    return check_result(result)
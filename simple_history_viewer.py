@@ -5,7 +5,7 @@ Simple History Viewer
 View calculation history without interactive input.
 """
 
-from database_helper import get_history, clear_history
+from database_helper import get_history, clear_history, get_stats
 from datetime import datetime
 
 def show_recent_calculations():
@@ -43,30 +43,20 @@ def show_statistics():
     print("=" * 60)
     
     try:
-        history = get_history(limit=1000)
-        
-        if not history:
+        stats = get_stats()
+        if not stats or not stats['total_calculations']:
             print("No calculation history found.")
             return
         
-        total = len(history)
-        operations = {'+': 0, '-': 0, '*': 0, '/': 0}
-        
-        for record in history:
-            expression = record[1]
-            for op in operations:
-                operations[op] += expression.count(op)
-        
-        print(f"Total Calculations: {total}")
+        operations = stats['operations']
+        oldest = stats['date_range']['oldest']
+        newest = stats['date_range']['newest']
+        print(f"Total Calculations: {stats['total_calculations']}")
         print(f"Addition (+): {operations['+']}")
         print(f"Subtraction (-): {operations['-']}")
         print(f"Multiplication (*): {operations['*']}")
         print(f"Division (/): {operations['/']}")
-        
-        if history:
-            oldest = min(record[3] for record in history)
-            newest = max(record[3] for record in history)
-            print(f"Date range: {oldest.strftime('%Y-%m-%d')} to {newest.strftime('%Y-%m-%d')}")
+        print(f"Date range: {oldest.strftime('%Y-%m-%d')} to {newest.strftime('%Y-%m-%d')}")
         
     except Exception as e:
         print(f"Error retrieving statistics: {e}")
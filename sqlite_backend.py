@@ -0,0 +1,740 @@
+"""
+SQLite Storage Backend
+======================
+
+Stores calculator history in an embedded SQLite database file, so the
+calculator runs without a database server. Suited to single-user GUI
+installs and to local test and benchmark runs.
+
+The database runs in WAL mode, so other processes such as the history
+viewers can read while the calculator writes. Writes are committed in
+batches: pending saves are committed once SQLITE_COMMIT_ROWS of them
+have built up, SQLITE_COMMIT_INTERVAL seconds after the first one, and
+at exit. Every CalculatorDB in a process shares one connection per
+database file, so reads in the same process always see their own saves.
+"""
+
+import atexit
+import math
+import sqlite3
+import threading
+from datetime import datetime
+
+from db_config import SQLITE_PATH
+from expression_interning import count_operators
+from idempotency import DUPLICATE, MISMATCH, SAVED
+from safe_eval import result_value
+from storage_backend import StorageBackend
+
+SQLITE_COMMIT_ROWS = 100
+SQLITE_COMMIT_INTERVAL = 0.5  # Seconds a save may wait to be committed
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS expressions (
+        id INTEGER PRIMARY KEY,
+        expression TEXT NOT NULL UNIQUE,
+        add_count INTEGER,
+        sub_count INTEGER,
+        mul_count INTEGER,
+        div_count INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS calculator_history (
+        id INTEGER PRIMARY KEY,
+        expression_id INTEGER NOT NULL,
+        result TEXT NOT NULL,
+        result_value REAL,
+        precision_mode TEXT NOT NULL DEFAULT 'float',
+        session_id TEXT,
+        created_at TIMESTAMP NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_calculator_history_created_at
+        ON calculator_history (created_at);
+    CREATE INDEX IF NOT EXISTS idx_calculator_history_session_id
+        ON calculator_history (session_id, created_at);
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        fingerprint TEXT,
+        calculation_id INTEGER,
+        created_at TIMESTAMP NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at
+        ON idempotency_keys (created_at);
+    CREATE TABLE IF NOT EXISTS calculator_sessions (
+        id INTEGER PRIMARY KEY,
+        session_id TEXT UNIQUE NOT NULL,
+        total_calculations INTEGER DEFAULT 0,
+        created_at TIMESTAMP,
+        last_used TIMESTAMP
+    );
+"""
+
+# Timestamps are stored as ISO 8601 text and read back as datetimes
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+
+class SQLiteStore:
+    """One connection to a database file, shared by the whole process"""
+
+    def __init__(self, path):
+        self.path = path
+        # Transactions are opened and committed explicitly to batch commits
+        self.conn = sqlite3.connect(
+            path,
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        # In WAL mode NORMAL only syncs at checkpoints and stays crash-safe
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self.pending = 0
+        self.timer = None
+
+    def begin(self):
+        """Open the write transaction if needed; the caller holds the lock"""
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN;")
+
+    def written(self, rows=1):
+        """Count pending writes and commit when the batch is full"""
+        self.pending += rows
+        if self.pending >= SQLITE_COMMIT_ROWS:
+            self.commit()
+        elif self.timer is None:
+            self.timer = threading.Timer(SQLITE_COMMIT_INTERVAL, self.commit)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def commit(self):
+        """Commit all pending writes"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.conn.in_transaction:
+                self.conn.execute("COMMIT;")
+            self.pending = 0
+
+    def close(self):
+        """Commit and close the connection"""
+        with self.lock:
+            self.commit()
+            self.conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path):
+    """Get the shared store for a database file, opening it if needed"""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SQLiteStore(path)
+        return store
+
+
+@atexit.register
+def close_stores():
+    """Commit pending writes of every open store"""
+    with _stores_lock:
+        for store in _stores.values():
+            try:
+                store.close()
+            except sqlite3.Error as e:
+                print(f"Error closing {store.path}: {e}")
+        _stores.clear()
+
+
+class SQLiteBackend(StorageBackend):
+    """Calculator history stored in an embedded SQLite file"""
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): Database file (default: SQLITE_PATH)
+        """
+        self.path = path or SQLITE_PATH
+        self.store = None
+        self.connect()
+
+    def connect(self):
+        """Open the shared connection to the database file"""
+        try:
+            self.store = get_store(self.path)
+            return True
+        except sqlite3.Error as e:
+            print(f"Database connection error: {e}")
+            return False
+
+    def disconnect(self):
+        """Release the shared connection; pending saves are still committed"""
+        self.store = None
+
+    def is_connected(self):
+        """Check whether the shared connection has been opened"""
+        return self.store is not None
+
+    def probe(self):
+        """
+        Run a trivial query on the shared connection
+
+        Returns:
+            bool: True if the database answered
+        """
+        if not self.store and not self.connect():
+            return False
+        try:
+            with self.store.lock:
+                self.store.conn.execute("SELECT 1;").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def pool_stats(self):
+        """
+        The shared connection and its batched, uncommitted writes
+
+        Returns:
+            dict: open, in_use and idle connection counts and pending_writes
+        """
+        if not self.store:
+            return {'open': 0, 'in_use': 0, 'idle': 0, 'pending_writes': 0}
+        in_use = int(self.store.conn.in_transaction)
+        return {'open': 1, 'in_use': in_use, 'idle': 1 - in_use,
+                'pending_writes': self.store.pending}
+
+    def save_calculation(self, expression, result, session_id=None, precision_mode='float'):
+        """
+        Save a calculation to the database
+
+        A statement that fails leaves the rest of the open batch intact,
+        so one bad save does not discard other pending saves.
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                self.store.begin()
+                conn = self.store.conn
+                conn.execute("""
+                    INSERT INTO expressions (expression, add_count, sub_count, mul_count, div_count)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (expression) DO NOTHING;
+                """, (expression, *count_operators(expression)))
+                expression_id = conn.execute(
+                    "SELECT id FROM expressions WHERE expression = ?;", (expression,)
+                ).fetchone()[0]
+                conn.execute("""
+                    INSERT INTO calculator_history
+                        (expression_id, result, result_value, precision_mode, session_id, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                """, (expression_id, str(result), result_value(result), precision_mode,
+                      session_id, datetime.now()))
+                self.store.written()
+            return True
+
+        except sqlite3.Error as e:
+            print(f"Error saving calculation: {e}")
+            return False
+
+    def save_calculations(self, records):
+        """
+        Save many calculations in one transaction
+
+        Args:
+            records (list): (expression, result, session_id, precision_mode,
+                            created_at) tuples
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                conn = self.store.conn
+                conn.execute("SAVEPOINT save_calculations;")
+                try:
+                    conn.executemany("""
+                        INSERT INTO expressions (expression, add_count, sub_count, mul_count, div_count)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (expression) DO NOTHING;
+                    """, [(expression, *count_operators(expression))
+                          for expression in {record[0] for record in records}])
+                    conn.executemany("""
+                        INSERT INTO calculator_history
+                            (expression_id, result, result_value, precision_mode, session_id, created_at)
+                        SELECT id, ?, ?, ?, ?, ?
+                        FROM expressions
+                        WHERE expression = ?;
+                    """, [(str(result), result_value(result), precision_mode, session_id,
+                           created_at, expression)
+                          for expression, result, session_id, precision_mode, created_at in records])
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK TO save_calculations;")
+                    conn.execute("RELEASE save_calculations;")
+                    raise
+                conn.execute("RELEASE save_calculations;")
+                self.store.commit()
+            return True
+
+        except sqlite3.Error as e:
+            print(f"Error saving calculations: {e}")
+            return False
+
+    def _insert_history(self, expression, result, session_id, precision_mode, created_at):
+        """Insert one history row; the caller holds the store lock"""
+        conn = self.store.conn
+        conn.execute("""
+            INSERT INTO expressions (expression, add_count, sub_count, mul_count, div_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (expression) DO NOTHING;
+        """, (expression, *count_operators(expression)))
+        return conn.execute("""
+            INSERT INTO calculator_history
+                (expression_id, result, result_value, precision_mode, session_id, created_at)
+            SELECT id, ?, ?, ?, ?, ?
+            FROM expressions
+            WHERE expression = ?;
+        """, (str(result), result_value(result), precision_mode, session_id,
+              created_at, expression)).lastrowid
+
+    def save_calculation_once(self, key, fingerprint, expression, result, session_id=None,
+                              precision_mode='float'):
+        """
+        Save a calculation unless its idempotency key has been used
+
+        Returns:
+            dict: status (SAVED, DUPLICATE or MISMATCH), and the result and
+                  session_id of the stored calculation; None on error
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                self.store.begin()
+                conn = self.store.conn
+                conn.execute("SAVEPOINT save_calculation_once;")
+                try:
+                    claimed = conn.execute("""
+                        INSERT INTO idempotency_keys (key, fingerprint, created_at)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT (key) DO NOTHING;
+                    """, (key, fingerprint, datetime.now())).rowcount
+                    if claimed:
+                        calculation_id = self._insert_history(
+                            expression, result, session_id, precision_mode, datetime.now())
+                        conn.execute("UPDATE idempotency_keys SET calculation_id = ? WHERE key = ?;",
+                                     (calculation_id, key))
+                        outcome = {'status': SAVED, 'result': result, 'session_id': session_id}
+                    else:
+                        stored_fingerprint, stored_result, stored_session_id = conn.execute("""
+                            SELECT k.fingerprint, h.result, h.session_id
+                            FROM idempotency_keys k
+                            LEFT JOIN calculator_history h ON h.id = k.calculation_id
+                            WHERE k.key = ?;
+                        """, (key,)).fetchone()
+                        status = DUPLICATE if stored_fingerprint in (None, fingerprint) else MISMATCH
+                        outcome = {'status': status, 'result': stored_result,
+                                   'session_id': stored_session_id}
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK TO save_calculation_once;")
+                    conn.execute("RELEASE save_calculation_once;")
+                    raise
+                conn.execute("RELEASE save_calculation_once;")
+                if claimed:
+                    self.store.written()
+            return outcome
+
+        except sqlite3.Error as e:
+            print(f"Error saving calculation: {e}")
+            return None
+
+    def save_calculations_once(self, records, keys):
+        """
+        Save many calculations in one transaction, skipping used keys
+
+        Returns:
+            list: True for each record saved, False for each skipped as a
+                  duplicate; None on error
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            saved = []
+            with self.store.lock:
+                conn = self.store.conn
+                conn.execute("SAVEPOINT save_calculations_once;")
+                try:
+                    for record, key in zip(records, keys):
+                        expression, result, session_id, precision_mode, created_at = record
+                        if key is not None and not conn.execute("""
+                            INSERT INTO idempotency_keys (key, created_at)
+                            VALUES (?, ?)
+                            ON CONFLICT (key) DO NOTHING;
+                        """, (key, datetime.now())).rowcount:
+                            saved.append(False)
+                            continue
+                        calculation_id = self._insert_history(
+                            expression, result, session_id, precision_mode, created_at)
+                        if key is not None:
+                            conn.execute("UPDATE idempotency_keys SET calculation_id = ? WHERE key = ?;",
+                                         (calculation_id, key))
+                        saved.append(True)
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK TO save_calculations_once;")
+                    conn.execute("RELEASE save_calculations_once;")
+                    raise
+                conn.execute("RELEASE save_calculations_once;")
+                self.store.commit()
+            return saved
+
+        except sqlite3.Error as e:
+            print(f"Error saving calculations: {e}")
+            return None
+
+    def purge_idempotency_keys(self, before):
+        """
+        Delete idempotency keys claimed before a time
+
+        Returns:
+            int: Number of keys deleted, or None on error
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                self.store.begin()
+                deleted = self.store.conn.execute(
+                    "DELETE FROM idempotency_keys WHERE created_at < ?;", (before,)
+                ).rowcount
+                self.store.commit()
+            return deleted
+
+        except sqlite3.Error as e:
+            print(f"Error purging idempotency keys: {e}")
+            return None
+
+    def get_calculation_history(self, limit=50):
+        """
+        Retrieve calculation history from database
+
+        Returns:
+            list: List of (id, expression, result, created_at) records
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                return self.store.conn.execute("""
+                    SELECT h.id, e.expression, h.result, h.created_at
+                    FROM calculator_history h
+                    JOIN expressions e ON e.id = h.expression_id
+                    ORDER BY h.created_at DESC, h.id DESC
+                    LIMIT ?;
+                """, (limit,)).fetchall()
+
+        except sqlite3.Error as e:
+            print(f"Error retrieving history: {e}")
+            return []
+
+    def iter_history(self, batch_size=2000, since=None, until=None, session_id=None):
+        """
+        Stream calculation history batch_size rows at a time
+
+        Each batch is a separate keyset query on (created_at, id), so the
+        shared connection is only locked while a batch is read.
+
+        Yields:
+            tuple: (id, expression, result, created_at, session_id, precision_mode)
+                   in creation order
+        """
+        if not self.store:
+            self.connect()
+
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append("h.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("h.created_at < ?")
+            params.append(until)
+        if session_id is not None:
+            conditions.append("h.session_id = ?")
+            params.append(session_id)
+
+        position = None
+        while True:
+            where = list(conditions)
+            batch_params = list(params)
+            if position is not None:
+                where.append("(h.created_at > ? OR (h.created_at = ? AND h.id > ?))")
+                batch_params += [position[0], position[0], position[1]]
+            where_sql = "WHERE " + " AND ".join(where) if where else ""
+
+            try:
+                with self.store.lock:
+                    rows = self.store.conn.execute(f"""
+                        SELECT h.id, e.expression, h.result, h.created_at,
+                               h.session_id, h.precision_mode
+                        FROM calculator_history h
+                        JOIN expressions e ON e.id = h.expression_id
+                        {where_sql}
+                        ORDER BY h.created_at, h.id
+                        LIMIT ?;
+                    """, batch_params + [batch_size]).fetchall()
+            except sqlite3.Error as e:
+                # Raise so a cut-short stream is not mistaken for the whole history
+                print(f"Error streaming history: {e}")
+                raise
+
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            position = (rows[-1][3], rows[-1][0])
+
+    def get_overall_stats(self):
+        """
+        Aggregate statistics over all calculation history
+
+        Returns:
+            dict: total_calculations, operations, date_range and results,
+                  or None on error
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                conn = self.store.conn
+                row = conn.execute("""
+                    SELECT COUNT(*),
+                           COALESCE(SUM(e.add_count), 0),
+                           COALESCE(SUM(e.sub_count), 0),
+                           COALESCE(SUM(e.mul_count), 0),
+                           COALESCE(SUM(e.div_count), 0),
+                           MIN(h.created_at) AS "oldest [TIMESTAMP]",
+                           MAX(h.created_at) AS "newest [TIMESTAMP]",
+                           COUNT(h.result_value),
+                           SUM(h.result_value),
+                           AVG(h.result_value),
+                           MIN(h.result_value),
+                           MAX(h.result_value)
+                    FROM calculator_history h
+                    JOIN expressions e ON e.id = h.expression_id;
+                """).fetchone()
+                median = self._percentile(conn, row[7], 0.5)
+                p95 = self._percentile(conn, row[7], 0.95)
+
+            return {
+                'total_calculations': row[0],
+                'operations': {'+': row[1], '-': row[2], '*': row[3], '/': row[4]},
+                'date_range': {'oldest': row[5], 'newest': row[6]} if row[0] else None,
+                'results': {
+                    'count': row[7],
+                    'sum': row[8],
+                    'avg': row[9],
+                    'min': row[10],
+                    'max': row[11],
+                    'median': median,
+                    'p95': p95,
+                }
+            }
+
+        except sqlite3.Error as e:
+            print(f"Error getting statistics: {e}")
+            return None
+
+    @staticmethod
+    def _percentile(conn, count, fraction):
+        """Interpolated percentile of result_value, like percentile_cont"""
+        if not count:
+            return None
+        position = fraction * (count - 1)
+        lower = math.floor(position)
+        values = [row[0] for row in conn.execute("""
+            SELECT result_value
+            FROM calculator_history
+            WHERE result_value IS NOT NULL
+            ORDER BY result_value
+            LIMIT 2 OFFSET ?;
+        """, (lower,))]
+        if len(values) == 1:
+            return values[0]
+        return values[0] + (values[1] - values[0]) * (position - lower)
+
+    def create_session(self, session_id):
+        """
+        Create a new calculator session
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                self.store.begin()
+                now = datetime.now()
+                self.store.conn.execute("""
+                    INSERT INTO calculator_sessions (session_id, created_at, last_used)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (session_id) DO NOTHING;
+                """, (session_id, now, now))
+                self.store.written()
+            return True
+
+        except sqlite3.Error as e:
+            print(f"Error creating session: {e}")
+            return False
+
+    def update_session(self, session_id, calculation_id=None):
+        """
+        Update session statistics
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        return self.apply_session_deltas({session_id: (1, datetime.now())})
+
+    def get_session_stats(self, session_id):
+        """
+        Get statistics for a session
+
+        Returns:
+            dict: Session statistics
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                result = self.store.conn.execute("""
+                    SELECT total_calculations, created_at, last_used
+                    FROM calculator_sessions
+                    WHERE session_id = ?;
+                """, (session_id,)).fetchone()
+
+            if result:
+                return {
+                    'total_calculations': result[0],
+                    'created_at': result[1],
+                    'last_used': result[2]
+                }
+            return None
+
+        except sqlite3.Error as e:
+            print(f"Error getting session stats: {e}")
+            return None
+
+    def apply_session_deltas(self, deltas):
+        """
+        Apply buffered session counter updates
+
+        Args:
+            deltas (dict): session_id -> (calculation count, last used time)
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                self.store.begin()
+                self.store.conn.executemany("""
+                    UPDATE calculator_sessions
+                    SET total_calculations = total_calculations + ?,
+                        last_used = MAX(COALESCE(last_used, ?), ?)
+                    WHERE session_id = ?;
+                """, [(count, last_used, last_used, session_id)
+                      for session_id, (count, last_used) in deltas.items()])
+                self.store.written(len(deltas))
+            return True
+
+        except sqlite3.Error as e:
+            print(f"Error updating sessions: {e}")
+            return False
+
+    def clear_history(self):
+        """
+        Clear all calculation history, committing at once
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                self.store.begin()
+                self.store.conn.execute("DELETE FROM calculator_history;")
+                self.store.commit()
+            return True
+
+        except sqlite3.Error as e:
+            print(f"Error clearing history: {e}")
+            return False
+
+    def purge_history(self, session_id=None, since=None, until=None):
+        """
+        Delete the calculations in a scope in one transaction
+
+        A local SQLite file holds little enough history that deleting it
+        synchronously is quick, so no background job is used.
+
+        Args:
+            session_id (str): Only delete this session's calculations
+            since (datetime): Only delete rows created at or after this time
+            until (datetime): Only delete rows created before this time
+
+        Returns:
+            int: Number of rows deleted, or None on error
+        """
+        conditions = []
+        params = []
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+        where_sql = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+        try:
+            if not self.store:
+                self.connect()
+
+            with self.store.lock:
+                self.store.begin()
+                deleted = self.store.conn.execute(
+                    f"DELETE FROM calculator_history {where_sql};", params
+                ).rowcount
+                self.store.commit()
+            return deleted
+
+        except sqlite3.Error as e:
+            print(f"Error purging history: {e}")
+            return None
@@ -18,6 +18,10 @@ const CalculatorWithDB = () => {
   // API base URL
   const API_BASE = 'http://localhost:5000/api';
 
+  // Save retries: attempts and first backoff delay in milliseconds
+  const SAVE_ATTEMPTS = 3;
+  const SAVE_RETRY_DELAY = 500;
+
   // Initialize session on component mount
   useEffect(() => {
     createSession();
@@ -59,26 +63,39 @@ const CalculatorWithDB = () => {
   };
 
   // Save calculation to database
+  // Every attempt sends the same Idempotency-Key, so a retry after a
+  // timeout or server error never saves the calculation twice
   const saveCalculation = async (expression, result) => {
-    try {
-      const response = await fetch(`${API_BASE}/calculate`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          expression,
-          result,
-          session_id: sessionId,
-        }),
-      });
-      const data = await response.json();
-      if (data.success) {
-        // Reload history to show new calculation
-        loadHistory();
+    const idempotencyKey = crypto.randomUUID();
+    for (let attempt = 0; attempt < SAVE_ATTEMPTS; attempt++) {
+      if (attempt > 0) {
+        await new Promise((resolve) => setTimeout(resolve, SAVE_RETRY_DELAY * 2 ** (attempt - 1)));
+      }
+      try {
+        const response = await fetch(`${API_BASE}/calculate`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey,
+          },
+          body: JSON.stringify({
+            expression,
+            result,
+            session_id: sessionId,
+          }),
+        });
+        if (response.status >= 500) {
+          continue;
+        }
+        const data = await response.json();
+        if (data.success) {
+          // Reload history to show new calculation
+          loadHistory();
+        }
+        return;
+      } catch (error) {
+        console.error('Error saving calculation:', error);
       }
-    } catch (error) {
-      console.error('Error saving calculation:', error);
     }
   };
 
@@ -4,8 +4,33 @@ Full-Stack Calculator Startup Script
 
 This script starts both the Flask backend API and React frontend
 for the complete calculator application with database integration.
+
+The API runs as several worker processes under a supervisor. The
+supervisor binds port 5000 once and every worker inherits the listening
+socket, so the kernel spreads connections across the workers. Each
+worker also serves on a private loopback control port, which the
+supervisor polls on /api/health:
+
+    - Startup waits only until every worker answers, not a fixed time.
+    - A worker that exits, or fails HEALTH_FAILURES probes in a row, is
+      restarted after an exponential backoff that resets once it has
+      stayed up for STABLE_SECONDS.
+    - SIGHUP does a rolling restart: each worker is replaced by a new
+      one that is ready before the old one is stopped, so capacity
+      never drops. A stopped worker stops accepting connections and
+      drains its requests in flight (app.DRAIN_TIMEOUT) before exiting.
+
+Shared sockets need POSIX; on Windows a single app.py is started as before.
+
+Usage:
+    python start_fullstack.py
+    python start_fullstack.py --api-only --workers 4
 """
 
+import argparse
+import http.client
+import signal
+import socket
 import subprocess
 import sys
 import time
@@ -14,8 +39,222 @@ import threading
 import webbrowser
 from pathlib import Path
 
+API_HOST = '0.0.0.0'
+API_PORT = 5000
+FRONTEND_URL = "http://localhost:3000"
+WORKERS = int(os.environ.get('CALCULATOR_WORKERS', '2'))
+
+READY_TIMEOUT = 30.0      # Seconds a new worker has to answer /api/health
+READY_POLL = 0.05         # Seconds between readiness probes
+HEALTH_INTERVAL = 2.0     # Seconds between liveness probes of running workers
+HEALTH_TIMEOUT = 2.0
+HEALTH_FAILURES = 3       # Failed probes in a row before a worker is restarted
+STOP_TIMEOUT = 10.0       # Seconds a worker has to drain and exit after SIGTERM
+RESTART_BACKOFF_BASE = 0.5
+RESTART_BACKOFF_MAX = 30.0
+STABLE_SECONDS = 30.0     # Uptime after which a worker's backoff resets
+
+def free_port():
+    """Find a free loopback port for a worker's control server"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def probe(port, timeout=HEALTH_TIMEOUT):
+    """
+    Check one worker's health endpoint
+    
+    Returns:
+        bool: True if /api/health answered 200
+    """
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('GET', '/api/health')
+        return conn.getresponse().status == 200
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        conn.close()
+
+class Worker:
+    """One API worker process and its restart state"""
+    
+    def __init__(self, slot):
+        self.slot = slot
+        self.process = None
+        self.control_port = None
+        self.started_at = 0.0
+        self.failed_probes = 0
+        self.crashes = 0          # Consecutive crashes, for the backoff
+        self.restart_at = None    # When a crashed worker may be restarted
+
+class Supervisor:
+    """Runs the API as worker processes sharing one listening socket"""
+    
+    def __init__(self, workers=WORKERS, host=API_HOST, port=API_PORT):
+        """
+        Args:
+            workers (int): Number of worker processes
+            host (str): Address the API listens on
+            port (int): Port the API listens on
+        """
+        self.workers = [Worker(slot) for slot in range(workers)]
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.rolling = threading.Event()
+        self.thread = None
+        self.restarts = 0
+    
+    def bind(self):
+        """Open the listening socket the workers inherit"""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(128)
+        self.socket.set_inheritable(True)
+    
+    def spawn(self, worker):
+        """Start a process for a worker slot"""
+        fd = self.socket.fileno()
+        worker.control_port = free_port()
+        env = dict(os.environ,
+                   CALCULATOR_SERVER_FD=str(fd),
+                   CALCULATOR_CONTROL_PORT=str(worker.control_port))
+        worker.process = subprocess.Popen([sys.executable, "app.py"], env=env, pass_fds=(fd,))
+        worker.started_at = time.monotonic()
+        worker.failed_probes = 0
+        worker.restart_at = None
+    
+    def wait_ready(self, worker, timeout=READY_TIMEOUT):
+        """
+        Poll a new worker until it answers /api/health
+        
+        Returns:
+            bool: True if ready; False if it exited or timed out
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self.stopped.is_set():
+            if worker.process.poll() is not None:
+                return False
+            if probe(worker.control_port, READY_POLL * 10):
+                return True
+            time.sleep(READY_POLL)
+        return False
+    
+    def start(self):
+        """
+        Start every worker and wait until they are all ready
+        
+        Returns:
+            bool: True if all workers became ready
+        """
+        self.bind()
+        started = time.monotonic()
+        # Workers import and connect in parallel
+        for worker in self.workers:
+            self.spawn(worker)
+        ready = all([self.wait_ready(worker) for worker in self.workers])
+        if ready:
+            print(f"✅ {len(self.workers)} API workers ready in {time.monotonic() - started:.2f}s "
+                  f"on http://localhost:{self.port}")
+        self.thread = threading.Thread(target=self.run, name="supervisor", daemon=True)
+        self.thread.start()
+        return ready
+    
+    def stop_process(self, process, terminate=True):
+        """Ask a worker process to exit, killing it if it does not"""
+        if process.poll() is None:
+            if terminate:
+                process.terminate()
+            try:
+                process.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    
+    def schedule_restart(self, worker, reason):
+        """Restart a worker after its backoff delay"""
+        if time.monotonic() - worker.started_at >= STABLE_SECONDS:
+            worker.crashes = 0
+        delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** worker.crashes)
+        worker.crashes += 1
+        worker.restart_at = time.monotonic() + delay
+        print(f"⚠️ API worker {worker.slot} (pid {worker.process.pid}) {reason}; "
+              f"restarting in {delay:.1f}s")
+    
+    def check(self, worker):
+        """Restart a worker that has exited or stopped answering"""
+        if worker.restart_at is not None:
+            if time.monotonic() >= worker.restart_at:
+                self.spawn(worker)
+                self.restarts += 1
+            return
+        
+        code = worker.process.poll()
+        if code is not None:
+            self.schedule_restart(worker, f"exited with code {code}")
+            return
+        
+        if probe(worker.control_port):
+            worker.failed_probes = 0
+            return
+        worker.failed_probes += 1
+        if worker.failed_probes >= HEALTH_FAILURES:
+            self.stop_process(worker.process)
+            self.schedule_restart(worker, "stopped answering health checks")
+    
+    def rolling_restart(self):
+        """Replace each worker with a new one that is ready before the old one drains and stops"""
+        print("🔄 Rolling restart of API workers...")
+        for worker in self.workers:
+            if self.stopped.is_set():
+                return
+            old = worker.process
+            self.spawn(worker)
+            if not self.wait_ready(worker):
+                # Keep the old worker serving; the new one is retried as a crash
+                print(f"❌ Replacement for API worker {worker.slot} did not become ready")
+                self.stop_process(worker.process)
+                worker.process = old
+                continue
+            self.stop_process(old)
+        print("✅ Rolling restart finished")
+    
+    def run(self):
+        """Supervise the workers until stopped"""
+        while not self.stopped.wait(HEALTH_INTERVAL):
+            with self.lock:
+                if self.rolling.is_set():
+                    self.rolling.clear()
+                    self.rolling_restart()
+                    continue
+                for worker in self.workers:
+                    self.check(worker)
+    
+    def request_rolling_restart(self, signum=None, frame=None):
+        """Ask the supervisor thread for a rolling restart (SIGHUP handler)"""
+        self.rolling.set()
+    
+    def stop(self):
+        """Stop supervising and shut every worker down"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        # Signal every worker first so they shut down in parallel
+        for worker in self.workers:
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                self.stop_process(worker.process, terminate=False)
+        if self.socket is not None:
+            self.socket.close()
+
 def start_flask_server():
-    """Start the Flask backend server"""
+    """Start the Flask backend server as a single process"""
     print("🚀 Starting Flask Backend Server...")
     try:
         # Start Flask app
@@ -41,7 +280,7 @@ def start_react_app():
     except KeyboardInterrupt:
         print("🛑 React app stopped")
 
-def check_dependencies():
+def check_dependencies(node=True):
     """Check if all required dependencies are installed"""
     print("🔍 Checking dependencies...")
     
@@ -50,12 +289,16 @@ def check_dependencies():
         import flask
         import flask_cors
         import psycopg2
+        import numpy
         print("✅ Python dependencies OK")
     except ImportError as e:
         print(f"❌ Missing Python dependency: {e}")
-        print("Run: pip install flask flask-cors psycopg2-binary")
+        print("Run: pip install flask flask-cors psycopg2-binary numpy")
         return False
     
+    if not node:
+        return True
+    
     # Check Node.js
     try:
         result = subprocess.run(["node", "--version"], capture_output=True, text=True)
@@ -82,8 +325,53 @@ def check_dependencies():
     
     return True
 
-def main():
+def wait_for_url(url, timeout=120.0):
+    """
+    Poll a URL until it answers
+    
+    Returns:
+        bool: True if it answered before the timeout
+    """
+    host, _, port = url.split("//", 1)[1].partition(":")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, int(port or 80)), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def start_api(workers):
+    """
+    Start the API and wait until it is ready
+    
+    Returns:
+        Supervisor: The running supervisor, or None on Windows
+    """
+    if os.name == 'nt':
+        # No shared listening sockets: run one server as before
+        flask_thread = threading.Thread(target=start_flask_server, daemon=True)
+        flask_thread.start()
+        print("⏳ Waiting for Flask server to start...")
+        wait_for_url(f"http://localhost:{API_PORT}", READY_TIMEOUT)
+        return None
+    
+    print(f"🚀 Starting {workers} Flask API workers...")
+    supervisor = Supervisor(workers)
+    if not supervisor.start():
+        print("❌ API workers did not become ready; they will keep being restarted")
+    signal.signal(signal.SIGHUP, supervisor.request_rolling_restart)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    return supervisor
+
+def main(argv=None):
     """Main function to start the full-stack application"""
+    parser = argparse.ArgumentParser(description="Start the calculator API and frontend")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="API worker processes")
+    parser.add_argument('--api-only', action='store_true', help="Run only the supervised API")
+    args = parser.parse_args(argv)
+    
     print("=" * 60)
     print("🧮 FULL-STACK CALCULATOR APPLICATION")
     print("=" * 60)
@@ -91,35 +379,36 @@ def main():
     print()
     
     # Check dependencies
-    if not check_dependencies():
+    if not check_dependencies(node=not args.api_only):
         print("❌ Missing dependencies. Please install them first.")
         return
     
     print("✅ All dependencies found!")
     print()
     
-    # Start Flask server in a separate thread
-    flask_thread = threading.Thread(target=start_flask_server, daemon=True)
-    flask_thread.start()
-    
-    # Wait a moment for Flask to start
-    print("⏳ Waiting for Flask server to start...")
-    time.sleep(3)
-    
-    # Open browser after a delay
-    def open_browser():
-        time.sleep(5)  # Wait for React to start
-        print("🌐 Opening browser...")
-        webbrowser.open("http://localhost:3000")
+    supervisor = start_api(args.workers)
     
-    browser_thread = threading.Thread(target=open_browser, daemon=True)
-    browser_thread.start()
-    
-    # Start React app (this will block)
     try:
+        if args.api_only:
+            print("Send SIGHUP for a rolling restart, Ctrl+C to stop")
+            threading.Event().wait()
+        
+        # Open the browser as soon as the frontend answers
+        def open_browser():
+            if wait_for_url(FRONTEND_URL):
+                print("🌐 Opening browser...")
+                webbrowser.open(FRONTEND_URL)
+        
+        browser_thread = threading.Thread(target=open_browser, daemon=True)
+        browser_thread.start()
+        
+        # Start React app (this will block)
         start_react_app()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, SystemExit):
         print("\n🛑 Shutting down full-stack application...")
+    finally:
+        if supervisor is not None:
+            supervisor.stop()
         print("✅ Application stopped")
 
 if __name__ == "__main__":
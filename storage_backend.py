@@ -0,0 +1,172 @@
+"""
+Storage Backends for Calculator History
+=======================================
+
+CalculatorDB and the database_helper functions store history through a
+storage backend. Two backends are available:
+
+    postgres  PostgreSQL via psycopg2 (the default, used by the API server)
+    sqlite    An embedded SQLite file, for single-user GUI installs and as
+              a local stand-in for tests and benchmarks
+
+The backend is chosen with STORAGE_BACKEND in db_config.py or the
+CALCULATOR_STORAGE environment variable. Backend modules are imported
+only when selected, so the SQLite backend does not need psycopg2.
+"""
+
+import importlib
+
+from db_config import STORAGE_BACKEND
+
+BACKENDS = {
+    'postgres': ('postgres_backend', 'PostgresBackend'),
+    'sqlite': ('sqlite_backend', 'SQLiteBackend'),
+}
+
+
+class StorageBackend:
+    """
+    Operations every storage backend provides
+
+    Methods report failures the way CalculatorDB always has: they print
+    the error and return False, None or an empty result.
+    """
+
+    # Whether history purges run as purge_jobs.PurgeJob background jobs;
+    # other backends delete synchronously with purge_history
+    supports_purge_jobs = False
+
+    def connect(self):
+        """Open the connection; returns True if successful"""
+        raise NotImplementedError
+
+    def disconnect(self):
+        """Release the connection"""
+        raise NotImplementedError
+
+    def is_connected(self):
+        """Check whether the backend currently holds a usable connection"""
+        raise NotImplementedError
+
+    def save_calculation(self, expression, result, session_id=None, precision_mode='float'):
+        """Store one calculation; returns True if successful"""
+        raise NotImplementedError
+
+    def save_calculations(self, records):
+        """
+        Store many calculations in one transaction
+
+        Args:
+            records (list): (expression, result, session_id, precision_mode,
+                            created_at) tuples
+
+        Returns:
+            bool: True if every record was stored, False if none were
+        """
+        raise NotImplementedError
+
+    def save_calculation_once(self, key, fingerprint, expression, result, session_id=None,
+                              precision_mode='float'):
+        """
+        Save a calculation unless its idempotency key has been used;
+        returns a dict with status 'saved', 'duplicate' or 'mismatch'
+        and the stored result and session_id, or None on error
+        """
+        raise NotImplementedError
+
+    def save_calculations_once(self, records, keys):
+        """
+        Save many calculations, skipping records whose key has been used;
+        returns a list with True for each record saved, or None on error
+        """
+        raise NotImplementedError
+
+    def purge_idempotency_keys(self, before):
+        """Delete keys claimed before a time; returns the number deleted"""
+        raise NotImplementedError
+
+    def get_calculation_history(self, limit=50):
+        """Newest calculations as (id, expression, result, created_at) tuples"""
+        raise NotImplementedError
+
+    def iter_history(self, batch_size=2000, since=None, until=None, session_id=None):
+        """
+        Yield (id, expression, result, created_at, session_id, precision_mode)
+        tuples in creation order, batch_size rows at a time; raises the
+        backend's error if the stream fails part way
+        """
+        raise NotImplementedError
+
+    def get_overall_stats(self):
+        """Aggregate statistics as returned by database_helper.get_stats"""
+        raise NotImplementedError
+
+    def create_session(self, session_id):
+        """Create a session if it does not exist; returns True if successful"""
+        raise NotImplementedError
+
+    def update_session(self, session_id, calculation_id=None):
+        """Count one calculation for a session; returns True if successful"""
+        raise NotImplementedError
+
+    def get_session_stats(self, session_id):
+        """Stored session counters as a dict, or None if not found"""
+        raise NotImplementedError
+
+    def apply_session_deltas(self, deltas):
+        """Apply buffered session_id -> (count, last_used) updates"""
+        raise NotImplementedError
+
+    def connection_stats(self):
+        """Connection health metrics, such as circuit breaker state"""
+        return {}
+
+    def query_stats(self, limit=20, order='total_ms'):
+        """Most expensive query shapes and recent slow queries"""
+        return {}
+
+    def probe(self):
+        """Run a trivial query; returns True if the database answered"""
+        raise NotImplementedError
+
+    def pool_stats(self):
+        """Connections open and in use, and writes waiting to be committed"""
+        return {}
+
+    def maintain_partitions(self, months_ahead=3):
+        """Create upcoming history partitions; returns their names"""
+        return []
+
+    def clear_history(self):
+        """Delete all calculation history; returns True if successful"""
+        raise NotImplementedError
+
+    def purge_history(self, session_id=None, since=None, until=None):
+        """
+        Delete the history in a scope right away
+
+        Returns:
+            int: Number of rows deleted, or None on error
+        """
+        raise NotImplementedError
+
+
+def create_backend(name=None):
+    """
+    Create a storage backend
+
+    Args:
+        name (str): Backend name (default: STORAGE_BACKEND)
+
+    Returns:
+        StorageBackend: A connected backend
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    name = name or STORAGE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name} (choose from {', '.join(BACKENDS)})")
+    module_name, class_name = BACKENDS[name]
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
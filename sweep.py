@@ -0,0 +1,163 @@
+"""
+Parametric Sweep Evaluation
+===========================
+
+Evaluate one expression over a grid of variable values with NumPy.
+
+The expression is parsed and checked once by safe_eval, then the same
+syntax tree is evaluated on whole arrays of variable values, one chunk
+of the grid at a time. Results are produced chunk by chunk so callers
+can stream them without holding the full grid in memory.
+"""
+
+import math
+
+import numpy as np
+
+from safe_eval import parse_expression, estimate_cost, evaluate_tree, EvaluationError
+
+MAX_GRID_SIZE = 10_000_000
+MAX_AXIS_SIZE = 1_000_000
+DEFAULT_CHUNK_SIZE = 10_000
+MAX_CHUNK_SIZE = 100_000     # Larger chunks would buffer most of a grid at once
+
+
+def build_axis(name, spec):
+    """
+    Build the values of one variable
+
+    Args:
+        name (str): Variable name
+        spec: A list of values, or a dict with start/stop and either
+              step (like range) or num (evenly spaced, stop included)
+
+    Returns:
+        numpy.ndarray: The values as float64
+    """
+    if isinstance(spec, list):
+        values = np.asarray(spec, dtype=np.float64)
+    elif isinstance(spec, dict) and 'start' in spec and 'stop' in spec:
+        start, stop = float(spec['start']), float(spec['stop'])
+        if 'num' in spec:
+            num = int(spec['num'])
+            if num < 1 or num > MAX_AXIS_SIZE:
+                raise EvaluationError(f"Too many values for {name}")
+            values = np.linspace(start, stop, num)
+        else:
+            step = float(spec.get('step', 1))
+            if step == 0 or (stop - start) / step > MAX_AXIS_SIZE:
+                raise EvaluationError(f"Invalid step for {name}")
+            values = np.arange(start, stop, step, dtype=np.float64)
+    else:
+        raise EvaluationError(f"Invalid range for {name}")
+
+    if values.ndim != 1 or values.size == 0:
+        raise EvaluationError(f"No values for {name}")
+    return values
+
+
+class Sweep:
+    """An expression compiled once and evaluated over a variable grid"""
+
+    def __init__(self, expression, variables):
+        """
+        Args:
+            expression (str): Expression using the variable names
+            variables (dict): Variable name -> list or range spec
+        """
+        if not variables:
+            raise EvaluationError("No variables given")
+
+        self.expression = expression
+        self.names = list(variables)
+        for name in self.names:
+            if not name.isidentifier():
+                raise EvaluationError(f"Invalid variable name: {name}")
+
+        self.tree = parse_expression(expression, variables=self.names)
+        estimate_cost(self.tree)
+
+        self.axes = [build_axis(name, variables[name]) for name in self.names]
+        self.shape = tuple(axis.size for axis in self.axes)
+        self.size = math.prod(self.shape)
+        if self.size > MAX_GRID_SIZE:
+            raise EvaluationError(f"Grid has {self.size} points, limit is {MAX_GRID_SIZE}")
+
+        # Evaluate one point so errors surface before any results are sent
+        try:
+            self.evaluate_chunk(0, 1)
+        except ZeroDivisionError:
+            raise EvaluationError("Cannot divide by zero")
+        except OverflowError:
+            raise EvaluationError("Result is too large")
+
+    def evaluate_chunk(self, start, stop):
+        """
+        Evaluate grid points start..stop-1 in row-major order
+
+        Returns:
+            tuple: (dict of variable arrays, result array)
+        """
+        indices = np.unravel_index(np.arange(start, stop), self.shape)
+        values = {name: axis[index] for name, axis, index in zip(self.names, self.axes, indices)}
+        with np.errstate(all='ignore'):
+            result = evaluate_tree(self.tree, values)
+        # Expressions without variables in them evaluate to a scalar
+        result = np.broadcast_to(np.asarray(result, dtype=np.float64), (stop - start,))
+        return values, result
+
+    def chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yield (offset, variables, results) for each chunk of the grid
+
+        chunk_size is clamped to MAX_CHUNK_SIZE and the grid size.
+        """
+        chunk_size = max(1, min(chunk_size, MAX_CHUNK_SIZE, self.size))
+        for start in range(0, self.size, chunk_size):
+            stop = min(start + chunk_size, self.size)
+            values, result = self.evaluate_chunk(start, stop)
+            yield start, values, result
+
+
+class SweepSummary:
+    """Running count, min, max and mean of the finite results of a sweep"""
+
+    def __init__(self):
+        self.count = 0
+        self.invalid = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, result):
+        finite = result[np.isfinite(result)]
+        self.invalid += result.size - finite.size
+        if finite.size:
+            self.count += finite.size
+            self.total += float(finite.sum())
+            self.minimum = min(self.minimum, float(finite.min()))
+            self.maximum = max(self.maximum, float(finite.max()))
+
+    def as_dict(self):
+        if not self.count:
+            return {'count': 0, 'invalid': self.invalid, 'min': None, 'max': None, 'mean': None}
+        return {
+            'count': self.count,
+            'invalid': self.invalid,
+            'min': self.minimum,
+            'max': self.maximum,
+            'mean': self.total / self.count,
+        }
+
+    def as_result_text(self):
+        """Short summary that fits the calculator_history result column"""
+        stats = self.as_dict()
+        if not self.count:
+            return f"sweep n=0 invalid={self.invalid}"
+        return (f"sweep n={stats['count']} min={stats['min']:.6g} "
+                f"max={stats['max']:.6g} mean={stats['mean']:.6g}")
+
+
+def to_json_list(array):
+    """Convert an array to a list with NaN and infinity replaced by None"""
+    return [value if math.isfinite(value) else None for value in array.tolist()]
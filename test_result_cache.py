@@ -0,0 +1,40 @@
+"""
+Test the Shared Result Cache
+============================
+
+Checks that expressions which evaluate differently never share a cache
+key. Runs with pytest or as a script.
+"""
+
+import os
+import tempfile
+
+from result_cache import SharedResultCache, canonicalize, cached_evaluate
+
+def test_float_literal_keeps_its_own_key():
+    """A float literal promotes the expression, so it must change the key"""
+    for mode in ('decimal', 'fraction'):
+        assert canonicalize('10**30+1', mode) != canonicalize('10**30+1.0', mode)
+        assert canonicalize('1.0', mode) != canonicalize('1', mode)
+        # Spelling variants of one float value still share a key
+        assert canonicalize('2.50+1', mode) == canonicalize('1+2.5', mode)
+
+def test_cached_results_match_evaluation():
+    """Cached results for int and float variants are not mixed up"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SharedResultCache(os.path.join(directory, 'cache.bin'), buckets=16, ways=2)
+        try:
+            for mode in ('decimal', 'fraction'):
+                exact = cached_evaluate(cache, '10**30+1', mode)
+                promoted = cached_evaluate(cache, '10**30+1.0', mode)
+                assert cached_evaluate(cache, '10**30+1', mode) == exact
+                assert cached_evaluate(cache, '10**30+1.0', mode) == promoted
+        finally:
+            cache.close()
+
+if __name__ == "__main__":
+    print("Result Cache Test")
+    print("=" * 30)
+    test_float_literal_keeps_its_own_key()
+    test_cached_results_match_evaluation()
+    print("All result cache tests passed!")
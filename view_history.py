@@ -5,7 +5,7 @@ View Calculation History from Database
 Simple script to view and manage calculation history stored in PostgreSQL.
 """
 
-from database_helper import get_history, clear_history
+from database_helper import get_history, clear_history, get_stats
 from datetime import datetime
 
 def display_history(limit=20):
@@ -72,32 +72,33 @@ def show_statistics():
     print("=" * 60)
     
     try:
-        history = get_history(limit=1000)  # Get more records for stats
+        # Aggregated in SQL instead of scanning every record
+        stats = get_stats()
+        if stats is None:
+            print("Failed to get statistics.")
+            return
         
-        if not history:
+        if not stats['total_calculations']:
             print("No calculation history found.")
             return
         
-        total_calculations = len(history)
-        
-        # Count operations
-        operations = {'+': 0, '-': 0, '*': 0, '/': 0}
-        for record in history:
-            expression = record[1]
-            for op in operations:
-                operations[op] += expression.count(op)
-        
-        print(f"Total Calculations: {total_calculations}")
+        operations = stats['operations']
+        print(f"Total Calculations: {stats['total_calculations']}")
         print(f"Addition operations: {operations['+']}")
         print(f"Subtraction operations: {operations['-']}")
         print(f"Multiplication operations: {operations['*']}")
         print(f"Division operations: {operations['/']}")
         
+        results = stats['results']
+        if results['count']:
+            print(f"Numeric results: {results['count']}")
+            print(f"Average result: {results['avg']:g}")
+            print(f"Median result: {results['median']:g}")
+        
         # Show date range
-        if history:
-            oldest = min(record[3] for record in history)
-            newest = max(record[3] for record in history)
-            print(f"Date range: {oldest.strftime('%Y-%m-%d')} to {newest.strftime('%Y-%m-%d')}")
+        oldest = stats['date_range']['oldest']
+        newest = stats['date_range']['newest']
+        print(f"Date range: {oldest.strftime('%Y-%m-%d')} to {newest.strftime('%Y-%m-%d')}")
         
     except Exception as e:
         print(f"Error retrieving statistics: {e}")
@@ -0,0 +1,280 @@
+"""
+Synthetic Workload Generator
+============================
+
+Fills calculator_history, expressions and calculator_sessions with
+millions of realistic rows for benchmarking, query-plan work and
+capacity planning.
+
+The workload is shaped by:
+    - expression length (operands per expression) and operator mix
+    - Zipfian repetition: a few expressions are very common, most rare
+    - the number of sessions, whose activity is also Zipf-distributed
+    - the time span the calculations are spread over
+
+Rows are generated in batches with numpy and streamed into the
+database with COPY, so no intermediate file is written.
+
+Usage:
+    python workload_generator.py --rows 5000000 --sessions 20000 --days 365
+    python workload_generator.py --rows 100000 --operators "+=50,*=30,/=20" --zipf 1.2
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import psycopg2
+from db_config import DB_CONFIG
+from expression_interning import count_operators
+from history_admin import IterStream
+from history_partitions import ensure_partitions
+from safe_eval import EvaluationError, MAX_EXPRESSION_LENGTH, evaluate, format_result, result_value
+
+DEFAULT_OPERATORS = {'+': 40, '-': 25, '*': 20, '/': 15}
+BATCH_ROWS = 100000
+
+
+def parse_weights(text):
+    """Parse '+=40,-=25' into an operator -> weight mapping"""
+    weights = {}
+    for part in text.split(','):
+        operator, _, weight = part.strip().rpartition('=')
+        if operator not in DEFAULT_OPERATORS:
+            raise argparse.ArgumentTypeError(f"Unknown operator: {operator}")
+        weights[operator] = float(weight)
+    return weights
+
+
+def zipf_cdf(count, exponent):
+    """Cumulative Zipf probabilities for ranks 1..count"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def random_operand(rng):
+    """A number as people type them: mostly small integers, some decimals"""
+    roll = rng.random()
+    if roll < 0.7:
+        return str(rng.randint(0, 999))
+    if roll < 0.9:
+        return f"{rng.uniform(0, 1000):.2f}"
+    return str(rng.randint(1000, 1000000))
+
+
+def random_expression(rng, min_terms, max_terms, operators, weights):
+    """Build one expression with min_terms to max_terms operands"""
+    terms = rng.randint(min_terms, max_terms)
+    parts = [random_operand(rng)]
+    for _ in range(terms - 1):
+        parts.append(rng.choices(operators, weights)[0])
+        parts.append(random_operand(rng))
+    # Occasionally group the first two operands
+    if terms > 2 and rng.random() < 0.2:
+        parts[0] = "(" + parts[0]
+        parts[2] = parts[2] + ")"
+    return " ".join(parts)[:MAX_EXPRESSION_LENGTH]
+
+
+def build_vocabulary(count, min_terms, max_terms, operator_weights, seed):
+    """
+    Generate distinct expressions with their results
+
+    Returns:
+        list: (expression, result, result_value, operator counts) tuples
+    """
+    rng = random.Random(seed)
+    operators = list(operator_weights)
+    weights = [operator_weights[operator] for operator in operators]
+    seen = set()
+    vocabulary = []
+    attempts = 0
+    while len(vocabulary) < count and attempts < count * 10:
+        attempts += 1
+        expression = random_expression(rng, min_terms, max_terms, operators, weights)
+        if expression in seen:
+            continue
+        seen.add(expression)
+        try:
+            result = str(format_result(evaluate(expression, isolate=False)))
+        except (ZeroDivisionError, EvaluationError):
+            result = "Error"
+        vocabulary.append((expression, result, result_value(result), count_operators(expression)))
+    return vocabulary
+
+
+def load_expressions(cur, vocabulary):
+    """
+    Intern the vocabulary and look up the id of every expression
+
+    Returns:
+        list: expressions.id for each vocabulary entry, in order
+    """
+    cur.execute("""
+        CREATE TEMP TABLE workload_expressions (
+            position INTEGER, expression VARCHAR(255),
+            add_count SMALLINT, sub_count SMALLINT, mul_count SMALLINT, div_count SMALLINT
+        ) ON COMMIT DROP;
+    """)
+    buffer = io.StringIO()
+    for position, (expression, _, _, counts) in enumerate(vocabulary):
+        buffer.write(f"{position}\t{expression}\t" + "\t".join(map(str, counts)) + "\n")
+    buffer.seek(0)
+    cur.copy_expert("COPY workload_expressions FROM STDIN", buffer)
+
+    cur.execute("""
+        INSERT INTO expressions (expression, add_count, sub_count, mul_count, div_count)
+        SELECT expression, add_count, sub_count, mul_count, div_count
+        FROM workload_expressions
+        ON CONFLICT (expression) DO NOTHING;
+    """)
+    cur.execute("""
+        SELECT w.position, e.id
+        FROM workload_expressions w
+        JOIN expressions e ON e.expression = w.expression
+        ORDER BY w.position;
+    """)
+    return [expression_id for _, expression_id in cur.fetchall()]
+
+
+class WorkloadGenerator:
+    """Generates history rows and the matching session rows"""
+
+    def __init__(self, vocabulary, expression_ids, sessions, rows, days,
+                 zipf_exponent, session_exponent, seed):
+        self.rows = rows
+        self.rng = np.random.default_rng(seed)
+        self.end = time.time()
+        self.start = self.end - days * 86400
+
+        # Text of each history row up to session_id, per expression
+        self.prefixes = [
+            f"{expression_id},{result},{'' if value is None else repr(value)},float,"
+            for expression_id, (_, result, value, _) in zip(expression_ids, vocabulary)
+        ]
+        # Popular expressions are spread randomly over the vocabulary
+        self.expression_cdf = zipf_cdf(len(vocabulary), zipf_exponent)
+        self.expression_order = self.rng.permutation(len(vocabulary))
+
+        self.session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+        self.session_cdf = zipf_cdf(sessions, session_exponent)
+        self.session_counts = np.zeros(sessions, dtype=np.int64)
+        self.session_first = np.full(sessions, np.inf)
+        self.session_last = np.full(sessions, -np.inf)
+
+    def history_batches(self):
+        """Yield calculator_history rows as CSV bytes, BATCH_ROWS at a time"""
+        remaining = self.rows
+        while remaining:
+            size = min(BATCH_ROWS, remaining)
+            remaining -= size
+
+            expressions = self.expression_order[
+                np.searchsorted(self.expression_cdf, self.rng.random(size))]
+            sessions = np.searchsorted(self.session_cdf, self.rng.random(size))
+            timestamps = self.rng.uniform(self.start, self.end, size)
+
+            np.add.at(self.session_counts, sessions, 1)
+            np.minimum.at(self.session_first, sessions, timestamps)
+            np.maximum.at(self.session_last, sessions, timestamps)
+
+            lines = [
+                f"{self.prefixes[e]}{self.session_ids[s]},{datetime.fromtimestamp(t).isoformat(' ')}\n"
+                for e, s, t in zip(expressions.tolist(), sessions.tolist(), timestamps.tolist())
+            ]
+            yield "".join(lines).encode('utf-8')
+
+    def session_rows(self):
+        """calculator_sessions rows as CSV text for sessions with activity"""
+        buffer = io.StringIO()
+        for index, session_id in enumerate(self.session_ids):
+            count = int(self.session_counts[index])
+            if not count:
+                continue
+            first = datetime.fromtimestamp(self.session_first[index]).isoformat(' ')
+            last = datetime.fromtimestamp(self.session_last[index]).isoformat(' ')
+            buffer.write(f"{session_id},{count},{first},{last}\n")
+        buffer.seek(0)
+        return buffer
+
+
+def main(argv=None):
+    """Generate and load a synthetic workload"""
+    parser = argparse.ArgumentParser(description="Load a synthetic calculator workload")
+    parser.add_argument('--rows', type=int, default=1000000, help="History rows to create")
+    parser.add_argument('--distinct', type=int, default=50000, help="Distinct expressions")
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--days', type=float, default=180, help="Time span of the history")
+    parser.add_argument('--min-terms', type=int, default=2, help="Fewest operands per expression")
+    parser.add_argument('--max-terms', type=int, default=5, help="Most operands per expression")
+    parser.add_argument('--operators', type=parse_weights, default=DEFAULT_OPERATORS,
+                        help="Operator weights, e.g. '+=40,-=25,*=20,/=15'")
+    parser.add_argument('--zipf', type=float, default=1.1,
+                        help="Zipf exponent of expression repetition")
+    parser.add_argument('--session-zipf', type=float, default=0.8,
+                        help="Zipf exponent of session activity")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if not 1 <= args.min_terms <= args.max_terms:
+        parser.error("--min-terms must be at least 1 and no more than --max-terms")
+
+    started = time.perf_counter()
+    print(f"Generating {args.distinct} distinct expressions...")
+    vocabulary = build_vocabulary(args.distinct, args.min_terms, args.max_terms,
+                                  args.operators, args.seed)
+
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        cur = conn.cursor()
+
+        # Partitions for the whole span, so rows do not pile up in the default partition
+        first_day = date.today() - timedelta(days=args.days)
+        ensure_partitions(cur, start=first_day)
+
+        expression_ids = load_expressions(cur, vocabulary)
+        generator = WorkloadGenerator(vocabulary, expression_ids, args.sessions, args.rows,
+                                      args.days, args.zipf, args.session_zipf, args.seed)
+
+        print(f"Loading {args.rows} history rows...")
+        load_started = time.perf_counter()
+        stream = io.BufferedReader(IterStream(generator.history_batches()), buffer_size=1 << 20)
+        cur.copy_expert("""
+            COPY calculator_history (expression_id, result, result_value, precision_mode,
+                                     session_id, created_at)
+            FROM STDIN WITH (FORMAT csv)
+        """, stream)
+        load_seconds = time.perf_counter() - load_started
+
+        cur.copy_expert("""
+            COPY calculator_sessions (session_id, total_calculations, created_at, last_used)
+            FROM STDIN WITH (FORMAT csv)
+        """, generator.session_rows())
+        sessions = cur.rowcount
+
+        conn.commit()
+        # Fresh statistics so query plans reflect the new data
+        conn.autocommit = True
+        cur.execute("ANALYZE expressions, calculator_history, calculator_sessions;")
+        cur.close()
+        conn.close()
+
+    except psycopg2.Error as e:
+        print(f"Error loading workload: {e}")
+        return 1
+
+    print(f"Loaded {args.rows} history rows in {load_seconds:.1f}s "
+          f"({args.rows / load_seconds:,.0f} rows/s), {len(vocabulary)} expressions, "
+          f"{sessions} sessions")
+    print(f"Total time {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())